@@ -0,0 +1,39 @@
+from controllers.batch_controller import BatchAnalyzer, ANALYSIS_FIELDS, PARAMETER_FIELDS
+from entities.analysis_mode import AnalysisMode
+from entities.user import User
+from config import config
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+def parse_args() -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description='Пакетный анализ постов из CSV или JSONL')
+	parser.add_argument('input', help='файл с постами: CSV с заголовком или JSONL; поля id, ' + ', '.join(ANALYSIS_FIELDS))
+	parser.add_argument('-o', '--output', required=True, help='JSONL с результатами; при повторном запуске готовые посты пропускаются')
+	parser.add_argument('--model', default=User.model_name, help='модель анализа')
+	parser.add_argument('--mode', choices=[mode.value for mode in AnalysisMode], default=AnalysisMode.MULTIPLE.value, help='способ анализа')
+	parser.add_argument('--concurrency', type=int, default=4, help='число одновременно анализируемых постов')
+	parser.add_argument('--no-cache', action='store_true', help='не использовать кэш результатов анализа')
+	for name in PARAMETER_FIELDS:
+		parser.add_argument(f'--{name.replace("_", "-")}', help='значение поля для постов, где оно не заполнено')
+	return parser.parse_args()
+
+async def main() -> int:
+	args = parse_args()
+	analyzer = BatchAnalyzer(
+		config,
+		args.model,
+		analysis_mode=AnalysisMode(args.mode),
+		concurrency=args.concurrency,
+		use_cache=not args.no_cache
+	)
+	defaults = {name: getattr(args, name) for name in PARAMETER_FIELDS if getattr(args, name)}
+	stats = await analyzer.run(args.input, args.output, defaults)
+	print(json.dumps(stats, ensure_ascii=False, indent=2))
+	return 1 if stats['failed'] else 0
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+	sys.exit(asyncio.run(main()))
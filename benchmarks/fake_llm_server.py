@@ -0,0 +1,225 @@
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from models.prompt_templates import PromptTemplates
+
+
+@dataclass
+class LatencyProfile:
+    """Логнормальное распределение задержки ответа модели."""
+    median: float = 0.3
+    sigma: float = 0.5
+    # Пауза между частями потокового ответа, сек
+    chunk_interval: float = 0.02
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+class FakeLLMServer:
+    """Локальный HTTP сервер, отвечающий по протоколам OpenAI chat completions и Gemini generateContent.
+
+    Ответы содержат заголовки всех разделов анализа, поэтому проходят разбор в обоих режимах анализа.
+    """
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 latency: LatencyProfile = None,
+                 error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 seed: int = 0):
+        """Инициализация сервера; port=0 выбирает свободный порт."""
+        self.host = host
+        self.port = port
+        self.latency = latency or LatencyProfile()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.requests: Counter = Counter()
+        self.prompts: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def urls(self) -> Dict[str, str]:
+        """Получить адреса API провайдеров, указывающие на этот сервер."""
+        return {
+            'ChatGPT': f'{self.base_url}/openai/v1',
+            'DeepSeek': f'{self.base_url}/deepseek',
+            'Gemini': f'{self.base_url}/google',
+        }
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить число запросов по протоколам, видам промптов и ошибкам."""
+        return {
+            'requests': dict(self.requests),
+            'prompts': dict(self.prompts),
+            'errors': dict(self.errors),
+        }
+
+    @staticmethod
+    def classify(texts: List[str]) -> str:
+        """Определить шаблон промпта по общему префиксу из реестра шаблонов."""
+        batch_prefix = PromptTemplates.registry.get('comment_batch').prefix
+        for text in texts:
+            # Партия комментариев - промпт comment_response с дописанным comment_batch
+            if batch_prefix in text:
+                return 'comment_batch'
+            for name, template in PromptTemplates.registry._templates.items():
+                if text.startswith(template.prefix):
+                    return name.split('.')[0]
+        return 'other'
+
+    @staticmethod
+    def _reply(kind: str, texts: List[str]) -> str:
+        if kind == 'dialog_relevance_check':
+            return 'True'
+        if kind == 'comment_response':
+            return 'Комментарий: синтетический комментарий для нагрузочного теста.'
+        if kind == 'comment_batch':
+            match = re.search(r'Количество комментариев: (\d+)', '\n'.join(texts))
+            count = int(match.group(1)) if match else 1
+            return '\n'.join(
+                f'Комментарий: синтетический комментарий {index + 1} для нагрузочного теста.' for index in range(count)
+            )
+        return '\n'.join(
+            f'{beginning} синтетический ответ модели для нагрузочного теста, раздел {index + 1}.'
+            for index, beginning in enumerate(PromptTemplates.BEGINNINGS)
+        )
+
+    def _failure(self) -> Optional[web.Response]:
+        """Случайно вернуть ошибку сервера или превышение лимита запросов."""
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            self.errors['429'] += 1
+            return web.json_response({'error': {'message': 'synthetic rate limit', 'type': 'rate_limit'}}, status=429)
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors['500'] += 1
+            return web.json_response({'error': {'message': 'synthetic failure', 'type': 'server_error'}}, status=500)
+        return None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        if request.method != 'POST':
+            # Прогрев соединений и проверки доступности
+            return web.Response()
+        body = await request.json()
+        path = request.path
+        await asyncio.sleep(self.latency.sample(self._rng))
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        if path.endswith('/chat/completions'):
+            return await self._openai(request, body)
+        if ':generateContent' in path or ':streamGenerateContent' in path:
+            return await self._gemini(request, body, stream=':streamGenerateContent' in path)
+        return web.Response(status=404)
+
+    def _chunks(self, text: str) -> List[str]:
+        words = text.split(' ')
+        size = max(1, len(words) // 8)
+        return [' '.join(words[i:i + size]) + ' ' for i in range(0, len(words), size)]
+
+    async def _send_events(self, request: web.Request, events: List[str]) -> web.StreamResponse:
+        """Отправить события server-sent events с паузами между частями."""
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for event in events:
+            await response.write(f'data: {event}\n\n'.encode('utf-8'))
+            await asyncio.sleep(self.latency.chunk_interval)
+        await response.write_eof()
+        return response
+
+    async def _openai(self, request: web.Request, body: dict) -> web.StreamResponse:
+        self.requests['openai'] += 1
+        texts = [message.get('content') or '' for message in body.get('messages', [])]
+        kind = self.classify(texts)
+        self.prompts[kind] += 1
+        text = self._reply(kind, texts)
+        prompt_tokens = sum(len(item) for item in texts) // 3 + 1
+        completion_tokens = len(text) // 3 + 1
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': 0},
+        }
+        created = int(time.time())
+        if body.get('stream'):
+            events = [
+                json.dumps({
+                    'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': created,
+                    'model': body['model'],
+                    'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': chunk}, 'finish_reason': None}],
+                }, ensure_ascii=False)
+                for chunk in self._chunks(text)
+            ]
+            if body.get('stream_options', {}).get('include_usage'):
+                # Как и API OpenAI, расход токенов отправляется отдельной последней частью без choices
+                events.append(json.dumps({
+                    'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': created,
+                    'model': body['model'], 'choices': [], 'usage': usage,
+                }))
+            events.append('[DONE]')
+            return await self._send_events(request, events)
+        return web.json_response({
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion',
+            'created': created,
+            'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': usage,
+        })
+
+    async def _gemini(self, request: web.Request, body: dict, stream: bool) -> web.StreamResponse:
+        self.requests['gemini'] += 1
+        texts = [part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', [])]
+        kind = self.classify(texts)
+        self.prompts[kind] += 1
+        text = self._reply(kind, texts)
+        prompt_tokens = sum(len(item) for item in texts) // 3 + 1
+        usage = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': len(text) // 3 + 1,
+            'totalTokenCount': prompt_tokens + len(text) // 3 + 1,
+        }
+
+        def candidate(chunk: str) -> dict:
+            return {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': chunk}]}, 'finishReason': 'STOP', 'index': 0}],
+                'usageMetadata': usage,
+            }
+
+        if stream:
+            return await self._send_events(
+                request, [json.dumps(candidate(chunk), ensure_ascii=False) for chunk in self._chunks(text)]
+            )
+        return web.json_response(candidate(text))
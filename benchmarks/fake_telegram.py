@@ -0,0 +1,53 @@
+import itertools
+import time
+from typing import List, Tuple
+
+from telebot import types
+
+from views.telegram_view import TelegramView
+
+
+class FakeTelegramView(TelegramView):
+    """Представление без обращений к Telegram API: исходящие сообщения и правки только записываются."""
+
+    def __init__(self, stream_edit_interval: float = 0.0):
+        super().__init__('0:benchmark', stream_edit_interval)
+        self.sent: List[Tuple[int, str]] = []
+        self.edits = 0
+        self.markup_edits = 0
+        self._message_ids = itertools.count(1)
+
+    async def send_message(self, chat_id: int, text: str, reply_markup: types.InlineKeyboardMarkup = None) -> types.Message:
+        self.sent.append((chat_id, text))
+        return types.Message(
+            message_id=next(self._message_ids),
+            from_user=None,
+            date=int(time.time()),
+            chat=types.Chat(chat_id, 'private'),
+            content_type='text',
+            options={},
+            json_string=''
+        )
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, reply_markup: types.InlineKeyboardMarkup = None) -> None:
+        self.edits += 1
+
+    async def edit_message_reply_markup(self, chat_id: int, message_id: int, reply_markup: types.InlineKeyboardMarkup = None) -> None:
+        self.markup_edits += 1
+
+    def stats(self) -> dict:
+        return {'sent': len(self.sent), 'edits': self.edits, 'markup_edits': self.markup_edits}
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Собрать обновление Telegram с текстовым сообщением пользователя."""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
@@ -0,0 +1,173 @@
+"""Сквозной нагрузочный тест бота на синтетических пользователях и локальном сервере моделей.
+
+Запуск: python -m benchmarks.run --users 200 --concurrency 50 --output report.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+# Конфигурация читается из окружения при импорте; внешние сервисы тесту не нужны
+os.environ.setdefault('ADMIN_ID', '0')
+os.environ.setdefault('TELEGRAM_API_TOKEN', '0:benchmark')
+os.environ.setdefault('PROXY_API_KEY', 'benchmark')
+os.environ.setdefault('STATE_BACKEND', 'memory')
+
+from benchmarks.fake_llm_server import FakeLLMServer, LatencyProfile  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramView  # noqa: E402
+from benchmarks.scenarios import LatencyRecorder, ScenarioOptions, UserScenario  # noqa: E402
+from config import Config  # noqa: E402
+from controllers.app_controller import AppController  # noqa: E402
+from entities.analysis_mode import AnalysisMode  # noqa: E402
+from models.openai_model import OpenAIModel  # noqa: E402
+
+# Метрики отчёта, сравниваемые с эталонным прогоном: путь в отчёте и направление ухудшения
+REGRESSION_METRICS = {
+    'updates_per_second': 'lower',
+    'llm_calls_per_analysis': 'higher',
+}
+
+ANALYSIS_PROMPTS = ('audience_reaction', 'audience_reaction_single', 'summary_response')
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота с имитацией Telegram и API моделей')
+    parser.add_argument('--users', type=int, default=50, help='число синтетических пользователей')
+    parser.add_argument('--concurrency', type=int, default=20, help='число одновременно активных пользователей')
+    parser.add_argument('--providers', default='ChatGPT,Gemini', help='типы моделей пользователей через запятую')
+    parser.add_argument('--analysis-mode', choices=[mode.value for mode in AnalysisMode], default=AnalysisMode.MULTIPLE.value)
+    parser.add_argument('--comments', type=int, default=2, help='число /comment на пользователя')
+    parser.add_argument('--dialog', type=int, default=2, help='число вопросов по посту на пользователя')
+    parser.add_argument('--think-time', type=float, default=0.0, help='средняя пауза между сообщениями, сек')
+    parser.add_argument('--shared-posts', action='store_true', help='одинаковые посты у пользователей (проверка кэша анализа)')
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='медиана задержки ответа модели, мс')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='разброс логнормальной задержки')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для отчёта в JSON; по умолчанию stdout')
+    parser.add_argument('--baseline', help='отчёт эталонного прогона для проверки регрессий')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение относительно эталона')
+    return parser.parse_args(argv)
+
+
+def _per_analysis(prompts: Dict[str, int], analyses: int) -> float:
+    calls = sum(count for kind, count in prompts.items() if kind in ANALYSIS_PROMPTS)
+    return round(calls / analyses, 2) if analyses else 0.0
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Прогнать сценарии всех пользователей и собрать отчёт."""
+    server = FakeLLMServer(
+        latency=LatencyProfile(median=args.latency_ms / 1000, sigma=args.latency_sigma),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    await server.start()
+    config = Config()
+    config.API_URLS.update(server.urls())
+    config.STREAM_EDIT_INTERVAL = 0.0
+    view = FakeTelegramView(config.STREAM_EDIT_INTERVAL)
+    controller = AppController(view, config)
+    await controller.open()
+
+    providers = [provider.strip() for provider in args.providers.split(',') if provider.strip()]
+    user_ids = list(range(1, args.users + 1))
+    for user_id in user_ids:
+        model_type = providers[user_id % len(providers)]
+        user = await controller.store.get_user(user_id)
+        user.analysis_mode = args.analysis_mode
+        await user.update_model(model_type, config.MODELS[model_type][0], config.API_URLS[model_type])
+
+    options = ScenarioOptions(
+        comments=args.comments,
+        dialog_messages=args.dialog,
+        think_time=args.think_time,
+        unique_posts=not args.shared_posts
+    )
+    recorder = LatencyRecorder()
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_user(user_id: int) -> None:
+        async with semaphore:
+            await UserScenario(view, user_id, options, recorder, rng).run()
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_user(user_id) for user_id in user_ids))
+        duration = time.perf_counter() - started
+        await controller.store.write_buffer.flush()
+    finally:
+        await controller.close()
+        await server.close()
+
+    llm = server.stats()
+    error_text = OpenAIModel.ERROR_MESSAGE
+    return {
+        'parameters': vars(args),
+        'duration_s': round(duration, 2),
+        'updates': recorder.updates,
+        'updates_per_second': round(recorder.updates / duration, 2) if duration else 0.0,
+        'latency': recorder.summary(),
+        'llm': llm,
+        'llm_calls_per_analysis': _per_analysis(llm['prompts'], len(recorder.samples.get('analysis', []))),
+        'user_visible_errors': sum(1 for _, text in view.sent if text.startswith(error_text)),
+        'telegram': view.stats(),
+        'store': controller.store.stats(),
+        'mailboxes': view.mailboxes.stats(),
+        'scheduler': controller.scheduler.stats(),
+        'client_pool': controller.client_pool.stats(),
+        'analysis_cache': controller.analysis_cache.stats(),
+        'token_usage': {name: model.usage.stats() for name, model in controller.models.items()},
+        'model_tiers': controller.router.stats(),
+        'comment_pool': controller.comment_pool.stats() if controller.comment_pool is not None else None,
+    }
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Сравнить отчёт с эталоном: пропускную способность, число вызовов моделей и p95 по командам."""
+    checks = [(name, report.get(name), baseline.get(name), direction) for name, direction in REGRESSION_METRICS.items()]
+    for command, values in baseline.get('latency', {}).items():
+        current = report['latency'].get(command)
+        if current is not None:
+            checks.append((f'latency.{command}.p95_ms', current['p95_ms'], values['p95_ms'], 'higher'))
+
+    regressions = []
+    for name, current, reference, direction in checks:
+        if current is None or not reference:
+            continue
+        change = (current - reference) / reference
+        if (direction == 'higher' and change > tolerance) or (direction == 'lower' and -change > tolerance):
+            regressions.append(f'{name}: {reference} -> {current} ({change:+.0%})')
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'Регрессия {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
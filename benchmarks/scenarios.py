@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from benchmarks.fake_telegram import message_update
+
+# Посты и вопросы по ним: слова вопросов пересекаются с текстом поста,
+# поэтому лексическая проверка релевантности пропускает их без запроса к модели
+POSTS: List[Tuple[str, List[str]]] = [
+    (
+        'В Улан-Удэ снова смог: жители жалуются на дым от частного сектора, '
+        'власти обещают перевести дома на газ к следующей зиме.',
+        ['Когда дома в Улан-Удэ переведут на газ?', 'Почему жители жалуются на смог и дым?'],
+    ),
+    (
+        'Городская библиотека открыла коворкинг для студентов: бесплатный wi-fi, '
+        'розетки у каждого стола и работа до полуночи.',
+        ['Коворкинг в библиотеке бесплатный для студентов?', 'До какого времени работает коворкинг библиотеки?'],
+    ),
+    (
+        'С понедельника на трёх маршрутах автобусов вводят оплату по QR-коду, '
+        'наличные водители принимать перестанут.',
+        ['На каких маршрутах автобусов вводят оплату по QR-коду?', 'Почему водители перестанут принимать наличные?'],
+    ),
+]
+
+ANALYSIS_PARAMS = ['Telegram', 'Новостной канал', 'Информирование', 'Жители города']
+
+
+@dataclass
+class ScenarioOptions:
+    """Параметры сценария одного синтетического пользователя."""
+    comments: int = 2
+    dialog_messages: int = 2
+    # Пауза между сообщениями пользователя, сек
+    think_time: float = 0.0
+    # Одинаковые посты у разных пользователей попадают в кэш анализа
+    unique_posts: bool = True
+
+
+@dataclass
+class LatencyRecorder:
+    """Время обработки обновлений по видам команд."""
+    samples: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    updates: int = 0
+
+    def record(self, command: str, seconds: float) -> None:
+        self.samples[command].append(seconds)
+        self.updates += 1
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Получить число обновлений и перцентили задержки в миллисекундах по каждой команде."""
+        return {
+            command: {
+                'count': len(values),
+                'p50_ms': round(self._percentile(values, 0.5) * 1000, 1),
+                'p95_ms': round(self._percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(self._percentile(values, 0.99) * 1000, 1),
+                'max_ms': round(max(values) * 1000, 1),
+            }
+            for command, values in sorted(self.samples.items())
+        }
+
+
+class UserScenario:
+    """Сценарий пользователя: параметры анализа, пост, комментарии и обсуждение поста.
+
+    Обновления проходят через представление так же, как обновления от Telegram.
+    """
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, view, user_id: int, options: ScenarioOptions, recorder: LatencyRecorder, rng: random.Random):
+        self.view = view
+        self.user_id = user_id
+        self.options = options
+        self.recorder = recorder
+        self.rng = rng
+
+    async def _send(self, command: str, text: str) -> None:
+        if self.options.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.options.think_time))
+        started = time.perf_counter()
+        await self.view.process_update(message_update(next(self._update_ids), self.user_id, text))
+        self.recorder.record(command, time.perf_counter() - started)
+
+    async def run(self) -> None:
+        post, questions = POSTS[self.user_id % len(POSTS)]
+        if self.options.unique_posts:
+            post = f'{post} Выпуск №{self.user_id}.'
+        await self._send('analyze_start', '/analyze')
+        for value in ANALYSIS_PARAMS:
+            await self._send('analysis_param', value)
+        await self._send('analysis', post)
+        for _ in range(self.options.comments):
+            await self._send('comment', '/comment')
+        for index in range(self.options.dialog_messages):
+            await self._send('dialog', questions[index % len(questions)])
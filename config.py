@@ -13,10 +13,59 @@ class Config:
     TELEGRAM_API_TOKEN: str = os.getenv('TELEGRAM_API_TOKEN')
     PROXY_API_KEY: str = os.getenv('PROXY_API_KEY')
     FIREBASE_API_KEY_PATH: str = os.getenv('FIREBASE_API_KEY_PATH')
+    STATE_BACKEND: str = os.getenv('STATE_BACKEND', 'firestore')
+    SQLITE_PATH: str = os.getenv('SQLITE_PATH', 'state.db')
     ADMIN_ID: int = int(os.getenv('ADMIN_ID'))
+    FLUSH_INTERVAL: float = float(os.getenv('FLUSH_INTERVAL', '0.5'))
+    USER_CACHE_SIZE: int = int(os.getenv('USER_CACHE_SIZE', '1024'))
+    USER_CACHE_TTL: float = float(os.getenv('USER_CACHE_TTL', '600'))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv('LLM_MAX_CONNECTIONS', '100'))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '20'))
+    LLM_HTTP2: bool = os.getenv('LLM_HTTP2', 'false').lower() == 'true'
+    STREAM_EDIT_INTERVAL: float = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+    ANALYSIS_CACHE_SIZE: int = int(os.getenv('ANALYSIS_CACHE_SIZE', '256'))
+    ANALYSIS_CACHE_TTL: float = float(os.getenv('ANALYSIS_CACHE_TTL', '86400'))
+    ANALYSIS_CACHE_DIR: str = os.getenv('ANALYSIS_CACHE_DIR')
+    DIALOG_CONTEXT_BUDGET: int = int(os.getenv('DIALOG_CONTEXT_BUDGET', '6000'))
+    RELEVANCE_ACCEPT_THRESHOLD: float = float(os.getenv('RELEVANCE_ACCEPT_THRESHOLD', '0.15'))
+    RELEVANCE_REJECT_THRESHOLD: float = float(os.getenv('RELEVANCE_REJECT_THRESHOLD', '0.04'))
+    RELEVANCE_CACHE_MB: int = int(os.getenv('RELEVANCE_CACHE_MB', '64'))
+    ANALYSIS_DEADLINE: float = float(os.getenv('ANALYSIS_DEADLINE', '150'))
+    LLM_MAX_ATTEMPTS: int = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv('LLM_REQUEST_TIMEOUT', '60'))
+    LLM_HEDGING: bool = os.getenv('LLM_HEDGING', 'true').lower() == 'true'
+    LLM_FALLBACK: bool = os.getenv('LLM_FALLBACK', 'true').lower() == 'true'
+    MODEL_ROUTING: bool = os.getenv('MODEL_ROUTING', 'true').lower() == 'true'
+    INGEST_MODE: str = os.getenv('INGEST_MODE', 'polling')
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET')
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+    WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8080'))
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+    WEBHOOK_WORKERS: int = int(os.getenv('WEBHOOK_WORKERS', '16'))
+    WORKER_PROCESSES: int = int(os.getenv('WORKER_PROCESSES', '0'))
+    WORKER_QUEUE_SIZE: int = int(os.getenv('WORKER_QUEUE_SIZE', '1000'))
+    OPTIMISTIC_CONCURRENCY: bool = os.getenv('OPTIMISTIC_CONCURRENCY', 'false').lower() == 'true'
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_HOST: str = os.getenv('METRICS_HOST', '0.0.0.0')
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '0'))
+    COMMENT_BATCH_SIZE: int = int(os.getenv('COMMENT_BATCH_SIZE', '5'))
+    COMMENT_LOW_WATER: int = int(os.getenv('COMMENT_LOW_WATER', '2'))
+    PANEL_SIZE: int = int(os.getenv('PANEL_SIZE', '100'))
+    PANEL_MAX_SIZE: int = int(os.getenv('PANEL_MAX_SIZE', '200'))
+    PANEL_BATCH_SIZE: int = int(os.getenv('PANEL_BATCH_SIZE', '25'))
+    COMPARE_MAX_MODELS: int = int(os.getenv('COMPARE_MAX_MODELS', '4'))
 
     MODELS: Dict[str, List[str]] = None
     API_URLS: Dict[str, str] = None
+    DIALOG_CONTEXT_BUDGETS: Dict[str, int] = None
+    RATE_LIMITS: Dict[str, Dict[str, int]] = None
+    MODEL_RATE_LIMITS: Dict[str, Dict[str, int]] = None
+    FALLBACK_MODELS: Dict[str, List[str]] = None
+    MODEL_TIERS: Dict[str, Dict[str, str]] = None
+    MODEL_ROUTES: Dict[str, str] = None
+    COMPARE_MODELS: List[str] = None
     KEYBOARD_DATA: Dict[RuntimeStates, List[str]] = None
     STATES_CONFIG: Dict[RuntimeStates, Dict] = None
 
@@ -40,6 +89,64 @@ class Config:
             ]
         }
 
+        # Бюджет токенов контекста диалога для моделей, отличающихся от DIALOG_CONTEXT_BUDGET
+        self.DIALOG_CONTEXT_BUDGETS = {
+            'gpt-3.5-turbo-0125': 3000,
+            'gpt-4.1-nano-2025-04-14': 4000,
+            'gemini-2.0-flash-lite': 4000,
+        }
+
+        # Ограничения исходящих запросов к каждой модели провайдера:
+        # rpm - запросов в минуту, tpm - токенов в минуту, concurrency - одновременных запросов
+        self.RATE_LIMITS = {
+            'ChatGPT': {'rpm': 500, 'tpm': 200000, 'concurrency': 32},
+            'DeepSeek': {'rpm': 300, 'tpm': 100000, 'concurrency': 16},
+            'Gemini': {'rpm': 300, 'tpm': 200000, 'concurrency': 32},
+        }
+        # Ограничения для отдельных моделей, дополняющие ограничения провайдера
+        self.MODEL_RATE_LIMITS = {
+            'gpt-4.1-2025-04-14': {'tpm': 100000},
+            'gemini-1.5-pro': {'rpm': 100},
+        }
+
+        # Резервные модели того же провайдера, на которые переключается запрос при сбоях основной
+        self.FALLBACK_MODELS = {
+            'gpt-4.1-2025-04-14': ['gpt-4.1-mini-2025-04-14'],
+            'gpt-4o-2024-11-20': ['gpt-4o-mini-2024-07-18'],
+            'gpt-4.1-mini-2025-04-14': ['gpt-4o-mini-2024-07-18'],
+            'gemini-1.5-pro': ['gemini-2.0-flash'],
+            'gemini-2.0-flash': ['gemini-2.0-flash-lite'],
+        }
+
+        # Уровни моделей каждого провайдера; уровень 'user' - модель, выбранная пользователем
+        self.MODEL_TIERS = {
+            'ChatGPT': {
+                'fast': 'gpt-4.1-nano-2025-04-14',
+                'balanced': 'gpt-4.1-mini-2025-04-14',
+            },
+            'DeepSeek': {},
+            'Gemini': {
+                'fast': 'gemini-2.0-flash-lite',
+                'balanced': 'gemini-2.0-flash',
+            },
+        }
+
+        # Уровень модели для каждого назначения запроса; короткие служебные запросы идут на быстрые модели
+        self.MODEL_ROUTES = {
+            'analysis': 'user',
+            'summary': 'fast',
+            'validation': 'fast',
+            'comment': 'user',
+            'dialog': 'user',
+        } if self.MODEL_ROUTING else {}
+
+        # Модели, которые сравниваются командой /compare без аргументов
+        self.COMPARE_MODELS = [
+            name.strip()
+            for name in os.getenv('COMPARE_MODELS', 'gpt-4.1-mini-2025-04-14,gemini-2.0-flash').split(',')
+            if name.strip()
+        ]
+
         self.API_URLS = {
             'ChatGPT': 'https://api.proxyapi.ru/openai/v1',
             'DeepSeek': 'https://api.proxyapi.ru/deepseek',
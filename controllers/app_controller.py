@@ -1,17 +1,38 @@
-from typing import Dict
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
 
 import aiohttp
 from telebot import types
 
+from entities.analysis_mode import AnalysisMode
 from entities.states import RuntimeStates
 from entities.user import User
-from models.base_model import BaseModel
-from models.gemini_model import GeminiModel
-from models.openai_model import OpenAIModel
-from services.firebase_service import FirebaseService
+from models.audience_panel import AudiencePanel, PanelReport
+from models.base_model import AnalysisPrompts, BaseModel
+from models.client_pool import LLMClientPool
+from models.comment_pool import CommentPool
+from models.dialog_context import DialogContext
+from models.errors import LLMError
+from models.llm_response import track_usage
+from models.llm_scheduler import LLMScheduler
+from models.model_router import USER_TIER, ModelRouter, Purpose
+from models.prompt_templates import PromptTemplates
+from models.relevance_gate import RelevanceGate
+from models.resilience import ResiliencePolicy
+from services.analysis_cache import AnalysisCache
+from services.memory_store import MemoryStateStore
+from services.metrics import metrics
+from services.sqlite_store import SQLiteStateStore
+from services.state_store import StateStore
 from views.telegram_view import TelegramView
+from controllers.comparison import ComparisonRun, format_comparison
+from controllers.llm_components import LLMComponents
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 
 class AppController:
     """Контроллер приложения для управления взаимодействием между представлением и моделями."""
@@ -20,22 +41,101 @@ class AppController:
         """Инициализация контроллера с представлением и конфигурацией."""
         self.view: TelegramView = view
         self.config: Config = config
-        self.firebase_service: FirebaseService = FirebaseService(self.config.FIREBASE_API_KEY_PATH)
-        self.models: Dict[str, BaseModel] = {
-            'ChatGPT': OpenAIModel(self.config.PROXY_API_KEY),
-            'DeepSeek': OpenAIModel(self.config.PROXY_API_KEY),
-            'Gemini': GeminiModel(self.config.PROXY_API_KEY)
-        }
+        metrics.enabled = self.config.METRICS_ENABLED
+        self._metrics_runner = None
+        self.store: StateStore = self._create_state_store()
+        llm = LLMComponents.from_config(self.config)
+        self.client_pool: LLMClientPool = llm.client_pool
+        self.analysis_cache: AnalysisCache = llm.analysis_cache
+        self.dialog_context: DialogContext = llm.dialog_context
+        self.relevance_gate: RelevanceGate = llm.relevance_gate
+        self.scheduler: LLMScheduler = llm.scheduler
+        self.resilience_policy: ResiliencePolicy = llm.resilience_policy
+        self.router: ModelRouter = llm.router
+        self.comment_pool: Optional[CommentPool] = llm.comment_pool
+        self.audience_panel: AudiencePanel = llm.audience_panel
+        self.models: Dict[str, BaseModel] = llm.models
         self.view.set_controller(self)
 
+    def _create_state_store(self) -> StateStore:
+        """Создать хранилище пользователей, выбранное в конфигурации."""
+        options = dict(
+            flush_interval=self.config.FLUSH_INTERVAL,
+            cache_size=self.config.USER_CACHE_SIZE,
+            cache_ttl=self.config.USER_CACHE_TTL
+        )
+        if self.config.STATE_BACKEND == 'memory':
+            return MemoryStateStore(**options)
+        if self.config.STATE_BACKEND == 'sqlite':
+            return SQLiteStateStore(self.config.SQLITE_PATH, **options)
+        if self.config.STATE_BACKEND == 'firestore':
+            # Клиент Firestore нужен только этому хранилищу
+            from services.firebase_service import FirebaseService
+            return FirebaseService(
+                self.config.FIREBASE_API_KEY_PATH,
+                optimistic_concurrency=self.config.OPTIMISTIC_CONCURRENCY,
+                **options
+            )
+        raise ValueError(f'Неизвестное хранилище пользователей: {self.config.STATE_BACKEND}')
+
+    async def open(self) -> None:
+        """Запустить фоновые службы и прогреть соединения с моделями."""
+        self.store.start()
+        if metrics.enabled and self.config.METRICS_PORT:
+            self._metrics_runner = await metrics.start_server(self.config.METRICS_HOST, self.config.METRICS_PORT)
+            logger.info('Метрики доступны на %s:%s/metrics', self.config.METRICS_HOST, self.config.METRICS_PORT)
+        await self.client_pool.warm_up(self._get_llm_endpoints())
+        logger.info('Общие префиксы промптов: %s', PromptTemplates.registry.stats(self.dialog_context.counter.count))
+
+    async def close(self) -> None:
+        """Сохранить несохранённые данные и закрыть соединения."""
+        for name, model in self.models.items():
+            logger.info('Расход токенов %s: %s', name, model.usage.stats())
+        logger.info('Запросы по уровням моделей: %s', self.router.stats())
+        if self.comment_pool is not None:
+            logger.info('Запас комментариев: %s', self.comment_pool.stats())
+            await self.comment_pool.close()
+        await self.store.close()
+        await self.client_pool.close()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+
     async def start(self) -> None:
         """Запустить приложение."""
-        await self.view.start_polling()
+        await self.open()
+        try:
+            if self.config.INGEST_MODE == 'webhook':
+                await self.view.start_webhook(
+                    self.config.WEBHOOK_URL,
+                    self.config.WEBHOOK_SECRET,
+                    path=self.config.WEBHOOK_PATH,
+                    host=self.config.WEBHOOK_HOST,
+                    port=self.config.WEBHOOK_PORT,
+                    queue_size=self.config.WEBHOOK_QUEUE_SIZE,
+                    workers=self.config.WEBHOOK_WORKERS
+                )
+            else:
+                await self.view.start_polling()
+        finally:
+            await self.close()
+
+    async def migrate_users(self) -> int:
+        """Перенести историю пользователей из документов сессий в подколлекции."""
+        try:
+            return await self.store.migrate_users()
+        finally:
+            await self.store.close()
+
+    def _get_llm_endpoints(self) -> List[Tuple[str, str]]:
+        """Получить пары (провайдер, base_url) для всех поддерживаемых типов моделей."""
+        return [
+            (LLMClientPool.GEMINI if model_type == 'Gemini' else LLMClientPool.OPENAI, self.config.API_URLS[model_type])
+            for model_type in self.config.MODELS
+        ]
 
     async def get_state_by_user_id(self, user_id: int) -> RuntimeStates:
         """Получить состояние пользователя по его ID."""
-        user = await self._get_user(user_id)
-        return user.get_state()
+        return await self.store.get_state(user_id)
     
     async def _set_state_by_user_id(self, user_id: int, state: RuntimeStates) -> None:
         """Установить состояние пользователя по его ID."""
@@ -44,7 +144,7 @@ class AppController:
 
     async def _get_user(self, user_id: int) -> User:
         """Получить или создать пользователя из базы данных."""
-        return await self.firebase_service.get_user(user_id)
+        return await self.store.get_user(user_id)
 
     def _get_model_for_user(self, user: User) -> BaseModel:
         """Получить экземпляр модели в зависимости от типа модели пользователя."""
@@ -94,8 +194,12 @@ class AppController:
             await self.view.send_message(message.chat.id, "Сначала задайте параметры анализа командой /analyze")
             return
         model = self._get_model_for_user(user)
-        response = await model.generate_comment(user)
-        await self.view.send_message(message.chat.id, response)
+        comment = await model.take_comment(user)
+        if comment is not None:
+            await self.view.send_message(message.chat.id, comment)
+            return
+        # Запас ещё не готов: первый комментарий выводится по мере генерации, пока запас пополняется в фоне
+        await self.view.send_stream(message.chat.id, model.stream_comment(user))
 
     async def handle_analyze(self, message: types.Message) -> None:
         """Обработать команду начала анализа поста."""
@@ -122,6 +226,144 @@ class AppController:
                 balance = (await response.json()).get('balance', 'Недоступно')
                 await self.view.send_message(message.chat.id, f'Текущий баланс: {balance}')
 
+    async def handle_switch(self, message: types.Message) -> None:
+        """Обработать команду переключения способа анализа."""
+        user = await self._get_user(message.from_user.id)
+        mode = await user.switch_analysis_mode()
+        description = '1 большой запрос' if mode == AnalysisMode.SINGLE else 'параллельные подзапросы'
+        await self.view.send_message(message.chat.id, f'Способ анализа изменён: {description}')
+
+    async def handle_routing(self, message: types.Message) -> None:
+        """Обработать команду просмотра и выбора моделей для отдельных назначений запросов."""
+        user = await self._get_user(message.from_user.id)
+        args = (message.text or '').split()[1:]
+        if args:
+            purposes = [purpose.value for purpose in Purpose]
+            purpose, choice = args[0], (args[1] if len(args) > 1 else 'default')
+            if purpose not in purposes or (choice != 'default' and not self.router.is_valid_choice(user.model_type, choice)):
+                await self.view.send_message(
+                    message.chat.id,
+                    'Использование: /routing <назначение> <уровень или модель | default>\n'
+                    f'Назначения: {", ".join(purposes)}\n'
+                    f'Уровни: {", ".join(self.router.tier_names(user.model_type))}'
+                )
+                return
+            await user.set_model_override(purpose, None if choice == 'default' else choice)
+        routes = [self.router.route(user, purpose) for purpose in Purpose]
+        await self.view.send_message(
+            message.chat.id,
+            'Модели по назначениям запросов:\n' +
+            '\n'.join(f'{route.purpose.value}: {route.model} ({route.tier})' for route in routes)
+        )
+
+    async def handle_panel(self, message: types.Message) -> None:
+        """Обработать команду оценки реакции аудитории по выборке сгенерированных комментариев."""
+        user = await self._get_user(message.from_user.id)
+        chat_id = message.chat.id
+        if not user.analysis_data.post_text:
+            await self.view.send_message(chat_id, 'Сначала задайте параметры анализа командой /analyze')
+            return
+        args = (message.text or '').split()[1:]
+        size = int(args[0]) if args and args[0].isdigit() else self.config.PANEL_SIZE
+        if not 1 <= size <= self.config.PANEL_MAX_SIZE:
+            await self.view.send_message(chat_id, f'Размер панели: от 1 до {self.config.PANEL_MAX_SIZE} комментариев.')
+            return
+        model = self._get_model_for_user(user)
+        await self.view.send_message(chat_id, f'Собираю панель аудитории из {size} комментариев…')
+        try:
+            comments = await model.sample_panel(user, size, self.config.PANEL_BATCH_SIZE)
+        except LLMError:
+            await self.view.send_message(chat_id, model.ERROR_MESSAGE)
+            return
+        report = self.audience_panel.score(comments)
+        await self.view.send_message(chat_id, self._format_panel(report))
+
+    @staticmethod
+    def _format_panel(report: PanelReport) -> str:
+        """Собрать текст отчёта панели аудитории."""
+        def percent(share: float) -> str:
+            return f'{share * 100:.0f}%'
+
+        lines = [
+            f'Панель аудитории: {report.size} комментариев',
+            f'Тональность: позитивные {percent(report.sentiment["positive"])}, '
+            f'нейтральные {percent(report.sentiment["neutral"])}, '
+            f'негативные {percent(report.sentiment["negative"])} (в среднем {report.mean_sentiment:+.2f})',
+            f'Позиция к автору: поддерживают {percent(report.stance["support"])}, '
+            f'возражают {percent(report.stance["oppose"])}, не выражена {percent(report.stance["unclear"])}',
+            f'Индекс спорности: {report.controversy:.2f} (0 - единодушие, 1 - мнения разделились поровну)',
+        ]
+        if report.themes:
+            lines.append('Повторяющиеся темы: ' + ', '.join(f'{theme} ({count})' for theme, count in report.themes))
+        if 'positive' in report.examples:
+            lines.append(f'\nСамый позитивный:\n{report.examples["positive"]}')
+        if 'negative' in report.examples:
+            lines.append(f'\nСамый негативный:\n{report.examples["negative"]}')
+        return '\n'.join(lines)
+
+    async def handle_compare(self, message: types.Message) -> None:
+        """Обработать команду сравнения анализа текущего поста несколькими моделями одновременно."""
+        user = await self._get_user(message.from_user.id)
+        chat_id = message.chat.id
+        if not user.analysis_data.post_text:
+            await self.view.send_message(chat_id, 'Сначала задайте параметры анализа командой /analyze')
+            return
+        model_names = list(dict.fromkeys((message.text or '').split()[1:] or self.config.COMPARE_MODELS))
+        known = {name for models in self.config.MODELS.values() for name in models}
+        unknown = [name for name in model_names if name not in known]
+        if unknown or not 1 < len(model_names) <= self.config.COMPARE_MAX_MODELS:
+            await self.view.send_message(
+                chat_id,
+                'Использование: /compare <модель> <модель> ...\n'
+                f'Сравнить можно от 2 до {self.config.COMPARE_MAX_MODELS} моделей.' +
+                (f'\nНеизвестные модели: {", ".join(unknown)}' if unknown else '')
+            )
+            return
+        # Промпты одинаковы для всех моделей, поэтому собираются один раз
+        prompts = AnalysisPrompts.build(user.analysis_data)
+        runs = await asyncio.gather(*(
+            self._run_comparison(user, chat_id, model_name, prompts) for model_name in model_names
+        ))
+        await self.view.send_blocks(chat_id, format_comparison(list(runs), prompts.beginnings))
+
+    async def _run_comparison(self, user: User, chat_id: int, model_name: str, prompts: AnalysisPrompts) -> ComparisonRun:
+        """Проанализировать пост пользователя указанной моделью, показывая разделы по мере готовности."""
+        model_type = self._get_model_type(model_name)
+        # Временный пользователь без хранилища: выбор модели пользователя не меняется.
+        # Анализ и резюме всегда выполняет сравниваемая модель, какие бы уровни ни выбрал пользователь
+        run_user = User(
+            user_id=user.user_id,
+            model_type=model_type,
+            model_name=model_name,
+            base_url=self._get_base_url(model_type),
+            analysis_data=user.analysis_data,
+            analysis_mode=user.analysis_mode,
+            model_overrides={**user.model_overrides, Purpose.ANALYSIS.value: USER_TIER, Purpose.SUMMARY.value: USER_TIER}
+        )
+        run = ComparisonRun(model_name)
+        renderer = await self.view.start_sections(chat_id, f'Сравнение. Модель: {model_name}', prompts.beginnings)
+
+        async def on_section(section: int, text: str) -> None:
+            run.sections[section] = text
+            await renderer.update(section, text)
+
+        started = time.monotonic()
+        with track_usage() as usage:
+            try:
+                # Без кэша: время и расход токенов должны отражать работу модели
+                await self.models[model_type].analyze_data(
+                    run_user, on_section=on_section, use_cache=False, prompts=prompts
+                )
+            except LLMError as e:
+                run.error = str(e)
+            except BaseException:
+                await renderer.close()
+                raise
+        run.seconds = time.monotonic() - started
+        run.usage = usage.stats()
+        await renderer.finish()
+        return run
+
     async def handle_current_model(self, message: types.Message) -> None:
         """Обработать команду отображения текущей модели."""
         user = await self._get_user(message.from_user.id)
@@ -143,9 +385,9 @@ class AppController:
             await self.view.send_message(chat_id, 'Нет данных для анализа. Используйте /analyze для нового анализа.')
             return
 
-        model = self._get_model_for_user(user)
-        response = await model.analyze_data(user)
-        await self._send_analysis_results(user, chat_id, response)
+        # '/reanalyze fresh' запрашивает новую выборку ответов в обход кэша
+        fresh = 'fresh' in (message.text or '').split()[1:]
+        await self._send_analysis_results(user, chat_id, use_cache=not fresh)
 
     async def handle_state_input(self, user_id: int, chat_id: int, text: str, state: RuntimeStates) -> None:
         """Обработать ввод для текущего шага анализа."""
@@ -166,16 +408,13 @@ class AppController:
         await user.set_analysis_field('post_text', text)
         await self._set_state_by_user_id(user_id, RuntimeStates.state_dialog)
         
-        model = self._get_model_for_user(user)
-        response = await model.analyze_data(user)
-        await self._send_analysis_results(user, chat_id, response)
+        await self._send_analysis_results(user, chat_id)
 
     async def handle_dialog_message(self, message: types.Message) -> None:
         """Обработать сообщение в контексте обсуждения поста."""
         user = await self._get_user(message.from_user.id)
         model = self._get_model_for_user(user)
-        response = await model.get_dialog_response(user, message.text)
-        await self.view.send_message(message.chat.id, response)
+        await self.view.send_stream(message.chat.id, model.stream_dialog_response(user, message.text))
 
     async def change_model(self, user_id: int, user_choice: str, message_id: int = None):
         """Изменить модель для конкретного пользователя."""
@@ -227,16 +466,29 @@ class AppController:
         """Очистить контекст для конкретного пользователя."""
         user = await self._get_user(user_id)
         await user.clear()
+        if self.comment_pool is not None:
+            self.comment_pool.invalidate(user_id)
 
-    async def _send_analysis_results(self, user: User, chat_id: int, response: str) -> None:
-        """Отправить результаты анализа пользователю."""
-        await self.view.send_message(
+    async def _send_analysis_results(self, user: User, chat_id: int, use_cache: bool = True) -> None:
+        """Проанализировать пост и отправлять пользователю разделы результата по мере готовности."""
+        model = self._get_model_for_user(user)
+        renderer = await self.view.start_sections(
             chat_id,
             f'Модель: {user.model_name}\n'
             f'Платформа: {user.analysis_data.platform}\n'
             f'Тип блога: {user.analysis_data.blog_type}\n'
             f'Цель: {user.analysis_data.purpose}\n'
-            f'Аудитория: {user.analysis_data.audience}\n\n'
-            f'{response}'
+            f'Аудитория: {user.analysis_data.audience}',
+            PromptTemplates.BEGINNINGS
         )
-        await self._set_state_by_user_id(user.user_id, RuntimeStates.state_dialog)
\ No newline at end of file
+        try:
+            await model.analyze_data(user, on_section=renderer.update, use_cache=use_cache)
+        except LLMError:
+            await renderer.finish()
+            await self.view.send_message(chat_id, f'{model.ERROR_MESSAGE} Повторить анализ: /reanalyze')
+            return
+        finally:
+            # Отложенная правка не должна пережить анализ, завершившийся любой ошибкой
+            await renderer.close()
+        await renderer.finish()
+        await self._set_state_by_user_id(user.user_id, RuntimeStates.state_dialog)
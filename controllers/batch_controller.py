@@ -0,0 +1,236 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from config import Config
+from controllers.llm_components import LLMComponents
+from entities.analysis_data import AnalysisData
+from entities.analysis_mode import AnalysisMode
+from entities.user import User
+from models.base_model import BaseModel
+from models.client_pool import LLMClientPool
+from models.errors import LLMError
+from models.prompt_templates import PromptTemplates
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_FIELDS = list(AnalysisData().to_dict())
+# Параметры публикации, которые можно задать общими для всего файла
+PARAMETER_FIELDS = [name for name in ANALYSIS_FIELDS if name != 'post_text']
+
+
+def _read_rows(f, is_csv: bool) -> Iterator[Tuple[int, Any]]:
+    """Читать строки файла с номерами; строку, которую не удалось разобрать, вернуть как исключение."""
+    if not is_csv:
+        for number, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, e
+        return
+    reader = csv.DictReader(f)
+    number = 0
+    while True:
+        number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            row = e
+        yield number, row
+
+
+def read_posts(path: str, defaults: Dict[str, str] = None) -> Iterator[Dict[str, Any]]:
+    """Читать посты из CSV или JSONL по одному; идентификатор поста - поле id или номер строки.
+
+    Незаполненные параметры анализа берутся из defaults. Строки, которые не удалось разобрать,
+    записываются в лог и пропускаются, чтобы одна ошибка в файле не останавливала весь запуск.
+    """
+    defaults = defaults or {}
+    with open(path, encoding='utf-8', newline='') as f:
+        for number, row in _read_rows(f, path.lower().endswith('.csv')):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                if not isinstance(row, dict):
+                    raise ValueError(f'ожидался объект, получено {type(row).__name__}')
+                fields = {
+                    name: str(row.get(name) or defaults.get(name) or '').strip() for name in ANALYSIS_FIELDS
+                }
+            except (csv.Error, ValueError) as e:
+                logger.warning('Строка %s файла %s пропущена: %s', number, path, e)
+                continue
+            yield {'id': str(row.get('id') or number), 'analysis_data': AnalysisData(**fields)}
+
+
+def read_completed(path: str) -> Set[str]:
+    """Получить идентификаторы постов, полностью проанализированных в предыдущих запусках.
+
+    Пост с ошибкой анализируется заново, и его новая запись дописывается после прежней,
+    поэтому для одного id действует последняя запись в файле.
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Строка, оборванная при прерывании запуска
+                continue
+            if 'error' not in record and not record.get('failed_topics'):
+                completed.add(str(record['id']))
+            else:
+                completed.discard(str(record['id']))
+    return completed
+
+
+class BatchAnalyzer:
+    """Пакетный анализ постов без Telegram и хранилища пользователей.
+
+    Результаты дописываются в JSONL по мере готовности; этот же файл служит контрольной точкой:
+    при повторном запуске полностью проанализированные посты пропускаются.
+    """
+
+    def __init__(self,
+                 config: Config,
+                 model_name: str,
+                 analysis_mode: AnalysisMode = AnalysisMode.MULTIPLE,
+                 concurrency: int = 4,
+                 use_cache: bool = True):
+        """Инициализация моделей по конфигурации и параметров запуска."""
+        self.config = config
+        self.llm = LLMComponents.from_config(config)
+        self.model_type = next(
+            (model_type for model_type, models in config.MODELS.items() if model_name in models), None
+        )
+        if self.model_type is None:
+            raise ValueError(f'Неизвестная модель: {model_name}')
+        self.model_name = model_name
+        self.model: BaseModel = self.llm.models[self.model_type]
+        self.analysis_mode = analysis_mode
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+        self.analyzed = 0
+        self.failed = 0
+        self.skipped = 0
+        self._started: Optional[float] = None
+
+    def _create_user(self, index: int, analysis_data: AnalysisData) -> User:
+        """Создать временного пользователя без хранилища; каждый пост - отдельная очередь планировщика."""
+        return User(
+            user_id=index,
+            model_type=self.model_type,
+            model_name=self.model_name,
+            base_url=self.config.API_URLS[self.model_type],
+            analysis_data=analysis_data,
+            analysis_mode=self.analysis_mode.value
+        )
+
+    async def analyze(self, index: int, post: Dict[str, Any]) -> Dict[str, Any]:
+        """Проанализировать один пост и получить запись для файла результатов."""
+        user = self._create_user(index, post['analysis_data'])
+        record = {'id': post['id'], 'model': self.model_name, 'analysis_data': user.analysis_data.to_dict()}
+        sections: Dict[int, str] = {}
+
+        async def on_section(section: int, text: str) -> None:
+            sections[section] = text
+
+        started = time.monotonic()
+        try:
+            await self.model.analyze_data(user, on_section, use_cache=self.use_cache)
+        except LLMError as e:
+            return {**record, 'error': str(e)}
+        except Exception as e:
+            logger.exception('Ошибка анализа поста %s', post['id'])
+            return {**record, 'error': repr(e)}
+        ordered = [sections[section] for section in sorted(sections)]
+        failed_topics = [
+            section for section, text in enumerate(ordered)
+            if text == BaseModel.TOPIC_FAILED.format(beginning=PromptTemplates.BEGINNINGS[section])
+        ]
+        return {
+            **record,
+            'sections': ordered,
+            'failed_topics': failed_topics,
+            'seconds': round(time.monotonic() - started, 2)
+        }
+
+    async def run(self, input_path: str, output_path: str, defaults: Dict[str, str] = None) -> Dict[str, Any]:
+        """Проанализировать посты из файла, дописывая результаты в output_path."""
+        completed = read_completed(output_path)
+        posts: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        await self.llm.client_pool.warm_up([(
+            LLMClientPool.GEMINI if self.model_type == 'Gemini' else LLMClientPool.OPENAI,
+            self.config.API_URLS[self.model_type]
+        )])
+        self._started = time.monotonic()
+
+        # Оборванная при прерывании последняя строка не должна склеиться со следующей записью
+        needs_newline = False
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            with open(output_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+
+        with open(output_path, 'a', encoding='utf-8') as output:
+            if needs_newline:
+                output.write('\n')
+
+            async def produce() -> None:
+                for index, post in enumerate(read_posts(input_path, defaults), start=1):
+                    if post['id'] in completed:
+                        self.skipped += 1
+                        continue
+                    await posts.put((index, post))
+                for _ in range(self.concurrency):
+                    await posts.put(None)
+
+            async def work() -> None:
+                while (item := await posts.get()) is not None:
+                    record = await self.analyze(*item)
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    output.flush()
+                    if 'error' in record or record['failed_topics']:
+                        self.failed += 1
+                    else:
+                        self.analyzed += 1
+                    if (self.analyzed + self.failed) % 10 == 0:
+                        logger.info(
+                            'Проанализировано %s, с ошибками %s, %.1f постов/мин',
+                            self.analyzed, self.failed, self.posts_per_minute()
+                        )
+
+            try:
+                await asyncio.gather(produce(), *(work() for _ in range(self.concurrency)))
+            finally:
+                await self.llm.client_pool.close()
+        return self.stats()
+
+    def posts_per_minute(self) -> float:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return (self.analyzed + self.failed) / elapsed * 60 if elapsed else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить число обработанных постов, скорость и расход токенов."""
+        usage = self.model.usage.stats()
+        return {
+            'analyzed': self.analyzed,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'elapsed_s': round(time.monotonic() - self._started, 1) if self._started else 0.0,
+            'posts_per_minute': round(self.posts_per_minute(), 2),
+            'tokens': {
+                name: sum(model_usage[name] for model_usage in usage.values())
+                for name in ('prompt_tokens', 'cached_tokens', 'completion_tokens')
+            },
+            'usage': usage,
+            'model_tiers': self.llm.router.stats(),
+        }
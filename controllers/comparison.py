@@ -0,0 +1,46 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Длина фрагмента раздела каждой модели в сводке сравнения
+EXCERPT_LENGTH = 300
+
+
+@dataclass
+class ComparisonRun:
+    """Результат анализа поста одной моделью в режиме сравнения."""
+    model_name: str
+    seconds: float = 0.0
+    sections: Dict[int, str] = field(default_factory=dict)
+    usage: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def total_tokens(self, name: str) -> int:
+        """Получить расход токенов вида name по всем моделям запуска, включая модели служебных запросов."""
+        return sum(usage[name] for usage in self.usage.values())
+
+
+def _excerpt(section: str, beginning: str) -> str:
+    text = section[len(beginning):].strip() if section.startswith(beginning) else section
+    return text if len(text) <= EXCERPT_LENGTH else text[:EXCERPT_LENGTH].rstrip() + '…'
+
+
+def format_comparison(runs: List[ComparisonRun], beginnings: List[str]) -> List[str]:
+    """Собрать сводку сравнения: время и токены каждой модели, затем разделы моделей рядом по темам."""
+    lines = ['Сравнение моделей']
+    for run in runs:
+        if run.error is not None:
+            lines.append(f'{run.model_name}: ошибка ({run.error}), {run.seconds:.1f} с')
+            continue
+        prompt, completion = run.total_tokens('prompt_tokens'), run.total_tokens('completion_tokens')
+        lines.append(
+            f'{run.model_name}: {run.seconds:.1f} с, токены {prompt + completion} (вход {prompt}, выход {completion})'
+        )
+    blocks = ['\n'.join(lines)]
+    for index, beginning in enumerate(beginnings):
+        rows = [
+            f'• {run.model_name}: {_excerpt(run.sections[index], beginning)}'
+            for run in runs if index in run.sections
+        ]
+        if rows:
+            blocks.append('\n'.join([beginning, *rows]))
+    return blocks
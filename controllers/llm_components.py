@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from config import Config
+from models.audience_panel import AudiencePanel
+from models.base_model import BaseModel
+from models.client_pool import LLMClientPool
+from models.comment_pool import CommentPool
+from models.dialog_context import DialogContext
+from models.gemini_model import GeminiModel
+from models.llm_scheduler import LLMScheduler
+from models.model_router import ModelRouter
+from models.openai_model import OpenAIModel
+from models.relevance_gate import RelevanceGate
+from models.resilience import ResiliencePolicy
+from services.analysis_cache import AnalysisCache
+
+
+@dataclass
+class LLMComponents:
+    """Модели и общие для них компоненты: пул клиентов, кэш анализа, планировщик, политика повторов,
+    маршрутизация, запас комментариев и локальная оценка панели аудитории."""
+    client_pool: LLMClientPool
+    analysis_cache: AnalysisCache
+    dialog_context: DialogContext
+    relevance_gate: RelevanceGate
+    scheduler: LLMScheduler
+    resilience_policy: ResiliencePolicy
+    router: ModelRouter
+    comment_pool: Optional[CommentPool]
+    audience_panel: AudiencePanel
+    models: Dict[str, BaseModel]
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'LLMComponents':
+        """Создать модели и компоненты по конфигурации."""
+        client_pool = LLMClientPool(
+            config.PROXY_API_KEY,
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            http2=config.LLM_HTTP2
+        )
+        analysis_cache = AnalysisCache(
+            max_size=config.ANALYSIS_CACHE_SIZE,
+            ttl=config.ANALYSIS_CACHE_TTL,
+            directory=config.ANALYSIS_CACHE_DIR
+        )
+        dialog_context = DialogContext(
+            budgets=config.DIALOG_CONTEXT_BUDGETS,
+            default_budget=config.DIALOG_CONTEXT_BUDGET
+        )
+        relevance_gate = RelevanceGate(
+            accept_threshold=config.RELEVANCE_ACCEPT_THRESHOLD,
+            reject_threshold=config.RELEVANCE_REJECT_THRESHOLD,
+            cache_bytes=config.RELEVANCE_CACHE_MB * 2 ** 20
+        )
+        scheduler = LLMScheduler(
+            limits=config.RATE_LIMITS,
+            model_limits=config.MODEL_RATE_LIMITS
+        )
+        resilience_policy = ResiliencePolicy(
+            max_attempts=config.LLM_MAX_ATTEMPTS,
+            request_timeout=config.LLM_REQUEST_TIMEOUT,
+            analysis_deadline=config.ANALYSIS_DEADLINE,
+            hedge_enabled=config.LLM_HEDGING,
+            fallback_enabled=config.LLM_FALLBACK,
+            fallback_models=config.FALLBACK_MODELS
+        )
+        router = ModelRouter(
+            tiers=config.MODEL_TIERS,
+            routes=config.MODEL_ROUTES,
+            models=config.MODELS
+        )
+        # Размер партии 0 отключает запас: каждый комментарий генерируется по запросу
+        comment_pool = CommentPool(
+            batch_size=config.COMMENT_BATCH_SIZE,
+            low_water=config.COMMENT_LOW_WATER,
+            max_users=config.USER_CACHE_SIZE
+        ) if config.COMMENT_BATCH_SIZE > 0 else None
+        model_args = dict(
+            api_key=config.PROXY_API_KEY,
+            client_pool=client_pool,
+            analysis_cache=analysis_cache,
+            dialog_context=dialog_context,
+            relevance_gate=relevance_gate,
+            scheduler=scheduler,
+            policy=resilience_policy,
+            router=router,
+            comment_pool=comment_pool
+        )
+        models = {
+            'ChatGPT': OpenAIModel(**model_args),
+            'DeepSeek': OpenAIModel(**model_args),
+            'Gemini': GeminiModel(**model_args)
+        }
+        return cls(
+            client_pool, analysis_cache, dialog_context, relevance_gate, scheduler, resilience_policy, router,
+            comment_pool, AudiencePanel(), models
+        )
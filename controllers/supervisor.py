@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+from typing import List, Optional
+
+from telebot import asyncio_helper
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Сигнал воркеру завершить обработку и остановиться
+_STOP = None
+
+
+def get_update_user_id(raw_update: dict) -> Optional[int]:
+    """Получить идентификатор пользователя, от которого пришло обновление."""
+    for key, value in raw_update.items():
+        if key != 'update_id' and isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return value['from'].get('id')
+    return None
+
+
+def run_worker(index: int, updates: multiprocessing.Queue) -> None:
+    """Точка входа процесса-воркера."""
+    # Остановкой воркеров управляет супервизор; Ctrl+C в терминале воркер не прерывает
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s %(levelname)s worker-{index} %(name)s: %(message)s')
+    asyncio.run(_serve_worker(index, updates))
+
+
+async def _serve_worker(index: int, updates: multiprocessing.Queue) -> None:
+    """Обрабатывать обновления своей доли пользователей с собственными кэшами и соединениями."""
+    # Импорт внутри процесса, чтобы супервизор не создавал клиентов Telegram, Firebase и моделей
+    from config import config
+    from controllers.app_controller import AppController
+    from views.telegram_view import TelegramView
+
+    # Каждый воркер отдаёт свои метрики на отдельном порту
+    if config.METRICS_PORT:
+        config.METRICS_PORT += index
+    view = TelegramView(config.TELEGRAM_API_TOKEN, config.STREAM_EDIT_INTERVAL)
+    controller = AppController(view, config)
+    await controller.open()
+    # Порядок обновлений одного пользователя обеспечивают почтовые ящики представления
+    tasks: set = set()
+    # Необработанных обновлений в воркере не больше размера его очереди: пока мест нет,
+    # обновления остаются в очереди процесса, и при её заполнении супервизор отклоняет новые
+    slots = asyncio.Semaphore(config.WORKER_QUEUE_SIZE)
+    try:
+        while True:
+            await slots.acquire()
+            raw_update = await asyncio.to_thread(updates.get)
+            if raw_update is _STOP:
+                break
+            task = asyncio.create_task(view.process_update(raw_update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+        await view.mailboxes.close()
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        await controller.close()
+        logger.info('Воркер %s остановлен', index)
+
+
+class Supervisor:
+    """Запуск нескольких процессов-воркеров с распределением обновлений по пользователям.
+
+    Обновления одного пользователя всегда попадают в один воркер и обрабатываются по порядку,
+    поэтому кэш пользователей и буфер записи каждого воркера остаются согласованными.
+    """
+
+    def __init__(self, config: Config):
+        """Инициализация супервизора с числом воркеров из конфигурации."""
+        self.config = config
+        self.workers = config.WORKER_PROCESSES
+        self._context = multiprocessing.get_context('spawn')
+        self._queues: List[multiprocessing.Queue] = [
+            self._context.Queue(maxsize=config.WORKER_QUEUE_SIZE) for _ in range(self.workers)
+        ]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._stopping = False
+        self.restarts = 0
+
+    def shard(self, raw_update: dict) -> int:
+        """Получить номер воркера для обновления по идентификатору пользователя."""
+        user_id = get_update_user_id(raw_update)
+        key = user_id if user_id is not None else raw_update.get('update_id', 0)
+        return key % self.workers
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker, args=(index, self._queues[index]), name=f'worker-{index}', daemon=False
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info('Запущен воркер %s, pid=%s', index, process.pid)
+
+    def dispatch_nowait(self, raw_update: dict) -> bool:
+        """Передать обновление воркеру без ожидания; вернуть False, если его очередь заполнена."""
+        try:
+            self._queues[self.shard(raw_update)].put_nowait(raw_update)
+        except queue.Full:
+            return False
+        return True
+
+    async def dispatch(self, raw_update: dict) -> None:
+        """Передать обновление воркеру, дождавшись места в его очереди."""
+        await asyncio.to_thread(self._queues[self.shard(raw_update)].put, raw_update)
+
+    async def _watch(self) -> None:
+        """Перезапускать упавшие воркеры."""
+        while not self._stopping:
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(self._processes):
+                if not self._stopping and process is not None and not process.is_alive():
+                    logger.error('Воркер %s завершился с кодом %s, перезапуск', index, process.exitcode)
+                    self.restarts += 1
+                    self._spawn(index)
+
+    async def _poll(self) -> None:
+        """Получать обновления длинным опросом и распределять их по воркерам."""
+        offset = None
+        while True:
+            try:
+                updates = await asyncio_helper.get_updates(
+                    self.config.TELEGRAM_API_TOKEN, offset=offset, limit=100, timeout=20
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('Ошибка получения обновлений: %s', e)
+                await asyncio.sleep(1.0)
+                continue
+            for raw_update in updates:
+                offset = raw_update['update_id'] + 1
+                await self.dispatch(raw_update)
+
+    async def _serve_webhook(self) -> None:
+        """Принимать обновления через webhook и распределять их по воркерам."""
+        from telebot.async_telebot import AsyncTeleBot
+        from views.webhook_server import WebhookServer
+
+        supervisor = self
+
+        class ShardedWebhookServer(WebhookServer):
+            def enqueue(self, payload: str) -> bool:
+                raw_update = json.loads(payload)
+                if not isinstance(raw_update, dict):
+                    raise ValueError('Обновление должно быть JSON объектом')
+                return supervisor.dispatch_nowait(raw_update)
+
+        server = ShardedWebhookServer(
+            AsyncTeleBot(self.config.TELEGRAM_API_TOKEN),
+            self.config.WEBHOOK_SECRET,
+            path=self.config.WEBHOOK_PATH,
+            host=self.config.WEBHOOK_HOST,
+            port=self.config.WEBHOOK_PORT,
+            workers=0
+        )
+        await server.serve_forever(self.config.WEBHOOK_URL)
+
+    async def run(self) -> None:
+        """Запустить воркеры и приём обновлений; при остановке дождаться завершения воркеров."""
+        # SIGTERM от менеджера процессов завершает приём обновлений так же, как Ctrl+C
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        for index in range(self.workers):
+            self._spawn(index)
+        watcher = asyncio.create_task(self._watch())
+        try:
+            if self.config.INGEST_MODE == 'webhook':
+                await self._serve_webhook()
+            else:
+                await self._poll()
+        finally:
+            self._stopping = True
+            watcher.cancel()
+            await self.stop()
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Попросить воркеры дообработать очереди и завершиться; зависшие воркеры остановить."""
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                await asyncio.to_thread(self._queues[index].put, _STOP)
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.warning('Воркер %s не остановился за %.0fс, принудительное завершение', index, timeout)
+                process.terminate()
+                await asyncio.to_thread(process.join)
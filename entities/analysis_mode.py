@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class AnalysisMode(str, Enum):
+    """Способ анализа поста: несколько параллельных подзапросов или один общий запрос."""
+
+    MULTIPLE = 'multiple'
+    SINGLE = 'single'
@@ -1,12 +1,13 @@
 from dataclasses import dataclass, field
 from functools import wraps
-from typing import Dict, List, TYPE_CHECKING
+from typing import ClassVar, Dict, List, Tuple, TYPE_CHECKING
 
 from entities.analysis_data import AnalysisData
+from entities.analysis_mode import AnalysisMode
 from entities.states import RuntimeStates
 
 if TYPE_CHECKING:
-    from services.firebase_service import FirebaseService
+    from services.state_store import StateStore
 
 
 def auto_save(func):
@@ -22,6 +23,9 @@ def auto_save(func):
 @dataclass
 class User:
     """Класс для хранения данных пользователя и информации о сессии."""
+    # Поля с историей, которые хранятся отдельно от документа сессии
+    HISTORY_FIELDS: ClassVar[Tuple[str, ...]] = ('messages', 'comments')
+
     user_id: int
     model_type: str = 'ChatGPT'
     model_name: str = 'gpt-4.1-nano-2025-04-14'
@@ -30,16 +34,29 @@ class User:
     comments: list = field(default_factory=list)
     analysis_data: AnalysisData = field(default_factory=AnalysisData)
     state: str = RuntimeStates.state_none.name
-    _firebase_service: 'FirebaseService' = None
-
-    def set_firebase_service(self, service: 'FirebaseService') -> None:
-        """Установить сервис Firebase для автоматического сохранения."""
-        self._firebase_service = service
+    analysis_mode: str = AnalysisMode.MULTIPLE.value
+    history_epochs: Dict[str, int] = field(default_factory=lambda: {'messages': 0, 'comments': 0})
+    # Скользящее резюме первых context_summary_upto сообщений истории
+    context_summary: str = ''
+    context_summary_upto: int = 0
+    # Выбор пользователя для отдельных назначений запросов: назначение -> уровень или модель
+    model_overrides: Dict[str, str] = field(default_factory=dict)
+    # Версия документа сессии для оптимистичной блокировки при записи из нескольких процессов
+    version: int = 0
+    _store: 'StateStore' = None
+    # Сохранённая часть истории: поле -> (эпоха, число сохранённых записей)
+    _saved_history: Dict[str, Tuple[int, int]] = field(default_factory=dict, repr=False)
+    # Порядковый номер первой загруженной записи истории: более ранние записи читаются из хранилища по запросу
+    _history_offsets: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    def set_store(self, store: 'StateStore') -> None:
+        """Установить хранилище для автоматического сохранения."""
+        self._store = store
 
     async def save(self) -> None:
-        """Сохранить пользователя в Firebase."""
-        if hasattr(self, '_firebase_service'):
-            await self._firebase_service.save_user(self)
+        """Сохранить пользователя в хранилище, если оно задано."""
+        if self._store is not None:
+            await self._store.save_user(self)
 
     @auto_save
     async def add_message(self, role: str, content: str) -> None:
@@ -51,17 +68,83 @@ class User:
         """Добавить комментарий."""
         self.comments.append(comment)
 
+    def _reset_history(self, name: str) -> None:
+        """Очистить историю и начать новую эпоху, чтобы не удалять старые записи синхронно."""
+        setattr(self, name, [])
+        self.history_epochs[name] = self.history_epochs.get(name, 0) + 1
+        self._history_offsets.pop(name, None)
+        if name == 'messages':
+            self.context_summary = ''
+            self.context_summary_upto = 0
+
+    def history_offset(self, name: str) -> int:
+        """Получить порядковый номер первой загруженной записи истории; список поля name начинается с неё."""
+        return self._history_offsets.get(name, 0)
+
+    def history_count(self, name: str) -> int:
+        """Получить число записей истории текущей эпохи, включая не загруженные."""
+        return self.history_offset(name) + len(getattr(self, name))
+
+    def set_loaded_history(self, name: str, epoch: int, start: int, items: list) -> None:
+        """Установить загруженные из хранилища записи истории эпохи epoch, начиная с записи номер start."""
+        setattr(self, name, items)
+        self._history_offsets[name] = start
+        self.mark_history_saved(name, epoch, start + len(items))
+
+    def get_unsaved_history(self, name: str) -> Tuple[int, int, list]:
+        """Получить эпоху, порядковый номер первой несохранённой записи и сами несохранённые записи."""
+        epoch = self.history_epochs.get(name, 0)
+        saved_epoch, saved_count = self._saved_history.get(name, (epoch, 0))
+        start = saved_count if saved_epoch == epoch else 0
+        return epoch, start, getattr(self, name)[start - self.history_offset(name):]
+
+    def mark_history_saved(self, name: str, epoch: int, count: int) -> None:
+        """Отметить, что первые count записей истории эпохи epoch сохранены."""
+        if self.history_epochs.get(name, 0) == epoch:
+            self._saved_history[name] = (epoch, count)
+
+    def rebase(self, stored: 'User') -> None:
+        """Перенести несохранённые изменения на данные, записанные другим процессом.
+
+        Несохранённые записи истории дописываются после сохранённых, а история, сброшенная
+        в этом процессе, начинает эпоху после сохранённой. Поля сессии сохраняют значения этого процесса.
+        """
+        for name in self.HISTORY_FIELDS:
+            epoch, _, items = self.get_unsaved_history(name)
+            saved_epoch = self._saved_history.get(name, (epoch, 0))[0]
+            stored_epoch = stored.history_epochs.get(name, 0)
+            stored_items = getattr(stored, name)
+            if saved_epoch != epoch:
+                self.history_epochs[name] = max(epoch, stored_epoch + 1)
+                getattr(self, name)[:] = items
+            else:
+                self.history_epochs[name] = stored_epoch
+                getattr(self, name)[:] = [*stored_items, *items]
+                self._history_offsets[name] = stored.history_offset(name)
+                if name == 'messages':
+                    # Резюме относится к сохранённому началу истории, которое теперь взято из хранилища
+                    self.context_summary = stored.context_summary
+                    self.context_summary_upto = stored.context_summary_upto
+            self._saved_history[name] = (stored_epoch, stored.history_count(name))
+        self.version = stored.version
+
     @auto_save
     async def clear(self) -> None:
         """Очистить историю сообщений пользователя."""
-        self.messages = []
-        self.comments = []
+        self._reset_history('messages')
+        self._reset_history('comments')
         self.analysis_data = AnalysisData()
         self.state = RuntimeStates.state_none.name
 
     @auto_save
     async def clear_messages(self) -> None:
-        self.messages = []
+        self._reset_history('messages')
+
+    @auto_save
+    async def set_context_summary(self, summary: str, upto: int) -> None:
+        """Установить резюме первых upto сообщений истории."""
+        self.context_summary = summary
+        self.context_summary_upto = upto
 
     @auto_save
     async def update_model(self, model_type: str, model_name: str, base_url: str) -> None:
@@ -70,6 +153,21 @@ class User:
         self.model_name = model_name
         self.base_url = base_url
 
+    @auto_save
+    async def set_model_override(self, purpose: str, choice: str = None) -> None:
+        """Назначить уровень или модель для запросов с указанным назначением; None возвращает общую настройку."""
+        if choice is None:
+            self.model_overrides.pop(purpose, None)
+        else:
+            self.model_overrides[purpose] = choice
+
+    @auto_save
+    async def switch_analysis_mode(self) -> AnalysisMode:
+        """Переключить способ анализа между одним общим запросом и подзапросами."""
+        mode = AnalysisMode.SINGLE if self.analysis_mode == AnalysisMode.MULTIPLE.value else AnalysisMode.MULTIPLE
+        self.analysis_mode = mode.value
+        return mode
+
     @auto_save
     async def set_analysis_field(self, field: str, value: str) -> None:
         """Установить значение конкретного поля в данных анализа."""
@@ -84,17 +182,31 @@ class User:
         """Получить текущее состояние пользователя."""
         return getattr(RuntimeStates, self.state.split(':')[-1])
 
-    def to_dict(self) -> dict:
-        """Преобразовать объект пользователя в словарь для сохранения."""
+    def to_session_dict(self) -> dict:
+        """Преобразовать данные сессии пользователя в словарь без истории."""
         return {
             'user_id': self.user_id,
             'model_type': self.model_type,
             'model_name': self.model_name,
             'base_url': self.base_url,
-            'messages': self.messages,
-            'comments': self.comments,
             'analysis_data': self.analysis_data.to_dict(),
-            'state': self.state
+            'state': self.state,
+            'analysis_mode': self.analysis_mode,
+            'history_epochs': dict(self.history_epochs),
+            'context_summary': self.context_summary,
+            'context_summary_upto': self.context_summary_upto,
+            'model_overrides': dict(self.model_overrides),
+            # Число записей истории позволяет загружать только последние записи
+            'history_counts': {name: self.history_count(name) for name in self.HISTORY_FIELDS},
+            'version': self.version
+        }
+
+    def to_dict(self) -> dict:
+        """Преобразовать объект пользователя в словарь для сохранения."""
+        return {
+            **self.to_session_dict(),
+            'messages': self.messages,
+            'comments': self.comments
         }
 
     @staticmethod
@@ -108,6 +220,12 @@ class User:
             messages=data.get('messages', []),
             comments=data.get('comments', []),
             analysis_data=AnalysisData.from_dict(data.get('analysis_data', {})),
-            state=data.get('state', RuntimeStates.state_none.name)
+            state=data.get('state', RuntimeStates.state_none.name),
+            analysis_mode=data.get('analysis_mode', AnalysisMode.MULTIPLE.value),
+            history_epochs={'messages': 0, 'comments': 0, **data.get('history_epochs', {})},
+            context_summary=data.get('context_summary', ''),
+            context_summary_upto=data.get('context_summary_upto', 0),
+            model_overrides=dict(data.get('model_overrides', {})),
+            version=data.get('version', 0)
         )
 
@@ -1,13 +1,24 @@
 from views.telegram_view import TelegramView
 from controllers.app_controller import AppController
+from controllers.supervisor import Supervisor
 from config import config
 import asyncio
+import logging
+import sys
 
 async def main():
 	
-	view = TelegramView(config.TELEGRAM_API_TOKEN)
+	if config.WORKER_PROCESSES > 0 and '--migrate-users' not in sys.argv:
+		await Supervisor(config).run()
+		return
+	view = TelegramView(config.TELEGRAM_API_TOKEN, config.STREAM_EDIT_INTERVAL)
 	controller = AppController(view, config)
+	if '--migrate-users' in sys.argv:
+		migrated = await controller.migrate_users()
+		print(f'Перенесена история пользователей: {migrated}')
+		return
 	await controller.start()
 
 if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 	asyncio.run(main())
\ No newline at end of file
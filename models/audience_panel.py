@@ -0,0 +1,183 @@
+import logging
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Слова с весом тональности; формы перечислены явно, так как слова сравниваются по началу длиной STEM_LENGTH
+SENTIMENT_LEXICON = {
+    **dict.fromkeys([
+        'хорошо', 'хороший', 'хорошая', 'хорошие', 'отлично', 'отличный', 'прекрасно', 'прекрасный',
+        'замечательно', 'замечательный', 'классно', 'класс', 'круто', 'крутой', 'супер', 'здорово',
+        'нравится', 'нравятся', 'понравилось', 'люблю', 'любимый', 'обожаю', 'рад', 'рада', 'радует',
+        'приятно', 'восторг', 'восхитительно', 'вдохновляет', 'полезно', 'полезный', 'спасибо',
+        'благодарю', 'браво', 'молодец', 'молодцы', 'ура', 'лучший', 'лучшее', 'красиво', 'красивый',
+        'удобно', 'смешно', 'надежда', '❤', '😍', '😂', '👍', '🔥', '👏',
+    ], 1.0),
+    **dict.fromkeys(['интересно', 'интересный', 'неплохо', 'любопытно', 'согласен', 'согласна'], 0.5),
+    **dict.fromkeys([
+        'плохо', 'плохой', 'плохая', 'ужас', 'ужасно', 'ужасный', 'кошмар', 'отвратительно', 'отвратительный',
+        'грустно', 'печально', 'страшно', 'страшный', 'обидно', 'злит', 'бесит', 'раздражает', 'возмутительно',
+        'позор', 'стыдно', 'разочарован', 'разочарована', 'разочарование', 'скучно', 'скучный', 'бред', 'чушь',
+        'ерунда', 'глупо', 'глупость', 'опасно', 'беда', 'жесть', 'худший', 'надоело', 'достали', 'ненавижу',
+        '😡', '😢', '😭', '👎', '😱', '🤮',
+    ], -1.0),
+    **dict.fromkeys(['жаль', 'хуже', 'тревожно', 'тревога', 'сомнительно', 'странно'], -0.5),
+}
+
+# Слова, выражающие согласие (+) или несогласие (-) с автором поста
+STANCE_LEXICON = {
+    **dict.fromkeys([
+        'согласен', 'согласна', 'поддерживаю', 'верно', 'правильно', 'точно', 'именно', 'правда', 'подписываюсь',
+        'спасибо', 'браво', 'молодец', 'молодцы', 'полезно', 'полезный', '👍', '👏',
+    ], 1.0),
+    **dict.fromkeys([
+        'бред', 'чушь', 'ерунда', 'неправда', 'враньё', 'вранье', 'ложь', 'сомневаюсь', 'сомнительно',
+        'манипуляция', 'кликбейт', 'позор', 'зачем', 'непонятно', '👎',
+    ], -1.0),
+}
+
+# Слова, меняющие знак следующего слова
+NEGATIONS = ['не', 'нет', 'ни', 'никогда', 'вовсе']
+
+# Частые слова, которые не считаются темами
+STOPWORDS = [
+    'комментарий', 'это', 'этот', 'эта', 'эти', 'этого', 'того', 'тоже', 'также', 'только', 'когда', 'если',
+    'чтобы', 'потому', 'очень', 'просто', 'всех', 'всем', 'всего', 'ещё', 'еще', 'уже', 'было', 'будет',
+    'есть', 'быть', 'может', 'можно', 'нужно', 'надо', 'сейчас', 'теперь', 'такой', 'такие', 'какой',
+    'какие', 'который', 'которые', 'почему', 'вообще', 'кажется', 'думаю', 'наконец', 'снова', 'опять',
+    'свой', 'свои', 'своих', 'меня', 'мне', 'нас', 'нам', 'они', 'оно', 'она', 'него', 'неё', 'пост', 'посте',
+]
+
+
+@dataclass
+class PanelReport:
+    """Распределения тональности и позиции в выборке комментариев аудитории."""
+    size: int
+    sentiment: Dict[str, float]
+    stance: Dict[str, float]
+    mean_sentiment: float
+    controversy: float
+    themes: List[Tuple[str, int]]
+    examples: Dict[str, str]
+    scoring_ms: float
+
+
+class AudiencePanel:
+    """Локальная оценка выборки комментариев: словарная тональность и позиция на хэшированных основах слов.
+
+    Все комментарии выборки оцениваются одним проходом векторных операций NumPy,
+    поэтому оценка занимает миллисекунды и стоимость панели определяется только генерацией.
+    """
+
+    TOKEN_PATTERN = re.compile(r'\w+|[\u2600-\u27BF\U0001F300-\U0001FAFF]', re.UNICODE)
+    # Слова сравниваются по началу этой длины, что грубо объединяет формы одного слова
+    STEM_LENGTH = 6
+    # Комментарий нейтрален, если модуль его суммарного веса меньше порога
+    NEUTRAL_MARGIN = 0.5
+    # Темы короче этой длины не учитываются
+    MIN_THEME_LENGTH = 4
+
+    def __init__(self, dimensions: int = 2 ** 18, themes: int = 5):
+        """Инициализация векторов весов словарей в пространстве хэшированных основ."""
+        self.dimensions = dimensions
+        self.themes = themes
+        self._sentiment = self._weights(SENTIMENT_LEXICON)
+        self._stance = self._weights(STANCE_LEXICON)
+        self._negations = self._mask(NEGATIONS)
+        # Слова словарей и служебные слова не считаются темами
+        self._not_themes = self._mask(STOPWORDS) | self._mask(NEGATIONS) | (self._sentiment != 0) | (self._stance != 0)
+
+    def _stem_id(self, word: str) -> int:
+        return zlib.crc32(word[:self.STEM_LENGTH].encode('utf-8')) % self.dimensions
+
+    def _weights(self, lexicon: Dict[str, float]) -> np.ndarray:
+        weights = np.zeros(self.dimensions, dtype=np.float32)
+        for word, weight in lexicon.items():
+            weights[self._stem_id(word)] = weight
+        return weights
+
+    def _mask(self, words: List[str]) -> np.ndarray:
+        mask = np.zeros(self.dimensions, dtype=bool)
+        mask[[self._stem_id(word) for word in words]] = True
+        return mask
+
+    def _tokenize(self, comments: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[int, str]]:
+        """Получить номера комментариев, хэши основ и длины всех слов выборки и пример слова для каждой основы."""
+        rows, ids, lengths = [], [], []
+        surfaces: Dict[int, str] = {}
+        # Слова в выборке часто повторяются, поэтому хэш каждого слова считается один раз
+        stem_ids: Dict[str, int] = {}
+        for row, comment in enumerate(comments):
+            for word in self.TOKEN_PATTERN.findall(comment.lower()):
+                stem_id = stem_ids.get(word)
+                if stem_id is None:
+                    stem_id = stem_ids[word] = self._stem_id(word)
+                    surfaces.setdefault(stem_id, word)
+                rows.append(row)
+                ids.append(stem_id)
+                lengths.append(len(word))
+        return (
+            np.array(rows, dtype=np.int64),
+            np.array(ids, dtype=np.int64),
+            np.array(lengths, dtype=np.int64),
+            surfaces
+        )
+
+    @staticmethod
+    def _shares(scores: np.ndarray, margin: float, labels: Tuple[str, str, str]) -> Tuple[Dict[str, float], np.ndarray]:
+        """Получить доли положительных, нейтральных и отрицательных оценок и класс каждой (1, 0, -1)."""
+        classes = np.where(scores >= margin, 1, np.where(scores <= -margin, -1, 0))
+        counts = np.bincount(classes + 1, minlength=3) / max(len(scores), 1)
+        return {labels[0]: float(counts[2]), labels[1]: float(counts[1]), labels[2]: float(counts[0])}, classes
+
+    def score(self, comments: List[str]) -> PanelReport:
+        """Оценить выборку комментариев и получить распределения тональности, позиции и повторяющиеся темы."""
+        started = time.perf_counter()
+        size = len(comments)
+        rows, ids, lengths, surfaces = self._tokenize(comments)
+
+        # Отрицание меняет знак следующего слова того же комментария
+        sign = np.ones(len(ids), dtype=np.float32)
+        if len(ids) > 1:
+            negated = self._negations[ids[:-1]] & (rows[:-1] == rows[1:])
+            sign[1:][negated] = -1.0
+        sentiment = np.bincount(rows, weights=self._sentiment[ids] * sign, minlength=size)
+        stance = np.bincount(rows, weights=self._stance[ids] * sign, minlength=size)
+
+        sentiment_shares, classes = self._shares(sentiment, self.NEUTRAL_MARGIN, ('positive', 'neutral', 'negative'))
+        stance_shares, _ = self._shares(stance, self.NEUTRAL_MARGIN, ('support', 'unclear', 'oppose'))
+        # 0 - единодушие, 1 - аудитория поровну разделилась на позитивные и негативные отклики
+        controversy = 2 * min(sentiment_shares['positive'], sentiment_shares['negative'])
+
+        # Тема - основа, встречающаяся в нескольких комментариях; повторы внутри комментария не учитываются
+        candidates = ~self._not_themes[ids] & (lengths >= self.MIN_THEME_LENGTH)
+        pairs = np.unique(rows[candidates] * self.dimensions + ids[candidates])
+        stems, frequency = np.unique(pairs % self.dimensions, return_counts=True)
+        top = np.argsort(-frequency, kind='stable')[:self.themes]
+        themes = [(surfaces[int(stems[index])], int(frequency[index])) for index in top if frequency[index] >= 2]
+
+        examples = {}
+        if size:
+            if classes.max() > 0:
+                examples['positive'] = comments[int(np.argmax(sentiment))]
+            if classes.min() < 0:
+                examples['negative'] = comments[int(np.argmin(sentiment))]
+
+        scoring_ms = (time.perf_counter() - started) * 1000
+        logger.info('Оценка панели аудитории: comments=%s time=%.2fms', size, scoring_ms)
+        return PanelReport(
+            size=size,
+            sentiment=sentiment_shares,
+            stance=stance_shares,
+            mean_sentiment=float(np.tanh(sentiment).mean()) if size else 0.0,
+            controversy=controversy,
+            themes=themes,
+            examples=examples,
+            scoring_ms=scoring_ms
+        )
@@ -1,131 +1,658 @@
 import asyncio
+import logging
+import re
+import time
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, TYPE_CHECKING
 
+from entities.analysis_mode import AnalysisMode
+from models.comment_pool import CommentPool
+from models.dialog_context import DialogContext
+from models.errors import LLMDeadlineExceeded, LLMError, LLMTimeoutError, LLMTransientError
+from models.llm_response import LLMResponse, TokenUsage, record_usage
+from models.llm_scheduler import LLMScheduler, Priority
+from models.model_router import FALLBACK_TIER, ModelRouter, Purpose, Route
 from models.prompt_templates import PromptTemplates
+from models.relevance_gate import RelevanceDecision, RelevanceGate
+from models.resilience import Deadline, LatencyTracker, ResiliencePolicy
+from services.metrics import metrics
 
 if TYPE_CHECKING:
+    from entities.analysis_data import AnalysisData
     from entities.user import User
+    from models.client_pool import LLMClientPool
+    from services.analysis_cache import AnalysisCache
+
+logger = logging.getLogger(__name__)
+
+# Обработчик готового раздела анализа: индекс раздела и его текст
+SectionCallback = Callable[[int, str], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class AnalysisPrompts:
+    """Промпты анализа поста; собираются один раз и могут использоваться несколькими моделями."""
+    topic_prompts: List[str]
+    topics: List[str]
+    beginnings: List[str]
+    single_prompt: str
+
+    @classmethod
+    def build(cls, analysis_data: 'AnalysisData') -> 'AnalysisPrompts':
+        topic_prompts, topics, beginnings = PromptTemplates.audience_reaction(analysis_data)
+        return cls(topic_prompts, topics, beginnings, PromptTemplates.audience_reaction_single(analysis_data))
 
 
 class BaseModel(ABC):
     """Базовый класс для LLM моделей."""
 
-    def __init__(self, api_key: str):
+    # Параметры генерации этапов анализа; входят в ключ кэша результатов
+    ANALYSIS_PARAMS = dict(max_tokens=700, temperature=0.1, frequency_penalty=0.0, presence_penalty=0.0)
+    SUMMARY_PARAMS = dict(max_tokens=150, temperature=0.4, frequency_penalty=0.4, presence_penalty=0.2)
+    SINGLE_PARAMS = dict(max_tokens=900, temperature=0.1, frequency_penalty=0.0, presence_penalty=0.0)
+    # Параметры генерации одного комментария; для партии max_tokens умножается на число комментариев
+    COMMENT_PARAMS = dict(max_tokens=100, temperature=0.5, frequency_penalty=0.4, presence_penalty=0.2)
+    # Сколько последних комментариев передаётся модели, чтобы новые не повторяли их
+    COMMENT_HISTORY = 5
+    # Панель аудитории генерируется с большей случайностью, чтобы выборка была разнообразнее
+    PANEL_PARAMS = dict(temperature=0.9, presence_penalty=0.6)
+    # Сообщение пользователю, если модель не ответила; в историю не сохраняется
+    ERROR_MESSAGE = 'Не удалось получить ответ модели, попробуйте позже.'
+    # Текст раздела темы, по которой модель не ответила в срок
+    TOPIC_FAILED = '{beginning} не удалось получить ответ модели.'
+
+    def __init__(self,
+                 api_key: str,
+                 client_pool: 'LLMClientPool',
+                 analysis_cache: 'AnalysisCache' = None,
+                 dialog_context: DialogContext = None,
+                 relevance_gate: RelevanceGate = None,
+                 scheduler: LLMScheduler = None,
+                 policy: ResiliencePolicy = None,
+                 router: ModelRouter = None,
+                 comment_pool: CommentPool = None):
         """Инициализация базовых параметров модели."""
         self.api_key = api_key
+        self.client_pool = client_pool
+        self.analysis_cache = analysis_cache
+        self.dialog_context = dialog_context or DialogContext()
+        self.relevance_gate = relevance_gate or RelevanceGate()
+        self.scheduler = scheduler or LLMScheduler()
+        self.policy = policy or ResiliencePolicy()
+        self.router = router or ModelRouter()
+        self.comment_pool = comment_pool
+        self.latency = LatencyTracker()
+        self.usage = TokenUsage()
         self.max_tokens = 1000
         self.temperature = 0.5
         self.frequency_penalty = 0.3
         self.presence_penalty = 0.2
 
     @abstractmethod
-    async def _get_response(self, 
-                          user: 'User',
-                          max_tokens: int = None, 
-                          temperature: float = None, 
-                          frequency_penalty: float = None, 
-                          presence_penalty: float = None, 
-                          messages: list = None) -> str:
-        """Получить ответ от модели"""
+    async def _request(self,
+                       user: 'User',
+                       max_tokens: int = None,
+                       temperature: float = None,
+                       frequency_penalty: float = None,
+                       presence_penalty: float = None,
+                       messages: list = None,
+                       model: str = None) -> LLMResponse:
+        """Выполнить запрос к API модели; model заменяет модель пользователя"""
         pass
 
-    async def _get_multiple_responses(self, 
-                                      user: 'User', 
-                                      max_tokens: int = None, 
-                                      temperature: float = None, 
-                                      frequency_penalty: float = None, 
-                                      presence_penalty: float = None, 
-                                      messages: list = None) -> list:
-        """Параллельно получить ответы на список сообщений"""
-        responses = await asyncio.gather(*[
-            self._get_response(
-                user=user,
-                messages=[{"role": "user", "content": text}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                frequency_penalty=frequency_penalty,
-                presence_penalty=presence_penalty
-            ) for text in messages
-        ])
-
-        for text, reply in zip(messages, responses):
-            await user.add_message("user", text)
-            await user.add_message("assistant", reply)
+    @abstractmethod
+    def _stream_request(self,
+                        user: 'User',
+                        max_tokens: int = None,
+                        temperature: float = None,
+                        frequency_penalty: float = None,
+                        presence_penalty: float = None,
+                        messages: list = None,
+                        model: str = None,
+                        usage: LLMResponse = None) -> AsyncIterator[str]:
+        """Выполнить потоковый запрос к API модели; model заменяет модель пользователя.
+
+        Расход токенов из последней части ответа записывается в usage.
+        """
+        pass
+
+    def _estimate_tokens(self, messages: list, max_tokens: int = None) -> int:
+        """Оценить расход токенов запроса для ограничения частоты до получения ответа."""
+        counter = self.dialog_context.counter
+        return sum(counter.count_message(message) for message in messages) + (max_tokens or self.max_tokens)
+
+    def _candidate_models(self, model_name: str) -> List[str]:
+        """Получить основную модель и резервные модели того же провайдера."""
+        if not self.policy.fallback_enabled:
+            return [model_name]
+        return [model_name, *self.policy.fallback_models.get(model_name, [])]
+
+    def _hedge_delay(self, model_name: str) -> Optional[float]:
+        """Получить задержку, после которой отправляется дублирующий запрос, или None без дублирования."""
+        if not self.policy.hedge_enabled:
+            return None
+        latency = self.latency.percentile(model_name, self.policy.hedge_quantile)
+        if latency is None:
+            return None
+        return max(latency, self.policy.hedge_min_delay)
+
+    async def _get_response(self, user: 'User', **params) -> str:
+        """Получить текст ответа модели, выбранной по назначению запроса; параметры как у _complete"""
+        return (await self._complete(user, **params)).text
+
+    async def _complete(self,
+                        user: 'User',
+                        max_tokens: int = None,
+                        temperature: float = None,
+                        frequency_penalty: float = None,
+                        presence_penalty: float = None,
+                        messages: list = None,
+                        priority: Priority = Priority.INTERACTIVE,
+                        deadline: Deadline = None,
+                        purpose: Purpose = Purpose.DIALOG) -> LLMResponse:
+        """Получить ответ модели, выбранной по назначению запроса, с повторами, дублированием и резервными моделями.
+
+        В поле model ответа указана модель, которая действительно ответила.
+        """
+        params = dict(
+            max_tokens=max_tokens,
+            temperature=temperature,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+            messages=messages or user.messages
+        )
+        deadline = deadline or Deadline.after(self.policy.request_timeout * self.policy.max_attempts)
+        route = self.router.route(user, purpose)
+        started = time.monotonic()
+        error = None
+        for model_name in self._candidate_models(route.model):
+            try:
+                response = await self._get_response_with_retries(user, model_name, params, priority, deadline)
+            except LLMTransientError as e:
+                error = e
+                metrics.inc('llm_model_failures', model=model_name)
+                logger.warning('Модель %s недоступна: %s', model_name, e)
+            else:
+                if model_name != route.model:
+                    # Ответ резервной модели не учитывается в статистике уровня основной
+                    route = Route(route.purpose, FALLBACK_TIER, model_name)
+                self.router.record(route, time.monotonic() - started, response)
+                return response
+        raise error
+
+    async def _get_response_with_retries(self,
+                                         user: 'User',
+                                         model_name: str,
+                                         params: dict,
+                                         priority: Priority,
+                                         deadline: Deadline) -> LLMResponse:
+        """Повторять запрос к модели при временных ошибках с экспоненциальной паузой в пределах срока."""
+        for attempt in range(self.policy.max_attempts):
+            try:
+                return await self._hedged_request(user, model_name, params, priority, deadline)
+            except LLMTransientError as e:
+                pause = self.policy.backoff(attempt)
+                if attempt + 1 >= self.policy.max_attempts or deadline.remaining() <= pause:
+                    raise
+                metrics.inc('llm_retries', model=model_name)
+                logger.info('Повтор запроса к %s через %.1fс после ошибки: %s', model_name, pause, e)
+                await asyncio.sleep(pause)
+
+    async def _hedged_request(self,
+                              user: 'User',
+                              model_name: str,
+                              params: dict,
+                              priority: Priority,
+                              deadline: Deadline) -> LLMResponse:
+        """Выполнить запрос; если ответ задерживается дольше обычного, отправить дублирующий и взять первый."""
+        hedge_delay = self._hedge_delay(model_name)
+        if hedge_delay is None:
+            return await self._scheduled_request(user, model_name, params, priority, deadline)
+        tasks = [asyncio.create_task(self._scheduled_request(user, model_name, params, priority, deadline))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and deadline.remaining() > 0:
+                metrics.inc('llm_hedges', model=model_name)
+                logger.info('Дублирующий запрос к %s после %.1fс ожидания', model_name, hedge_delay)
+                tasks.append(asyncio.create_task(self._scheduled_request(user, model_name, params, priority, deadline)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Все запросы завершились ошибкой: выбрасывается ошибка основного запроса
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _scheduled_request(self,
+                                 user: 'User',
+                                 model_name: str,
+                                 params: dict,
+                                 priority: Priority,
+                                 deadline: Deadline) -> LLMResponse:
+        """Выполнить один запрос через общий планировщик; ожидание в очереди тоже ограничено сроком."""
+        try:
+            return await asyncio.wait_for(
+                self._timed_request(user, model_name, params, priority, deadline),
+                deadline.check()
+            )
+        except asyncio.TimeoutError:
+            raise LLMDeadlineExceeded(f'Истекло время, отведённое на запрос к {model_name}')
+
+    async def _timed_request(self,
+                             user: 'User',
+                             model_name: str,
+                             params: dict,
+                             priority: Priority,
+                             deadline: Deadline) -> LLMResponse:
+        """Выполнить запрос в выданном планировщиком слоте с ограничением времени ответа."""
+        queued = time.monotonic()
+        async with self.scheduler.slot(
+            user.model_type, model_name, user.user_id, priority,
+            self._estimate_tokens(params['messages'], params['max_tokens'])
+        ) as slot:
+            started = time.monotonic()
+            metrics.observe('llm_queue_seconds', started - queued, provider=user.model_type, model=model_name)
+            try:
+                with metrics.span('llm_request', provider=user.model_type, model=model_name):
+                    response = await asyncio.wait_for(
+                        self._request(user=user, model=model_name, **params),
+                        min(deadline.check(), self.policy.request_timeout)
+                    )
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f'Модель {model_name} не ответила вовремя')
+            response.model = model_name
+            self.latency.record(model_name, time.monotonic() - started)
+            self._record_usage(model_name, response, slot)
+        return response
+
+    def _record_usage(self, model_name: str, response: LLMResponse, slot) -> None:
+        """Учесть расход токенов ответа в статистике модели, блоке track_usage, слоте планировщика и метриках."""
+        self.usage.record(model_name, response)
+        record_usage(model_name, response)
+        slot.record_usage(response.total_tokens)
+        metrics.inc('llm_tokens', response.prompt_tokens, model=model_name, kind='prompt')
+        metrics.inc('llm_tokens', response.cached_tokens, model=model_name, kind='cached')
+        metrics.inc('llm_tokens', response.completion_tokens, model=model_name, kind='completion')
+        logger.debug(
+            'Ответ %s: prompt=%s cached=%s completion=%s',
+            model_name, response.prompt_tokens, response.cached_tokens, response.completion_tokens
+        )
+
+    async def _stream_response(self,
+                               user: 'User',
+                               max_tokens: int = None,
+                               temperature: float = None,
+                               frequency_penalty: float = None,
+                               presence_penalty: float = None,
+                               messages: list = None,
+                               priority: Priority = Priority.INTERACTIVE,
+                               deadline: Deadline = None,
+                               purpose: Purpose = Purpose.DIALOG) -> AsyncIterator[str]:
+        """Получить ответ от модели по частям; запрос повторяется, только пока не получена первая часть"""
+        messages = messages or user.messages
+        deadline = deadline or Deadline.after(self.policy.request_timeout * self.policy.max_attempts)
+        route = self.router.route(user, purpose)
+        model_name = route.model
+        stream_started = time.monotonic()
+        for attempt in range(self.policy.max_attempts):
+            started = False
+            queued = time.monotonic()
+            try:
+                async with self.scheduler.slot(
+                    user.model_type, model_name, user.user_id, priority,
+                    self._estimate_tokens(messages, max_tokens)
+                ) as slot:
+                    requested = time.monotonic()
+                    metrics.observe('llm_queue_seconds', requested - queued, provider=user.model_type, model=model_name)
+                    usage = LLMResponse(text='', model=model_name)
+                    stream = self._stream_request(
+                        user=user,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        frequency_penalty=frequency_penalty,
+                        presence_penalty=presence_penalty,
+                        messages=messages,
+                        model=model_name,
+                        usage=usage
+                    )
+                    try:
+                        while True:
+                            # До первой части действует общий срок, после - только ограничение на паузу в потоке
+                            timeout = self.policy.request_timeout
+                            if not started:
+                                timeout = min(deadline.check(), timeout)
+                            try:
+                                chunk = await asyncio.wait_for(anext(stream), timeout)
+                            except StopAsyncIteration:
+                                self._record_usage(model_name, usage, slot)
+                                self.router.record(route, time.monotonic() - stream_started, usage)
+                                return
+                            except asyncio.TimeoutError:
+                                raise LLMTimeoutError(f'Модель {model_name} перестала отвечать')
+                            if not started:
+                                metrics.observe(
+                                    'llm_first_chunk_seconds', time.monotonic() - requested,
+                                    provider=user.model_type, model=model_name
+                                )
+                            started = True
+                            yield chunk
+                    finally:
+                        await stream.aclose()
+            except LLMTransientError as e:
+                pause = self.policy.backoff(attempt)
+                if started or attempt + 1 >= self.policy.max_attempts or deadline.remaining() <= pause:
+                    raise
+                logger.info('Повтор потокового запроса к %s через %.1fс после ошибки: %s', model_name, pause, e)
+                await asyncio.sleep(pause)
 
-        return responses
-    
     async def generate_comment(self, user: 'User') -> str:
+        """Сгенерировать комментарий от лица аудитории поста."""
+        return ''.join([chunk async for chunk in self.stream_comment(user)])
+
+    async def stream_comment(self, user: 'User') -> AsyncIterator[str]:
+        """Сгенерировать комментарий от лица аудитории поста по частям."""
         input_text = PromptTemplates.comment_response(user.analysis_data)
         messages = [{"role": "user", "content": input_text},
-                    *[{"role": "assistant", "content": comment} for comment in user.comments],
+                    *[{"role": "assistant", "content": comment} for comment in user.comments[-self.COMMENT_HISTORY:]],
                     {"role": "user", "content": "Сгенерируй комментарий, он может отличаться по тональности от предыдущих"}]
+        chunks = []
+        try:
+            async for chunk in self._stream_response(
+                user=user,
+                messages=messages,
+                purpose=Purpose.COMMENT,
+                **self.COMMENT_PARAMS
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except LLMError as e:
+            logger.warning('Не удалось сгенерировать комментарий: user=%s error=%s', user.user_id, e)
+            yield self.ERROR_MESSAGE
+            return
+        await user.add_comment(''.join(chunks))
+
+    async def generate_comments(self,
+                                user: 'User',
+                                count: int,
+                                previous: List[str] = None,
+                                **params) -> List[str]:
+        """Сгенерировать несколько разных комментариев к посту одним запросом; params заменяют COMMENT_PARAMS."""
+        previous = user.comments[-self.COMMENT_HISTORY:] if previous is None else previous
+        prompt = PromptTemplates.comment_batch(user.analysis_data, count, previous)
         response = await self._get_response(
             user=user,
-            messages=messages,
-            max_tokens=100,
-            temperature=0.5,
-            frequency_penalty=0.4,
-            presence_penalty=0.2,
+            messages=[{"role": "user", "content": prompt}],
+            priority=Priority.BULK,
+            purpose=Purpose.COMMENT,
+            **{**self.COMMENT_PARAMS, 'max_tokens': self.COMMENT_PARAMS['max_tokens'] * count, **params}
         )
-        await user.add_comment(response)
-        return response
+        return self._parse_comments(response)[:count]
+
+    async def sample_panel(self, user: 'User', size: int, batch_size: int = 25) -> List[str]:
+        """Сгенерировать выборку комментариев аудитории параллельными запросами по batch_size комментариев.
 
-    async def analyze_data(self, user: 'User') -> str:
-        """Проанализировать данные поста, используя параллельные запросы"""
-        input_messages, topics, beginnings = PromptTemplates.audience_reaction(user.analysis_data)
-        output_messages = await self._get_multiple_responses(
-            user=user, 
-            messages=input_messages,
-            max_tokens=700,
-            temperature=0.1,
-            frequency_penalty=0.0,
-            presence_penalty=0.0,
+        Если часть запросов не удалась, возвращаются комментарии остальных.
+        """
+        counts = [min(batch_size, size - start) for start in range(0, size, batch_size)]
+        results = await asyncio.gather(
+            *(self.generate_comments(user, count, previous=[], **self.PANEL_PARAMS) for count in counts),
+            return_exceptions=True
         )
-        input_summaries = [
-            PromptTemplates.summary_response(message, topic, beginning) 
-            for message, topic, beginning in zip(output_messages, topics, beginnings)
-        ]
-        output_summaries = await self._get_multiple_responses(
-            user=user, 
-            messages=input_summaries,
-            max_tokens=150,
-            temperature=0.4,
-            frequency_penalty=0.4,
-            presence_penalty=0.2,
+        comments, errors = [], []
+        for result in results:
+            if isinstance(result, LLMError):
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                comments.extend(result)
+        if not comments and errors:
+            raise errors[0]
+        if errors:
+            logger.warning('Панель аудитории: не удалось получить %s из %s партий', len(errors), len(counts))
+        return comments
+
+    @staticmethod
+    def _parse_comments(response: str) -> List[str]:
+        """Разбить ответ с несколькими комментариями на отдельные комментарии."""
+        parts = re.split(r'Комментарий\s*:', response)
+        # Текст до первого заголовка - пояснение модели, а не комментарий
+        if len(parts) > 1:
+            parts = parts[1:]
+        return [f'Комментарий: {part.strip()}' for part in parts if part.strip()]
+
+    async def take_comment(self, user: 'User') -> Optional[str]:
+        """Взять заранее сгенерированный комментарий к посту или None, если запас ещё не готов."""
+        if self.comment_pool is None:
+            return None
+        # Запас сбрасывается при изменении данных поста или модели комментариев
+        key = (self.router.route(user, Purpose.COMMENT).model, *user.analysis_data.to_dict().values())
+        comment = self.comment_pool.take(user.user_id, key, lambda count: self.generate_comments(user, count))
+        if comment is not None:
+            await user.add_comment(comment)
+        return comment
+
+    async def analyze_data(self,
+                           user: 'User',
+                           on_section: SectionCallback = None,
+                           use_cache: bool = True,
+                           prompts: AnalysisPrompts = None) -> str:
+        """Проанализировать данные поста выбранным пользователем способом в пределах общего срока"""
+        deadline = Deadline.after(self.policy.analysis_deadline)
+        prompts = prompts or AnalysisPrompts.build(user.analysis_data)
+        if user.analysis_mode == AnalysisMode.SINGLE.value:
+            summaries = await self._analyze_single(user, prompts, use_cache, deadline)
+            if summaries is not None:
+                if on_section is not None:
+                    for index, summary in enumerate(summaries):
+                        await on_section(index, summary)
+                return '\n\n'.join(summaries)
+        return await self._analyze_multiple(user, prompts, on_section, use_cache, deadline)
+
+    def _cache_key(self, user: 'User', use_cache: bool, **params) -> Optional[str]:
+        """Получить ключ кэша результатов или None, если кэш отключён."""
+        if self.analysis_cache is None or not use_cache:
+            return None
+        return self.analysis_cache.make_key(
+            user.analysis_data, self.router.route(user, Purpose.ANALYSIS).model,
+            prompt_version=PromptTemplates.ANALYSIS_VERSION, **params
         )
-        return '\n\n'.join(output_summaries)
+
+    async def _get_cached(self, key: Optional[str]) -> Optional[dict]:
+        """Получить результат из кэша по ключу."""
+        if key is None:
+            return None
+        cached = await self.analysis_cache.get(key)
+        logger.debug('Кэш анализа: %s, %s', 'попадание' if cached is not None else 'промах', self.analysis_cache.stats())
+        return cached
+
+    def _is_routed(self, user: 'User', purpose: Purpose, response: LLMResponse) -> bool:
+        """Проверить, что ответила модель маршрута, а не резервная: только такие ответы попадают в кэш по ключу маршрута."""
+        return response.model == self.router.route(user, purpose).model
+
+    async def _put_cached(self, key: Optional[str], value: dict) -> None:
+        """Сохранить результат в кэш."""
+        if key is None:
+            return
+        await self.analysis_cache.put(key, value)
+
+    async def _analyze_single(self,
+                              user: 'User',
+                              prompts: AnalysisPrompts,
+                              use_cache: bool = True,
+                              deadline: Deadline = None) -> Optional[List[str]]:
+        """Проанализировать пост одним запросом; вернуть None, если ответ не удалось разобрать"""
+        prompt = prompts.single_prompt
+        key = self._cache_key(user, use_cache, mode=AnalysisMode.SINGLE.value, **self.SINGLE_PARAMS)
+        cached = await self._get_cached(key)
+        if cached is not None:
+            response = cached['response']
+            cacheable = False
+        else:
+            completion = await self._complete(
+                user=user,
+                messages=[{"role": "user", "content": prompt}],
+                priority=Priority.BULK,
+                deadline=deadline,
+                purpose=Purpose.ANALYSIS,
+                **self.SINGLE_PARAMS
+            )
+            response = completion.text
+            cacheable = self._is_routed(user, Purpose.ANALYSIS, completion)
+        summaries = self._parse_sections(response, PromptTemplates.BEGINNINGS)
+        if summaries is not None:
+            if cacheable:
+                await self._put_cached(key, {'response': response})
+            await user.add_message("user", prompt)
+            await user.add_message("assistant", response)
+        return summaries
+
+    @staticmethod
+    def _parse_sections(response: str, beginnings: List[str]) -> Optional[List[str]]:
+        """Разбить ответ на разделы по заголовкам; вернуть None, если какой-то раздел отсутствует"""
+        positions = []
+        start = 0
+        for beginning in beginnings:
+            match = re.compile(rf'^[ \t#]*{re.escape(beginning)}', re.MULTILINE).search(response, start)
+            if match is None:
+                return None
+            positions.append((match.start(), match.end()))
+            start = match.end()
+        sections = []
+        for i, (_, text_start) in enumerate(positions):
+            text_end = positions[i + 1][0] if i + 1 < len(positions) else len(response)
+            text = ' '.join(response[text_start:text_end].split())
+            if not text:
+                return None
+            sections.append(f'{beginnings[i]} {text}')
+        return sections
+
+    async def _analyze_multiple(self,
+                                user: 'User',
+                                prompts: AnalysisPrompts,
+                                on_section: SectionCallback = None,
+                                use_cache: bool = True,
+                                deadline: Deadline = None) -> str:
+        """Проанализировать данные поста параллельными цепочками запросов по каждой теме"""
+        input_messages, topics, beginnings = prompts.topic_prompts, prompts.topics, prompts.beginnings
+        deadline = deadline or Deadline.after(self.policy.analysis_deadline)
+        # Этапу анализа отводится часть срока, чтобы на резюме осталось время
+        analysis_deadline = deadline.phase(self.policy.analysis_phase_share)
+        sections = [self.TOPIC_FAILED.format(beginning=beginning) for beginning in beginnings]
+
+        async def analyze_topic(index: int) -> Optional[tuple[str, str, str]]:
+            key = self._cache_key(
+                user, use_cache,
+                mode=AnalysisMode.MULTIPLE.value, topic=index,
+                analysis=self.ANALYSIS_PARAMS, summary=self.SUMMARY_PARAMS,
+                summary_model=self.router.route(user, Purpose.SUMMARY).model
+            )
+            cached = await self._get_cached(key)
+            result = None
+            if cached is not None:
+                result = cached['analysis'], cached['summary_prompt'], cached['summary']
+            else:
+                try:
+                    # Резюме темы запрашивается сразу после её анализа, не дожидаясь остальных тем
+                    analysis = await self._complete(
+                        user=user,
+                        messages=[{"role": "user", "content": input_messages[index]}],
+                        priority=Priority.BULK,
+                        deadline=analysis_deadline,
+                        purpose=Purpose.ANALYSIS,
+                        **self.ANALYSIS_PARAMS
+                    )
+                    summary_prompt = PromptTemplates.summary_response(analysis.text, topics[index], beginnings[index])
+                    summary = await self._complete(
+                        user=user,
+                        messages=[{"role": "user", "content": summary_prompt}],
+                        priority=Priority.BULK,
+                        deadline=deadline,
+                        purpose=Purpose.SUMMARY,
+                        **self.SUMMARY_PARAMS
+                    )
+                    result = analysis.text, summary_prompt, summary.text
+                    if self._is_routed(user, Purpose.ANALYSIS, analysis) and self._is_routed(user, Purpose.SUMMARY, summary):
+                        await self._put_cached(
+                            key, {'analysis': analysis.text, 'summary_prompt': summary_prompt, 'summary': summary.text}
+                        )
+                except LLMError as e:
+                    logger.warning('Тема %s не проанализирована: user=%s error=%s', index, user.user_id, e)
+            if result is not None:
+                sections[index] = result[2]
+            if on_section is not None:
+                await on_section(index, sections[index])
+            return result
+
+        results = await asyncio.gather(*[analyze_topic(index) for index in range(len(input_messages))])
+
+        # История сохраняется в стабильном порядке независимо от порядка завершения тем;
+        # темы без ответа модели в историю не попадают
+        completed = [(text, result) for text, result in zip(input_messages, results) if result is not None]
+        for text, (analysis, _, _) in completed:
+            await user.add_message("user", text)
+            await user.add_message("assistant", analysis)
+        for _, (_, summary_prompt, summary) in completed:
+            await user.add_message("user", summary_prompt)
+            await user.add_message("assistant", summary)
+
+        return '\n\n'.join(sections)
 
     async def get_dialog_response(self, user: 'User', message: str) -> str:
         """Получить ответ на сообщение пользователя в контексте обсуждения поста."""
+        return ''.join([chunk async for chunk in self.stream_dialog_response(user, message)])
+
+    async def stream_dialog_response(self, user: 'User', message: str) -> AsyncIterator[str]:
+        """Получить ответ на сообщение пользователя в контексте обсуждения поста по частям."""
+        if not await self._is_dialog_message(user, message):
+            yield 'Ваше сообщение не связано с контекстом.'
+            return
+        prompt = {'role': 'user', 'content': PromptTemplates.dialog_response(message)}
+        context = await self.dialog_context.build(self, user)
+        chunks = []
+        try:
+            async for chunk in self._stream_response(
+                user=user, messages=[*context, prompt], max_tokens=700, purpose=Purpose.DIALOG
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except LLMError as e:
+            logger.warning('Не удалось получить ответ в диалоге: user=%s error=%s', user.user_id, e)
+            yield self.ERROR_MESSAGE
+            return
+        # Вопрос и ответ сохраняются только вместе, чтобы сбой модели не оставлял вопрос без ответа
+        await user.add_message(prompt['role'], prompt['content'])
+        await user.add_message('assistant', ''.join(chunks))
+
+    async def _is_dialog_message(self, user: 'User', message: str) -> bool:
+        """Проверить, продолжает ли сообщение обсуждение поста; модель проверяет только пограничные случаи."""
+        decision, _ = await self.relevance_gate.decide(user, message)
+        if decision != RelevanceDecision.BORDERLINE:
+            return decision == RelevanceDecision.ACCEPT
+        started = time.perf_counter()
+        prompt = PromptTemplates.dialog_relevance_check(message, user.analysis_data.post_text, user.context_summary)
         try:
-            reasoning_prompt = PromptTemplates.dialog_validation_reasoning(message, user.messages)
-            reasoning_response = await self._get_response(
+            response = await self._get_response(
                 user=user,
-                messages=[{'role': 'user', 'content': reasoning_prompt}],
-                max_tokens=700,
-                temperature=0.1,
+                messages=[{'role': 'user', 'content': prompt}],
+                max_tokens=5,
+                temperature=0.0,
                 frequency_penalty=0.0,
                 presence_penalty=0.0,
+                purpose=Purpose.VALIDATION,
             )
-            summary_prompt = PromptTemplates.dialog_validation_summary(reasoning_response)
-            summary_response = await self._get_response(
-                user=user,
-                messages=[{'role': 'user', 'content': summary_prompt}],
-                temperature=0.1,
-                max_tokens=10
-            )
-            if summary_response.strip().lower() == 'true':
-                prompt = PromptTemplates.dialog_response(message)
-                await user.add_message('user', prompt)
-                response = await self._get_response(
-                    user=user,
-                    max_tokens=700
-                )
-                await user.add_message('assistant', response)
-                return response
-            else:
-                return 'Ваше сообщение не связано с контекстом.'
-        except Exception as e:
-            return f'Ошибка: {str(e)}' 
-        
\ No newline at end of file
+        except LLMError as e:
+            # Пограничное сообщение без проверки моделью не отклоняется
+            logger.warning('Проверка релевантности моделью не выполнена: user=%s error=%s', user.user_id, e)
+            return True
+        is_related = response.strip().lower().startswith('true')
+        logger.info(
+            'Проверка релевантности моделью: user=%s related=%s time=%.0fms',
+            user.user_id, is_related, (time.perf_counter() - started) * 1000
+        )
+        return is_related
@@ -0,0 +1,118 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Tuple
+
+import httpx
+from google import genai
+from google.genai.types import HttpOptions
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledClient:
+    """Клиент LLM провайдера вместе со статистикой использования."""
+    client: Any
+    http_client: httpx.AsyncClient = None
+    created_at: float = field(default_factory=time.monotonic)
+    acquisitions: int = 0
+
+
+class LLMClientPool:
+    """Общий для процесса пул клиентов LLM с переиспользованием соединений по провайдеру и base_url."""
+
+    OPENAI = 'openai'
+    GEMINI = 'gemini'
+
+    def __init__(self,
+                 api_key: str,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0,
+                 http2: bool = False):
+        """Инициализация пула с ключом API и ограничениями соединений."""
+        self.api_key = api_key
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._clients: Dict[Tuple[str, str], PooledClient] = {}
+
+    def get_openai(self, base_url: str) -> AsyncOpenAI:
+        """Получить общий клиент OpenAI-совместимого API для base_url."""
+        return self._acquire(self.OPENAI, base_url).client
+
+    def get_gemini(self, base_url: str) -> genai.Client:
+        """Получить общий клиент Gemini для base_url."""
+        return self._acquire(self.GEMINI, base_url).client
+
+    def _acquire(self, provider: str, base_url: str) -> PooledClient:
+        """Получить клиент из пула, создав его при первом обращении."""
+        key = (provider, base_url)
+        pooled = self._clients.get(key)
+        if pooled is None:
+            pooled = self._create(provider, base_url)
+            self._clients[key] = pooled
+        pooled.acquisitions += 1
+        return pooled
+
+    def _create(self, provider: str, base_url: str) -> PooledClient:
+        """Создать клиент провайдера с общими ограничениями соединений."""
+        if provider == self.OPENAI:
+            http_client = DefaultAsyncHttpxClient(limits=self.limits, http2=self.http2)
+            # Повторы выполняет BaseModel с учётом общего срока операции, поэтому встроенные повторы SDK отключены
+            client = AsyncOpenAI(api_key=self.api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            return PooledClient(client=client, http_client=http_client)
+        if provider == self.GEMINI:
+            client = genai.Client(
+                api_key=self.api_key,
+                http_options=HttpOptions(
+                    base_url=base_url,
+                    async_client_args={'limits': self.limits, 'http2': self.http2}
+                )
+            )
+            return PooledClient(client=client)
+        raise ValueError(f'Неизвестный провайдер: {provider}')
+
+    async def warm_up(self, endpoints: Iterable[Tuple[str, str]]) -> None:
+        """Создать клиенты заранее и установить соединения с API до первых запросов."""
+        for provider, base_url in endpoints:
+            pooled = self._clients.get((provider, base_url)) or self._create(provider, base_url)
+            self._clients[(provider, base_url)] = pooled
+            if pooled.http_client is None:
+                continue
+            try:
+                await pooled.http_client.head(base_url)
+            except httpx.HTTPError as e:
+                logger.warning('Не удалось прогреть соединение с %s: %s', base_url, e)
+
+    async def close(self) -> None:
+        """Закрыть все клиенты и их соединения."""
+        for (provider, _), pooled in self._clients.items():
+            if provider == self.OPENAI:
+                await pooled.client.close()
+            else:
+                await pooled.client.aio.aclose()
+        self._clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить статистику использования пула."""
+        return {
+            'clients': len(self._clients),
+            'acquisitions': sum(pooled.acquisitions for pooled in self._clients.values()),
+            'per_client': {
+                f'{provider}:{base_url}': {
+                    'acquisitions': pooled.acquisitions,
+                    'age': time.monotonic() - pooled.created_at,
+                }
+                for (provider, base_url), pooled in self._clients.items()
+            },
+            'limits': {
+                'max_connections': self.limits.max_connections,
+                'max_keepalive_connections': self.limits.max_keepalive_connections,
+            },
+        }
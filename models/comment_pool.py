@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from models.errors import LLMError
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Генерация партии комментариев заданного размера
+CommentGenerator = Callable[[int], Awaitable[List[str]]]
+
+
+@dataclass
+class _Entry:
+    """Запас комментариев пользователя к посту с ключом key."""
+    key: Hashable
+    comments: Deque[str] = field(default_factory=deque)
+    refill: Optional[asyncio.Task] = None
+
+
+class CommentPool:
+    """Запас заранее сгенерированных комментариев к текущему посту каждого пользователя.
+
+    Комментарии генерируются партиями в фоне, когда в запасе остаётся меньше low_water.
+    Запас привязан к ключу поста: при смене данных поста или модели он сбрасывается.
+    """
+
+    def __init__(self, batch_size: int = 5, low_water: int = 2, max_users: int = 1024):
+        """Инициализация размера партии, порога пополнения и числа пользователей, для которых хранится запас."""
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.max_users = max_users
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+
+    def take(self, user_id: int, key: Hashable, generate: CommentGenerator) -> Optional[str]:
+        """Взять готовый комментарий или None, если запас пуст; при необходимости запустить пополнение."""
+        entry = self._entries.get(user_id)
+        if entry is None or entry.key != key:
+            if entry is not None:
+                self._cancel(entry)
+            entry = self._entries[user_id] = _Entry(key)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._cancel(self._entries.popitem(last=False)[1])
+
+        comment = entry.comments.popleft() if entry.comments else None
+        if comment is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc('comment_pool', result='hit' if comment is not None else 'miss')
+        if len(entry.comments) < self.low_water and entry.refill is None:
+            entry.refill = asyncio.create_task(self._refill(user_id, entry, generate))
+        return comment
+
+    async def _refill(self, user_id: int, entry: _Entry, generate: CommentGenerator) -> None:
+        """Сгенерировать партию комментариев и добавить её в запас."""
+        try:
+            comments = await generate(self.batch_size)
+            entry.comments.extend(comments)
+            self.refills += 1
+            logger.debug('Запас комментариев пользователя %s пополнен на %s', user_id, len(comments))
+        except LLMError as e:
+            logger.warning('Не удалось пополнить запас комментариев: user=%s error=%s', user_id, e)
+        except Exception:
+            logger.exception('Ошибка пополнения запаса комментариев пользователя %s', user_id)
+        finally:
+            entry.refill = None
+
+    @staticmethod
+    def _cancel(entry: _Entry) -> None:
+        if entry.refill is not None:
+            entry.refill.cancel()
+
+    def invalidate(self, user_id: int) -> None:
+        """Сбросить запас комментариев пользователя."""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._cancel(entry)
+
+    async def close(self) -> None:
+        """Отменить незавершённые пополнения."""
+        tasks = [entry.refill for entry in self._entries.values() if entry.refill is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить число пользователей с запасом, готовых комментариев, попаданий, промахов и пополнений."""
+        return {
+            'users': len(self._entries),
+            'pooled': sum(len(entry.comments) for entry in self._entries.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refills': self.refills,
+        }
@@ -0,0 +1,123 @@
+import logging
+from functools import lru_cache
+from typing import Dict, List, TYPE_CHECKING
+
+from models.errors import LLMError
+from models.model_router import Purpose
+from models.prompt_templates import PromptTemplates
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+if TYPE_CHECKING:
+    from entities.user import User
+    from models.base_model import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """Локальный подсчёт токенов: tiktoken, если установлен, иначе оценка по длине текста."""
+
+    # Средняя длина токена в символах для смешанного русского и английского текста
+    CHARS_PER_TOKEN = 3
+    # Служебные токены на каждое сообщение чата
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(self, encoding_name: str = 'o200k_base'):
+        """Инициализация счётчика с кодировкой tiktoken."""
+        self._encoding = tiktoken.get_encoding(encoding_name) if tiktoken is not None else None
+        self.count = lru_cache(maxsize=8192)(self._count)
+
+    def _count(self, text: str) -> int:
+        """Посчитать число токенов в тексте."""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) // self.CHARS_PER_TOKEN + 1
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        """Посчитать число токенов в сообщении чата."""
+        return self.count(message['content']) + self.MESSAGE_OVERHEAD
+
+
+class DialogContext:
+    """Контекст диалога в пределах бюджета токенов со скользящим резюме старых сообщений."""
+
+    # Доля бюджета, отводимая под резюме старых сообщений
+    SUMMARY_SHARE = 0.25
+
+    def __init__(self, budgets: Dict[str, int] = None, default_budget: int = 6000, counter: TokenCounter = None):
+        """Инициализация контекста с бюджетами токенов по моделям."""
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.counter = counter or TokenCounter()
+
+    def get_budget(self, model_name: str) -> int:
+        """Получить бюджет токенов контекста для модели."""
+        return self.budgets.get(model_name, self.default_budget)
+
+    def _window_start(self, messages: List[Dict[str, str]], budget: int) -> int:
+        """Найти начало окна последних сообщений, которые помещаются в бюджет целиком."""
+        used = 0
+        start = len(messages)
+        while start > 0:
+            used += self.counter.count_message(messages[start - 1])
+            if used > budget and start < len(messages):
+                break
+            start -= 1
+        return start
+
+    async def build(self, model: 'BaseModel', user: 'User') -> List[Dict[str, str]]:
+        """Собрать контекст: резюме старых сообщений и последние сообщения без изменений."""
+        budget = self.get_budget(model.router.route(user, Purpose.DIALOG).model)
+        summary_budget = int(budget * self.SUMMARY_SHARE)
+        # Номера сообщений абсолютные: загружены только сообщения, начиная с offset, и все ещё не вошедшие в резюме
+        offset = user.history_offset('messages')
+        start = offset + self._window_start(user.messages, budget - summary_budget)
+        if start > user.context_summary_upto:
+            await self._extend_summary(model, user, start, budget, summary_budget)
+        # Сообщения, уже вошедшие в резюме, не дублируются в окне
+        context = list(user.messages[max(start, user.context_summary_upto) - user.history_offset('messages'):])
+        if user.context_summary:
+            context.insert(0, {'role': 'user', 'content': PromptTemplates.context_summary_message(user.context_summary)})
+        return context
+
+    async def _extend_summary(self,
+                              model: 'BaseModel',
+                              user: 'User',
+                              end: int,
+                              budget: int,
+                              summary_budget: int) -> None:
+        """Дополнить резюме сообщениями, вышедшими из окна, частями в пределах бюджета."""
+        summary = user.context_summary
+        start = user.context_summary_upto
+        while start < end:
+            # Смещение перечитывается после каждого запроса: запись пользователя могла перенести его историю
+            offset = user.history_offset('messages')
+            chunk_end = start
+            used = 0
+            while chunk_end < end:
+                used += self.counter.count_message(user.messages[chunk_end - offset])
+                if used > budget and chunk_end > start:
+                    break
+                chunk_end += 1
+            prompt = PromptTemplates.context_summary(summary, user.messages[start - offset:chunk_end - offset], summary_budget)
+            try:
+                summary = await model._get_response(
+                    user=user,
+                    messages=[{'role': 'user', 'content': prompt}],
+                    max_tokens=summary_budget,
+                    temperature=0.2,
+                    frequency_penalty=0.0,
+                    presence_penalty=0.0,
+                    purpose=Purpose.SUMMARY,
+                )
+            except LLMError as e:
+                # Диалог продолжается с прежним резюме; оставшиеся сообщения войдут в резюме позже
+                logger.warning('Не удалось обновить резюме диалога: user=%s error=%s', user.user_id, e)
+                break
+            start = chunk_end
+        if start > user.context_summary_upto:
+            await user.set_context_summary(summary, start)
@@ -0,0 +1,14 @@
+class LLMError(Exception):
+    """Ошибка запроса к модели."""
+
+
+class LLMTransientError(LLMError):
+    """Временная ошибка запроса к модели, после которой запрос можно повторить."""
+
+
+class LLMTimeoutError(LLMTransientError):
+    """Модель не ответила за отведённое время."""
+
+
+class LLMDeadlineExceeded(LLMError):
+    """Исчерпан общий бюджет времени на операцию."""
@@ -1,54 +1,138 @@
-import asyncio
-from google import genai
+from functools import lru_cache
+from typing import AsyncIterator, List
+
+import httpx
+from google.genai import errors as genai_errors
 from google.genai.types import Content, Part, GenerateContentConfig
 
 from entities.user import User
 from models.base_model import BaseModel
+from models.client_pool import LLMClientPool
+from models.comment_pool import CommentPool
+from models.dialog_context import DialogContext
+from models.errors import LLMError, LLMTimeoutError, LLMTransientError
+from models.llm_response import LLMResponse
+from models.llm_scheduler import LLMScheduler
+from models.model_router import ModelRouter
+from models.relevance_gate import RelevanceGate
+from models.resilience import ResiliencePolicy
+from services.analysis_cache import AnalysisCache
+
+
+@lru_cache(maxsize=4096)
+def _to_content(role: str, text: str) -> Content:
+    """Преобразовать сообщение в формат Gemini; роль assistant соответствует роли model."""
+    return Content(
+        role='model' if role == 'assistant' else role,
+        parts=[Part(text=text)]
+    )
 
 
 class GeminiModel(BaseModel):
     """Модель Google Gemini для генерации текста и анализа контента."""
 
-    def __init__(self, api_key: str):
-        super().__init__(api_key)
+    def __init__(self,
+                 api_key: str,
+                 client_pool: LLMClientPool,
+                 analysis_cache: AnalysisCache = None,
+                 dialog_context: DialogContext = None,
+                 relevance_gate: RelevanceGate = None,
+                 scheduler: LLMScheduler = None,
+                 policy: ResiliencePolicy = None,
+                 router: ModelRouter = None,
+                 comment_pool: CommentPool = None):
+        super().__init__(
+            api_key, client_pool, analysis_cache, dialog_context, relevance_gate, scheduler, policy, router,
+            comment_pool
+        )
+
+    @staticmethod
+    def _map_error(error: Exception) -> LLMError:
+        """Преобразовать ошибку SDK или транспорта в ошибку модели с признаком возможности повтора."""
+        if isinstance(error, httpx.TimeoutException):
+            return LLMTimeoutError(str(error))
+        if isinstance(error, httpx.TransportError):
+            return LLMTransientError(str(error))
+        if isinstance(error, genai_errors.APIError) and (error.code == 429 or error.code >= 500):
+            return LLMTransientError(str(error))
+        return LLMError(str(error))
+
+    @staticmethod
+    def _to_contents(messages: list) -> List[Content]:
+        """Преобразовать историю сообщений, переиспользуя уже преобразованные сообщения."""
+        return [_to_content(message['role'], message['content']) for message in messages]
+
+    def _build_config(self,
+                      max_tokens: int = None,
+                      temperature: float = None,
+                      frequency_penalty: float = None,
+                      presence_penalty: float = None) -> GenerateContentConfig:
+        """Собрать параметры генерации с подстановкой значений по умолчанию."""
+        return GenerateContentConfig(
+            temperature=self.temperature if temperature is None else temperature,
+            frequency_penalty=self.frequency_penalty if frequency_penalty is None else frequency_penalty,
+            presence_penalty=self.presence_penalty if presence_penalty is None else presence_penalty,
+            max_output_tokens=max_tokens or self.max_tokens
+        )
+
+    @staticmethod
+    def _apply_usage(response: LLMResponse, usage) -> LLMResponse:
+        """Перенести расход токенов из метаданных ответа Gemini в ответ модели."""
+        if usage is not None:
+            response.prompt_tokens = usage.prompt_token_count or 0
+            response.completion_tokens = usage.candidates_token_count or 0
+            response.cached_tokens = usage.cached_content_token_count or 0
+        return response
 
-    async def _get_response(self, 
-                          user: User,
-                          max_tokens: int = None, 
-                          temperature: float = None, 
-                          frequency_penalty: float = None, 
-                          presence_penalty: float = None, 
-                          messages: list = None) -> str:
+    async def _request(self,
+                       user: User,
+                       max_tokens: int = None,
+                       temperature: float = None,
+                       frequency_penalty: float = None,
+                       presence_penalty: float = None,
+                       messages: list = None,
+                       model: str = None) -> LLMResponse:
         """Получить ответ от модели Gemini."""
         try:
-            client = genai.Client(
-                api_key=self.api_key, 
-                http_options={"base_url": user.base_url}
-            )
+            client = self.client_pool.get_gemini(user.base_url)
 
-            contents = [
-                Content(
-                    role=message['role'],
-                    parts=[Part(text=message['content'])]
-                )
-                for message in messages or user.messages
-            ]
-
-            config = GenerateContentConfig(
-                temperature=temperature or self.temperature,
-                frequency_penalty=frequency_penalty or self.frequency_penalty,
-                presence_penalty=presence_penalty or self.presence_penalty,
-                max_output_tokens=max_tokens or self.max_tokens
-            )
+            config = self._build_config(max_tokens, temperature, frequency_penalty, presence_penalty)
 
-            response = await asyncio.to_thread(
-                client.models.generate_content, 
-                model=user.model_name,
-                contents=contents,
+            response = await client.aio.models.generate_content(
+                model=model or user.model_name,
+                contents=self._to_contents(messages or user.messages),
                 config=config
             )
+        except (genai_errors.APIError, httpx.HTTPError) as e:
+            raise self._map_error(e) from e
+        if response.text is None:
+            raise LLMError('Модель вернула пустой ответ')
+        return self._apply_usage(LLMResponse(text=response.text.replace('*', '')), response.usage_metadata)
+
+    async def _stream_request(self,
+                              user: User,
+                              max_tokens: int = None,
+                              temperature: float = None,
+                              frequency_penalty: float = None,
+                              presence_penalty: float = None,
+                              messages: list = None,
+                              model: str = None,
+                              usage: LLMResponse = None) -> AsyncIterator[str]:
+        """Получить ответ от модели Gemini по частям; итоговый расход токенов указан в последней части."""
+        try:
+            client = self.client_pool.get_gemini(user.base_url)
 
-            return response.text.replace('*', '')
-        except Exception as e:
-            return f'Ошибка: {str(e)}'
-        
\ No newline at end of file
+            config = self._build_config(max_tokens, temperature, frequency_penalty, presence_penalty)
+
+            stream = await client.aio.models.generate_content_stream(
+                model=model or user.model_name,
+                contents=self._to_contents(messages or user.messages),
+                config=config
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text.replace('*', '')
+                if usage is not None and chunk.usage_metadata is not None:
+                    self._apply_usage(usage, chunk.usage_metadata)
+        except (genai_errors.APIError, httpx.HTTPError) as e:
+            raise self._map_error(e) from e
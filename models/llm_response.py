@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+
+@dataclass
+class LLMResponse:
+    """Ответ модели вместе с расходом токенов."""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Часть prompt_tokens, взятая провайдером из кэша префиксов промптов
+    cached_tokens: int = 0
+    # Модель, которая дала ответ; при переходе на резервную модель отличается от запрошенной
+    model: str = ''
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class TokenUsage:
+    """Накопленный расход токенов по моделям с долей попаданий в кэш префиксов провайдера."""
+
+    def __init__(self):
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: str, response: LLMResponse) -> None:
+        """Учесть расход токенов ответа модели."""
+        usage = self._usage.setdefault(model, {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0})
+        usage['requests'] += 1
+        usage['prompt_tokens'] += response.prompt_tokens
+        usage['cached_tokens'] += response.cached_tokens
+        usage['completion_tokens'] += response.completion_tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Получить расход токенов и долю закэшированных токенов промпта по моделям."""
+        return {
+            model: {**usage, 'cached_ratio': usage['cached_tokens'] / usage['prompt_tokens'] if usage['prompt_tokens'] else 0.0}
+            for model, usage in self._usage.items()
+        }
+
+
+# Расход токенов текущего блока track_usage; задачи, созданные внутри блока, наследуют его
+_tracked_usage: ContextVar[Optional[TokenUsage]] = ContextVar('tracked_usage', default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    """Отдельно учитывать расход токенов запросов, выполненных внутри блока with."""
+    usage = TokenUsage()
+    token = _tracked_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _tracked_usage.reset(token)
+
+
+def record_usage(model: str, response: LLMResponse) -> None:
+    """Учесть ответ модели в текущем блоке track_usage, если он есть."""
+    usage = _tracked_usage.get()
+    if usage is not None:
+        usage.record(model, response)
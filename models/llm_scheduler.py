@@ -0,0 +1,204 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+
+class Priority(IntEnum):
+    """Класс приоритета запроса к модели: меньшее значение обслуживается раньше."""
+
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class TokenBucket:
+    """Ведро токенов для ограничения числа запросов или токенов в минуту."""
+
+    def __init__(self, per_minute: Optional[float]):
+        """Инициализация ведра; None отключает ограничение."""
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0 if per_minute else None
+        self.tokens = per_minute or 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Получить время ожидания в секундах, пока в ведре не наберётся amount токенов."""
+        if self.rate is None:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """Списать токены; отрицательное значение возвращает излишне списанные токены."""
+        if self.rate is None:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+@dataclass
+class _Waiter:
+    user_id: int
+    tokens: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class SchedulerSlot:
+    """Выданное планировщиком право на запрос; позволяет уточнить фактический расход токенов."""
+    lane: '_Lane'
+    estimated_tokens: int
+    wait_time: float
+
+    def record_usage(self, tokens: int) -> None:
+        """Уточнить расход токенов по фактическим данным ответа модели."""
+        if tokens:
+            self.lane.tokens.consume(tokens - self.estimated_tokens)
+            self.estimated_tokens = tokens
+
+
+class _Lane:
+    """Очередь запросов к одной модели с ограничениями частоты, приоритетами и справедливостью."""
+
+    def __init__(self, rpm: Optional[int], tpm: Optional[int], concurrency: Optional[int]):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.active = 0
+        # Приоритет -> пользователь -> очередь запросов; порядок пользователей задаёт круговой обход
+        self._queues: Dict[int, 'OrderedDict[int, Deque[_Waiter]]'] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def depth(self) -> int:
+        return sum(len(queue) for users in self._queues.values() for queue in users.values())
+
+    def submit(self, user_id: int, priority: Priority, tokens: int) -> asyncio.Future:
+        """Поставить запрос в очередь и получить future, который завершится при выдаче слота."""
+        waiter = _Waiter(user_id, tokens, asyncio.get_running_loop().create_future())
+        users = self._queues.setdefault(int(priority), OrderedDict())
+        users.setdefault(user_id, deque()).append(waiter)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        return waiter.future
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wakeup.set()
+
+    def _peek(self) -> Optional[Tuple[OrderedDict, int, _Waiter]]:
+        """Найти следующий запрос: наивысший приоритет, затем очередной пользователь по кругу."""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                if queue:
+                    return users, user_id, queue[0]
+                del users[user_id]
+        return None
+
+    async def _dispatch(self) -> None:
+        """Выдавать слоты, пока в очереди есть запросы."""
+        while True:
+            self._wakeup.clear()
+            head = self._peek()
+            if head is None:
+                return
+            if self.concurrency is not None and self.active >= self.concurrency:
+                await self._wakeup.wait()
+                continue
+            users, user_id, waiter = head
+            delay = max(self.requests.delay(1), self.tokens.delay(waiter.tokens))
+            if delay > 0:
+                try:
+                    # Новый запрос с более высоким приоритетом может прервать ожидание
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            queue = users.pop(user_id)
+            queue.popleft()
+            if queue:
+                users[user_id] = queue
+            self.requests.consume(1)
+            self.tokens.consume(waiter.tokens)
+            self.active += 1
+            wait = time.monotonic() - waiter.enqueued_at
+            self.completed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            waiter.future.set_result(wait)
+
+
+class LLMScheduler:
+    """Общий планировщик исходящих запросов к моделям."""
+
+    def __init__(self,
+                 limits: Dict[str, Dict[str, int]] = None,
+                 model_limits: Dict[str, Dict[str, int]] = None):
+        """Инициализация с ограничениями по провайдерам и, при необходимости, по отдельным моделям.
+
+        Ограничения задаются словарём с ключами rpm, tpm и concurrency.
+        """
+        self.limits = limits or {}
+        self.model_limits = model_limits or {}
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+
+    def _lane(self, provider: str, model: str) -> _Lane:
+        key = (provider, model)
+        lane = self._lanes.get(key)
+        if lane is None:
+            limits = {**self.limits.get(provider, {}), **self.model_limits.get(model, {})}
+            lane = _Lane(limits.get('rpm'), limits.get('tpm'), limits.get('concurrency'))
+            self._lanes[key] = lane
+        return lane
+
+    @asynccontextmanager
+    async def slot(self,
+                   provider: str,
+                   model: str,
+                   user_id: int,
+                   priority: Priority = Priority.INTERACTIVE,
+                   estimated_tokens: int = 0) -> AsyncIterator[SchedulerSlot]:
+        """Дождаться своей очереди на запрос к модели и удерживать слот до выхода из блока."""
+        lane = self._lane(provider, model)
+        future = lane.submit(user_id, priority, estimated_tokens)
+        try:
+            wait_time = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                lane.release()
+            raise
+        try:
+            yield SchedulerSlot(lane, estimated_tokens, wait_time)
+        finally:
+            lane.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить глубину очередей и время ожидания по моделям."""
+        return {
+            f'{provider}:{model}': {
+                'queue_depth': lane.depth(),
+                'active': lane.active,
+                'completed': lane.completed,
+                'avg_wait': lane.total_wait / lane.completed if lane.completed else 0.0,
+                'max_wait': lane.max_wait,
+            }
+            for (provider, model), lane in self._lanes.items()
+        }
@@ -0,0 +1,98 @@
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from models.llm_response import LLMResponse, TokenUsage
+from models.resilience import LatencyTracker
+from services.metrics import metrics
+
+if TYPE_CHECKING:
+    from entities.user import User
+
+
+class Purpose(str, Enum):
+    """Назначение запроса к модели."""
+    ANALYSIS = 'analysis'
+    SUMMARY = 'summary'
+    VALIDATION = 'validation'
+    COMMENT = 'comment'
+    DIALOG = 'dialog'
+
+
+# Уровень, означающий модель, выбранную пользователем
+USER_TIER = 'user'
+# Уровень запросов, для которых пользователь указал конкретную модель
+OVERRIDE_TIER = 'override'
+# Уровень запросов, на которые ответила резервная модель вместо выбранной маршрутом
+FALLBACK_TIER = 'fallback'
+
+
+@dataclass(frozen=True)
+class Route:
+    """Модель, выбранная для запроса, и уровень, по которому она выбрана."""
+    purpose: Purpose
+    tier: str
+    model: str
+
+
+class ModelRouter:
+    """Выбор модели для запроса по его назначению: каждому назначению соответствует уровень модели провайдера.
+
+    Уровни задаются для каждого провайдера отдельно, так что запрос всегда уходит тому же провайдеру,
+    что и у пользователя. Если у провайдера нет нужного уровня, используется модель пользователя.
+    """
+
+    def __init__(self,
+                 tiers: Dict[str, Dict[str, str]] = None,
+                 routes: Dict[str, str] = None,
+                 models: Dict[str, List[str]] = None):
+        """Инициализация уровней моделей провайдеров, уровней по назначениям и списка доступных моделей."""
+        self.tiers = tiers or {}
+        self.routes = routes or {}
+        self.models = models or {}
+        self.calls: Counter = Counter()
+        self.latency = LatencyTracker()
+        self.usage = TokenUsage()
+
+    def tier_names(self, model_type: str) -> List[str]:
+        """Получить уровни, доступные для провайдера."""
+        return [USER_TIER, *self.tiers.get(model_type, {})]
+
+    def is_valid_choice(self, model_type: str, choice: str) -> bool:
+        """Проверить, можно ли назначить пользователю уровень или модель провайдера."""
+        return choice in self.tier_names(model_type) or choice in self.models.get(model_type, [])
+
+    def route(self, user: 'User', purpose: Purpose) -> Route:
+        """Выбрать модель для запроса пользователя; выбор пользователя важнее общей настройки."""
+        choice = user.model_overrides.get(purpose.value) or self.routes.get(purpose.value, USER_TIER)
+        if choice == USER_TIER:
+            return Route(purpose, USER_TIER, user.model_name)
+        model = self.tiers.get(user.model_type, {}).get(choice)
+        if model is not None:
+            return Route(purpose, choice, model)
+        # Конкретная модель применяется, только пока пользователь не сменил провайдера
+        if choice in self.models.get(user.model_type, []):
+            return Route(purpose, OVERRIDE_TIER, choice)
+        return Route(purpose, USER_TIER, user.model_name)
+
+    def record(self, route: Route, latency: float, response: Optional[LLMResponse] = None) -> None:
+        """Учесть время ответа и, если известен, расход токенов запроса на уровне маршрута."""
+        self.calls[route.tier] += 1
+        self.latency.record(route.tier, latency)
+        if response is not None:
+            self.usage.record(route.tier, response)
+        metrics.observe('llm_tier_seconds', latency, tier=route.tier, purpose=route.purpose.value)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Получить число запросов, медиану и 90-й перцентиль времени ответа и расход токенов по уровням."""
+        usage = self.usage.stats()
+        return {
+            tier: {
+                'calls': calls,
+                'p50_latency': self.latency.percentile(tier, 0.5, min_samples=1),
+                'p90_latency': self.latency.percentile(tier, 0.9, min_samples=1),
+                **usage.get(tier, {}),
+            }
+            for tier, calls in self.calls.items()
+        }
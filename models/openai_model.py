@@ -1,33 +1,110 @@
-from openai import AsyncOpenAI
+from typing import AsyncIterator
+
+import openai
 
 from entities.user import User
 from models.base_model import BaseModel
+from models.client_pool import LLMClientPool
+from models.comment_pool import CommentPool
+from models.dialog_context import DialogContext
+from models.errors import LLMError, LLMTimeoutError, LLMTransientError
+from models.llm_response import LLMResponse
+from models.llm_scheduler import LLMScheduler
+from models.model_router import ModelRouter
+from models.relevance_gate import RelevanceGate
+from models.resilience import ResiliencePolicy
+from services.analysis_cache import AnalysisCache
 
 
 class OpenAIModel(BaseModel):
     """Модель OpenAI для генерации текста и анализа контента."""
 
-    def __init__(self, api_key: str):   
-        super().__init__(api_key)
+    def __init__(self,
+                 api_key: str,
+                 client_pool: LLMClientPool,
+                 analysis_cache: AnalysisCache = None,
+                 dialog_context: DialogContext = None,
+                 relevance_gate: RelevanceGate = None,
+                 scheduler: LLMScheduler = None,
+                 policy: ResiliencePolicy = None,
+                 router: ModelRouter = None,
+                 comment_pool: CommentPool = None):
+        super().__init__(
+            api_key, client_pool, analysis_cache, dialog_context, relevance_gate, scheduler, policy, router,
+            comment_pool
+        )
+
+    @staticmethod
+    def _map_error(error: openai.OpenAIError) -> LLMError:
+        """Преобразовать ошибку SDK в ошибку модели с признаком возможности повтора."""
+        if isinstance(error, openai.APITimeoutError):
+            return LLMTimeoutError(str(error))
+        if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+            return LLMTransientError(str(error))
+        return LLMError(str(error))
 
-    async def _get_response(self, 
-                            user: User,
-                            max_tokens: int = None, 
-                            temperature: float = None, 
-                            frequency_penalty: float = None, 
-                            presence_penalty: float = None, 
-                            messages: list = None) -> str:
+    @staticmethod
+    def _apply_usage(response: LLMResponse, usage) -> LLMResponse:
+        """Перенести расход токенов из ответа SDK в ответ модели."""
+        if usage is not None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            response.prompt_tokens = usage.prompt_tokens or 0
+            response.completion_tokens = usage.completion_tokens or 0
+            response.cached_tokens = (details.cached_tokens or 0) if details else 0
+        return response
+
+    async def _request(self,
+                       user: User,
+                       max_tokens: int = None,
+                       temperature: float = None,
+                       frequency_penalty: float = None,
+                       presence_penalty: float = None,
+                       messages: list = None,
+                       model: str = None) -> LLMResponse:
         """Получить ответ от модели OpenAI."""
         try:
-            client = AsyncOpenAI(api_key=self.api_key, base_url=user.base_url)
+            client = self.client_pool.get_openai(user.base_url)
             response = await client.chat.completions.create(
-                model=user.model_name,
+                model=model or user.model_name,
+                messages=messages or user.messages,
+                temperature=self.temperature if temperature is None else temperature,
+                max_tokens=max_tokens or self.max_tokens,
+                frequency_penalty=self.frequency_penalty if frequency_penalty is None else frequency_penalty,
+                presence_penalty=self.presence_penalty if presence_penalty is None else presence_penalty
+            )
+        except openai.OpenAIError as e:
+            raise self._map_error(e) from e
+        content = response.choices[0].message.content if response.choices else None
+        if content is None:
+            raise LLMError('Модель вернула пустой ответ')
+        return self._apply_usage(LLMResponse(text=content.replace('*', '')), response.usage)
+
+    async def _stream_request(self,
+                              user: User,
+                              max_tokens: int = None,
+                              temperature: float = None,
+                              frequency_penalty: float = None,
+                              presence_penalty: float = None,
+                              messages: list = None,
+                              model: str = None,
+                              usage: LLMResponse = None) -> AsyncIterator[str]:
+        """Получить ответ от модели OpenAI по частям; расход токенов приходит последней частью."""
+        try:
+            client = self.client_pool.get_openai(user.base_url)
+            stream = await client.chat.completions.create(
+                model=model or user.model_name,
                 messages=messages or user.messages,
-                temperature=temperature or self.temperature,
+                temperature=self.temperature if temperature is None else temperature,
                 max_tokens=max_tokens or self.max_tokens,
-                frequency_penalty=frequency_penalty or self.frequency_penalty,
-                presence_penalty=presence_penalty or self.presence_penalty
+                frequency_penalty=self.frequency_penalty if frequency_penalty is None else frequency_penalty,
+                presence_penalty=self.presence_penalty if presence_penalty is None else presence_penalty,
+                stream=True,
+                stream_options={'include_usage': True}
             )
-            return response.choices[0].message.content.replace('*', '')
-        except Exception as e:
-            return f'Ошибка: {str(e)}'
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content.replace('*', '')
+                if usage is not None and chunk.usage is not None:
+                    self._apply_usage(usage, chunk.usage)
+        except openai.OpenAIError as e:
+            raise self._map_error(e) from e
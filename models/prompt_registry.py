@@ -0,0 +1,56 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """Промпт из неизменного префикса и суффикса с переменными полями.
+
+    Префикс одинаков для всех пользователей байт в байт, поэтому провайдер может
+    закэшировать его обработку; переменные поля подставляются только в суффикс.
+    """
+    name: str
+    prefix: str
+    suffix: str
+
+    def render(self, **fields: Any) -> str:
+        """Собрать промпт, подставив поля в суффикс."""
+        return self.prefix + self.suffix.format(**fields)
+
+
+class PromptRegistry:
+    """Реестр промптов, заранее разделённых на общий префикс и переменный суффикс."""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, prefix: str, suffix: str) -> PromptTemplate:
+        """Зарегистрировать шаблон; префикс не должен содержать переменных полей."""
+        template = PromptTemplate(name, prefix, suffix)
+        self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, name: str, **fields: Any) -> str:
+        """Собрать промпт по имени шаблона."""
+        return self._templates[name].render(**fields)
+
+    def fingerprint(self, *names: str) -> str:
+        """Получить хэш текста шаблонов names или всех шаблонов; он меняется при любой правке этих промптов."""
+        digest = hashlib.sha256()
+        for name in sorted(names or self._templates):
+            template = self._templates[name]
+            digest.update('\0'.join((name, template.prefix, template.suffix, '')).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def stats(self, count_tokens: Optional[Callable[[str], int]] = None) -> Dict[str, Dict[str, int]]:
+        """Получить длину общего префикса каждого шаблона в символах и, если задан счётчик, в токенах."""
+        stats = {}
+        for name, template in self._templates.items():
+            stats[name] = {'prefix_chars': len(template.prefix)}
+            if count_tokens is not None:
+                stats[name]['prefix_tokens'] = count_tokens(template.prefix)
+        return stats
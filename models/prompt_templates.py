@@ -1,15 +1,37 @@
 from entities.analysis_data import AnalysisData
+from models.prompt_registry import PromptRegistry
+
+
+TOPICS = [
+	"Какие эмоции вызывает пост",
+	"Какие обсуждения вызовет пост",
+	"Какова вовлеченность аудитории",
+	"Какие сильные стороны у поста",
+	"Какие слабые стороны у поста",
+	"Какие рекомендации по улучшению поста"]
+BEGINNINGS = [
+	"Эмоции:",
+	"Обсуждения:",
+	"Вовлеченность:",
+	"Сильные стороны:",
+	"Слабые стороны:",
+	"Рекомендации:"]
+
+# Промпты начинаются с неизменных инструкций и примеров, а данные поста идут в конце:
+# так общий префикс совпадает у всех пользователей и кэшируется на стороне провайдера
+registry = PromptRegistry()
+
+_POST_CONTEXT = """
+Платформа: "{platform}"
+Формат блога: "{blog_type}"
+Цель автора: "{purpose}"
+Аудитория: "{audience}"
+"""
 
-
-class PromptTemplates:
-	"""Шаблоны промптов для взаимодействия с моделями."""
-	
-	@staticmethod
-	def comment_response(analysis_data: AnalysisData) -> str:
-		return f"""
-Ты — представитель аудитории "{analysis_data.audience}" на платформе "{analysis_data.platform}". 
-Формат блога: "{analysis_data.blog_type}".
+registry.register('comment_response', """
+Ты — представитель аудитории поста на платформе, указанной ниже.
 Прочитай пост и сгенерируй реалистичный комментарий в ответ — эмоциональный, но типичный для такой аудитории.
+Отвечай строго одним предложением, уложись в 75 токенов и следуй примерам. Ответ начни с "Комментарий: ".
 
 <example>
 Платформа: Telegram
@@ -42,129 +64,180 @@ class PromptTemplates:
 Комментарий:
 "Тоже обожаю эту книгу! Дон — один из самых обаятельных героев, о которых я читала. Спасибо за напоминание, захотелось перечитать!"
 </example>
+""", """
+Платформа: {platform}
+Тип блога: {blog_type}
+Аудитория: {audience}
 
-Теперь сгенерируй комментарий, который написал бы типичный представитель аудитории "{analysis_data.audience}" на платформе "{analysis_data.platform}" в ответ на пост: "{analysis_data.post_text}"
-Отвечай строго одним предложением, уложись в 75 токенов и следуй примерам. Ответ начни с "Комментарий: ".
-"""
+Теперь сгенерируй комментарий, который написал бы типичный представитель аудитории "{audience}" на платформе "{platform}" в ответ на пост: "{post_text}"
+""")
 
-	@staticmethod
-	def audience_reaction(analysis_data: AnalysisData) -> tuple[list, list, list]:
-		messages = []
-		topics = [
-			"Какие эмоции вызывает пост",
-			"Какие обсуждения вызовет пост",
-			"Какова вовлеченность аудитории",
-			"Какие сильные стороны у поста",
-			"Какие слабые стороны у поста",
-			"Какие рекомендации по улучшению поста"]
-		beginnings = [
-			"Эмоции:",
-			"Обсуждения:",
-			"Вовлеченность:",
-			"Сильные стороны:",
-			"Слабые стороны:",
-			"Рекомендации:"]
-		
-		# Запрос для генерации эмоций от поста
-		messages.append(f"""
-Ты — эксперт по анализу эмоций аудитории "{analysis_data.audience}" на платформе "{analysis_data.platform}". 
-Формат блога: "{analysis_data.blog_type}". Цель автора: "{analysis_data.purpose}".
-Оцени, какие эмоции вызывает этот пост, объясни, что триггерит аудиторию.
-Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-Проанализируй эмоции от этого поста: "{analysis_data.post_text}"		
+# Дополнение к comment_response для генерации партии комментариев одним запросом
+registry.register('comment_batch', """
+Сгенерируй не один, а несколько комментариев от разных представителей этой аудитории.
+Комментарии должны отличаться друг от друга тональностью и точкой зрения, каждый — одно предложение.
+Каждый комментарий начни с новой строки с "Комментарий: ", не нумеруй их и не добавляй пояснений.
+""", """
+Количество комментариев: {count}
+Не повторяй уже написанные комментарии: "{previous}"
 """)
-		# Запрос для генерации потенциальных обсуждений в комментариях
-		messages.append(f"""
-Ты — аналитик, который предсказывает обсуждения в комментариях. 
-Определи, какие темы или споры могут возникнуть среди аудитории "{analysis_data.audience}" на платформе "{analysis_data.platform}" после прочтения поста.
-Формат блога: "{analysis_data.blog_type}". Цель автора: "{analysis_data.purpose}".
+
+# Запросы анализа по темам в порядке PromptTemplates.TOPICS
+_AUDIENCE_REACTION = [
+	("""
+Ты — эксперт по анализу эмоций аудитории в социальных сетях.
+Оцени, какие эмоции вызывает пост у аудитории, указанной ниже, объясни, что триггерит аудиторию.
 Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-Какие обсуждения вызовет этот пост: "{analysis_data.post_text}"
-""")
-		# Запрос для генерации вовлеченности аудитории
-		messages.append(f"""
-Ты — эксперт по вовлеченности в социальных сетях. 
-Проанализируй пост с учетом цели "{analysis_data.purpose}", формата "{analysis_data.blog_type}", платформы "{analysis_data.platform}" и интересов аудитории "{analysis_data.audience}".
-Оцени, насколько он вызывает желание комментировать, лайкать или репостить, и объясни почему.		
+""", 'Проанализируй эмоции от этого поста: "{post_text}"'),
+	("""
+Ты — аналитик, который предсказывает обсуждения в комментариях.
+Определи, какие темы или споры могут возникнуть среди аудитории, указанной ниже, после прочтения поста.
 Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-Оцени вовлечённость этого поста: "{analysis_data.post_text}"
-""")
-		# Запрос для генерации сильных сторон поста
-		messages.append(f"""
-Ты — эксперт по анализу контента. 
-Выдели сильные стороны этого поста, исходя из цели "{analysis_data.purpose}", формата блога "{analysis_data.blog_type}" и интересов аудитории "{analysis_data.audience}" на платформе "{analysis_data.platform}".
+""", 'Какие обсуждения вызовет этот пост: "{post_text}"'),
+	("""
+Ты — эксперт по вовлеченности в социальных сетях.
+Проанализируй пост с учетом цели, формата блога, платформы и интересов аудитории, указанных ниже.
+Оцени, насколько он вызывает желание комментировать, лайкать или репостить, и объясни почему.
 Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-Выдели сильные стороны этого поста: "{analysis_data.post_text}"
-""")
-		# Запрос для генерации слабых сторон поста
-		messages.append(f"""
-Ты — эксперт по анализу контента. 
-Найди слабые стороны поста: что мешает его восприятию, не даёт достичь цели "{analysis_data.purpose}", не соответствует формату "{analysis_data.blog_type}" или аудитории "{analysis_data.audience}" на платформе "{analysis_data.platform}".
+""", 'Оцени вовлечённость этого поста: "{post_text}"'),
+	("""
+Ты — эксперт по анализу контента.
+Выдели сильные стороны поста, исходя из цели, формата блога и интересов аудитории на платформе, указанных ниже.
 Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-Найди слабые стороны этого поста: "{analysis_data.post_text}"
-""")
-		# Запрос для генерации рекомендаций по улучшению поста
-		messages.append(f"""
-Ты — эксперт по улучшению контента для платформы "{analysis_data.platform}". 
-Дай 1–2 чёткие рекомендации по улучшению поста, чтобы он стал более эффективным для аудитории "{analysis_data.audience}" и помог достичь цели "{analysis_data.purpose}" в формате блога "{analysis_data.blog_type}".
+""", 'Выдели сильные стороны этого поста: "{post_text}"'),
+	("""
+Ты — эксперт по анализу контента.
+Найди слабые стороны поста: что мешает его восприятию, не даёт достичь цели, не соответствует формату блога или аудитории на платформе, указанным ниже.
 Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-Дай рекомендации для этого поста: "{analysis_data.post_text}"
+""", 'Найди слабые стороны этого поста: "{post_text}"'),
+	("""
+Ты — эксперт по улучшению контента для социальных сетей.
+Дай 1–2 чёткие рекомендации по улучшению поста, чтобы он стал более эффективным для аудитории и помог достичь цели в формате блога, указанных ниже.
+Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
+""", 'Дай рекомендации для этого поста: "{post_text}"'),
+]
+for _index, (_prefix, _request) in enumerate(_AUDIENCE_REACTION):
+	registry.register(f'audience_reaction.{_index}', _prefix, _POST_CONTEXT + '\n' + _request + '\n')
+
+registry.register('audience_reaction_single', """
+Ты — эксперт по анализу реакции аудитории в социальных сетях.
+Проанализируй пост с учетом платформы, формата блога, цели автора и аудитории, указанных ниже, и дай краткое резюме по каждому из шести разделов.
+Используй конкретные примеры и факты из поста, вместо общих фраз.
+Каждый раздел начинай с новой строки строго с указанного заголовка, в указанном порядке, без markdown:
+""" + '\n'.join(
+	f'{beginning} 1-2 предложения: {topic.lower()}?' for topic, beginning in zip(TOPICS, BEGINNINGS)
+) + '\n', _POST_CONTEXT + """
+Проанализируй этот пост: "{post_text}"
 """)
-		return messages, topics, beginnings
 
-	@staticmethod
-	def dialog_validation_reasoning(new_message: str, messages: list) -> str:
-		return f"""
-Ты ассистент, который проверяет, логично ли новое сообщение пользователя продолжает текущий диалог.
-Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
+registry.register('dialog_relevance_check', """
+Ты — ассистент, который проверяет, относится ли сообщение пользователя к обсуждению анализа поста.
+Сообщение относится к обсуждению, если оно касается поста, его темы, аудитории, реакции на пост или результатов анализа.
+Отвечай строго одним словом: True или False.
+""", """
+Пост: "{post_text}"
 
-Вот контекст диалога: "{'\n'.join([f"role: {message['role']}\ncontent: {message['content']}" for message in messages])}"
+Краткое содержание обсуждения: "{context_summary}"
 
-Вот новое сообщение: "{new_message}"
+Сообщение: "{new_message}"
+""")
 
-Ты ассистент, который проверяет, логично ли новое сообщение пользователя продолжает текущий диалог.
-Давай рассуждать строго шаг за шагом. Длина ответа должна быть строго 500 токенов.
-"""
-	
-	@staticmethod
-	def dialog_validation_summary(message: str) -> str:
-		return f"""
-Ты — ассистент, который резюмирует ответы языковых моделей.
-Тебе нужно проанализировать рассуждение.
-Если в рассуждении пришли к выводу, что сообщение является продолжением диалога верни: True
-В противном случае верни: False
+registry.register('dialog_response', """
+Ты — ассистент, участвующий в экспертном обсуждении анализа поста. 
+Твоя задача — кратко, чётко и по существу ответить на вопрос или реплику ниже, сохраняя связность с предыдущим диалогом и контекстом анализа.
+Сформулируй ответ объемом строго не больше 500 токенов. Избегай упоминания лишней информации, сосредоточься на сути.
+""", """
+"{message}"
+""")
 
-Рассуждение: "{message}"
+registry.register('context_summary', """
+Ты — ассистент, который сжимает историю экспертного обсуждения анализа поста.
+Объедини предыдущее резюме и новые сообщения в одно связное резюме.
+Сохрани выводы анализа, конкретные факты, вопросы пользователя и данные ответы, опусти повторы и служебные инструкции.
+""", """
+Длина резюме должна быть строго не больше {max_tokens} токенов.
 
-Отвечай строго одним словом: True или False.
-"""
+Предыдущее резюме: "{previous_summary}"
 
-	@staticmethod
-	def dialog_response(message: str) -> str:
-		return f"""
-Ты — ассистент, участвующий в экспертном обсуждении анализа поста. 
-Твоя задача — кратко, чётко и по существу ответить на следующий вопрос или реплику, сохраняя связность с предыдущим диалогом и контекстом анализа:
+Новые сообщения: "{dialog}"
+""")
 
-"{message}"
+registry.register('context_summary_message', """
+Краткое содержание предыдущей части обсуждения:
+""", """"{summary}"
+""")
 
-Сформулируй ответ объемом строго не больше 500 токенов. Избегай упоминания лишней информации, сосредоточься на сути.
-"""
-	
-	@staticmethod
-	def summary_response(response: str, topic: str, beginning: str) -> str:
-		return f"""
+_SUMMARY_INSTRUCTIONS = """
 Ты — ассистент, который резюмирует ответы языковых моделей.
-Тебе нужно найти в тексте ответа ключевые моменты по теме "{topic}" и сформулировать их в виде КРАТКОГО резюме.
+Тебе нужно найти в тексте ответа ключевые моменты по указанной теме и сформулировать их в виде КРАТКОГО резюме.
 Используй конкретные примеры и факты, вместо общих фраз.
 Длина резюме должна быть строго 1-2 предложения, уложись в 100 токенов.
+"""
+registry.register('summary_response', _SUMMARY_INSTRUCTIONS, """
+Тема: "{topic}"
 Свой ответ начни с "{beginning}".
 
 Сделай краткое резюме ответа:
 "{response}"
-
-Ты — ассистент, который резюмирует ответы языковых моделей.
-Тебе нужно найти в тексте ответа ключевые моменты по теме "{topic}" и сформулировать их в виде КРАТКОГО резюме.
-Используй конкретные примеры и факты, вместо общих фраз.
-Длина резюме должна быть строго 1-2 предложения, уложись в 100 токенов.
+""" + _SUMMARY_INSTRUCTIONS.replace('{', '{{').replace('}', '}}') + """Тема: "{topic}"
 Свой ответ начни с "{beginning}".
-"""
+""")
+
+
+class PromptTemplates:
+	"""Шаблоны промптов для взаимодействия с моделями."""
+
+	registry = registry
+
+	TOPICS = TOPICS
+	BEGINNINGS = BEGINNINGS
+	# Версия промптов анализа входит в ключ кэша результатов: правка промпта не отдаёт старые результаты
+	ANALYSIS_VERSION = registry.fingerprint(
+		*[f'audience_reaction.{index}' for index in range(len(TOPICS))], 'audience_reaction_single', 'summary_response'
+	)
+	
+	@staticmethod
+	def comment_response(analysis_data: AnalysisData) -> str:
+		return registry.render('comment_response', **analysis_data.to_dict())
+
+	@staticmethod
+	def comment_batch(analysis_data: AnalysisData, count: int, previous: list) -> str:
+		return PromptTemplates.comment_response(analysis_data) + registry.render(
+			'comment_batch', count=count, previous='\n'.join(previous) or 'нет')
+
+	@staticmethod
+	def audience_reaction(analysis_data: AnalysisData) -> tuple[list, list, list]:
+		fields = analysis_data.to_dict()
+		messages = [registry.render(f'audience_reaction.{index}', **fields) for index in range(len(PromptTemplates.TOPICS))]
+		topics = list(PromptTemplates.TOPICS)
+		beginnings = list(PromptTemplates.BEGINNINGS)
+		return messages, topics, beginnings
+
+	@staticmethod
+	def audience_reaction_single(analysis_data: AnalysisData) -> str:
+		return registry.render('audience_reaction_single', **analysis_data.to_dict())
+
+	@staticmethod
+	def dialog_relevance_check(new_message: str, post_text: str, context_summary: str) -> str:
+		return registry.render(
+			'dialog_relevance_check',
+			new_message=new_message, post_text=post_text, context_summary=context_summary or 'нет')
+
+	@staticmethod
+	def dialog_response(message: str) -> str:
+		return registry.render('dialog_response', message=message)
+	
+	@staticmethod
+	def context_summary(previous_summary: str, messages: list, max_tokens: int) -> str:
+		dialog = '\n'.join(f"role: {message['role']}\ncontent: {message['content']}" for message in messages)
+		return registry.render(
+			'context_summary',
+			previous_summary=previous_summary or 'нет', dialog=dialog, max_tokens=max_tokens)
+
+	@staticmethod
+	def context_summary_message(summary: str) -> str:
+		return registry.render('context_summary_message', summary=summary)
+
+	@staticmethod
+	def summary_response(response: str, topic: str, beginning: str) -> str:
+		return registry.render('summary_response', response=response, topic=topic, beginning=beginning)
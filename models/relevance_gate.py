@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from services.ttl_cache import TTLCache
+
+if TYPE_CHECKING:
+    from entities.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class RelevanceDecision(str, Enum):
+    """Решение локального фильтра релевантности сообщения."""
+
+    ACCEPT = 'accept'
+    REJECT = 'reject'
+    BORDERLINE = 'borderline'
+
+
+@dataclass
+class RelevanceIndex:
+    """Разреженное векторизованное представление поста и результатов его анализа.
+
+    Матрица фрагментов хранится в координатном виде: для каждого ненулевого значения
+    номер фрагмента, признак и нормированный TF-IDF вес.
+    """
+    fingerprint: str
+    chunks: int
+    features: np.ndarray
+    idf: np.ndarray
+    default_idf: float
+    rows: np.ndarray
+    columns: np.ndarray
+    values: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        """Объём массивов индекса в байтах."""
+        return sum(array.nbytes for array in (self.features, self.idf, self.rows, self.columns, self.values))
+
+
+class RelevanceGate:
+    """Локальный фильтр релевантности сообщений на хэшированных n-граммах с TF-IDF весами."""
+
+    WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+    # Сообщения короче этого числа слов всегда считаются пограничными
+    MIN_WORDS = 3
+
+    def __init__(self,
+                 accept_threshold: float = 0.15,
+                 reject_threshold: float = 0.04,
+                 dimensions: int = 2 ** 15,
+                 cache_size: int = 1024,
+                 cache_ttl: float = 3600.0,
+                 cache_bytes: int = 64 * 2 ** 20):
+        """Инициализация фильтра с порогами косинусной близости, размерностью хэширования и объёмом кэша индексов."""
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.dimensions = dimensions
+        self._indexes: TTLCache[RelevanceIndex] = TTLCache(
+            cache_size, cache_ttl, max_bytes=cache_bytes, sizeof=lambda index: index.nbytes
+        )
+
+    def _features(self, text: str) -> np.ndarray:
+        """Получить индексы хэшированных признаков: слова, пары слов и символьные триграммы."""
+        words = self.WORD_PATTERN.findall(text.lower())
+        features = list(words)
+        features.extend(f'{first} {second}' for first, second in zip(words, words[1:]))
+        for word in words:
+            padded = f' {word} '
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return np.fromiter(
+            (zlib.crc32(feature.encode('utf-8')) % self.dimensions for feature in features),
+            dtype=np.int64,
+            count=len(features)
+        )
+
+    def _term_frequencies(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Получить признаки текста и их сублинейно масштабированные частоты."""
+        features, counts = np.unique(self._features(text), return_counts=True)
+        return features, np.log1p(counts).astype(np.float32)
+
+    @staticmethod
+    def _split_reference(texts: List[str]) -> List[str]:
+        """Разбить тексты на абзацы, чтобы сообщение сравнивалось с отдельными фрагментами."""
+        chunks = []
+        for text in texts:
+            chunks.extend(chunk.strip() for chunk in re.split(r'\n\s*\n|(?<=[.!?])\s+(?=[A-ZА-ЯЁ])', text))
+        return [chunk for chunk in chunks if chunk]
+
+    @staticmethod
+    def _fingerprint(user: 'User') -> str:
+        """Получить отпечаток анализа: индекс перестраивается только после нового анализа."""
+        payload = f"{user.analysis_data.to_dict()}|{user.history_epochs.get('messages', 0)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _reference_texts(self, user: 'User') -> List[str]:
+        """Собрать тексты поста и ответов модели, с которыми сравниваются сообщения."""
+        texts = [user.analysis_data.post_text]
+        texts.extend(message['content'] for message in user.messages if message['role'] == 'assistant')
+        if user.context_summary:
+            texts.append(user.context_summary)
+        return texts
+
+    def _build_index(self, fingerprint: str, texts: List[str]) -> RelevanceIndex:
+        """Построить разреженный TF-IDF индекс фрагментов текстов."""
+        chunks = self._split_reference(texts)
+        frequencies = [self._term_frequencies(chunk) for chunk in chunks]
+        rows = np.repeat(np.arange(len(chunks), dtype=np.int32), [len(features) for features, _ in frequencies])
+        columns = np.concatenate([np.zeros(0, np.int32), *(features for features, _ in frequencies)]).astype(np.int32)
+        values = np.concatenate([np.zeros(0, np.float32), *(tf for _, tf in frequencies)])
+        features, document_frequency = np.unique(columns, return_counts=True)
+        idf = (np.log((1 + len(chunks)) / (1 + document_frequency)) + 1).astype(np.float32)
+        values = values * idf[np.searchsorted(features, columns)]
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(chunks)))
+        norms[norms == 0] = 1.0
+        return RelevanceIndex(
+            fingerprint=fingerprint,
+            chunks=len(chunks),
+            features=features,
+            idf=idf,
+            default_idf=float(np.log(1 + len(chunks)) + 1),
+            rows=rows,
+            columns=columns,
+            values=(values / norms[rows]).astype(np.float32)
+        )
+
+    async def get_index(self, user: 'User') -> RelevanceIndex:
+        """Получить индекс пользователя, построив его один раз на каждый анализ вне цикла событий."""
+        fingerprint = self._fingerprint(user)
+        index = self._indexes.get(user.user_id)
+        if index is not None and index.fingerprint == fingerprint:
+            return index
+        index = await asyncio.to_thread(self._build_index, fingerprint, self._reference_texts(user))
+        self._indexes.put(user.user_id, index)
+        return index
+
+    def _score(self, index: RelevanceIndex, message: str) -> float:
+        """Оценить близость сообщения к фрагментам индекса."""
+        if not index.chunks:
+            return 0.0
+        features, tf = self._term_frequencies(message)
+        if not features.size:
+            return 0.0
+        positions = np.minimum(np.searchsorted(index.features, features), len(index.features) - 1)
+        known = index.features[positions] == features
+        query = tf * np.where(known, index.idf[positions], index.default_idf)
+        query /= np.linalg.norm(query) or 1.0
+        # Вес признака сообщения для каждого ненулевого значения матрицы фрагментов
+        matches = np.minimum(np.searchsorted(features, index.columns), len(features) - 1)
+        weights = np.where(features[matches] == index.columns, query[matches], 0.0)
+        similarities = np.bincount(index.rows, weights=index.values * weights, minlength=index.chunks)
+        # Среднее по трём ближайшим фрагментам устойчивее одиночного совпадения
+        top = np.sort(similarities)[-3:]
+        return float(top.mean())
+
+    async def score(self, user: 'User', message: str) -> float:
+        """Оценить близость сообщения к посту и результатам анализа."""
+        return self._score(await self.get_index(user), message)
+
+    async def decide(self, user: 'User', message: str) -> Tuple[RelevanceDecision, float]:
+        """Принять, отклонить или отправить на проверку моделью сообщение пользователя."""
+        started = time.perf_counter()
+        score = await self.score(user, message)
+        if len(self.WORD_PATTERN.findall(message)) < self.MIN_WORDS:
+            decision = RelevanceDecision.BORDERLINE
+        elif score >= self.accept_threshold:
+            decision = RelevanceDecision.ACCEPT
+        elif score <= self.reject_threshold:
+            decision = RelevanceDecision.REJECT
+        else:
+            decision = RelevanceDecision.BORDERLINE
+        logger.info(
+            'Фильтр релевантности: user=%s decision=%s score=%.3f time=%.2fms',
+            user.user_id, decision.value, score, (time.perf_counter() - started) * 1000
+        )
+        return decision, score
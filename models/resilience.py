@@ -0,0 +1,77 @@
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from models.errors import LLMDeadlineExceeded
+
+
+class Deadline:
+    """Абсолютный срок завершения операции, который можно делить между её этапами."""
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @staticmethod
+    def after(seconds: float) -> 'Deadline':
+        """Создать срок, наступающий через seconds секунд."""
+        return Deadline(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        """Получить оставшееся время в секундах."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def phase(self, share: float) -> 'Deadline':
+        """Выделить этапу долю оставшегося времени."""
+        return Deadline(time.monotonic() + self.remaining() * share)
+
+    def check(self) -> float:
+        """Получить оставшееся время или выбросить ошибку, если срок наступил."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded('Истекло время, отведённое на запрос к модели')
+        return remaining
+
+
+class LatencyTracker:
+    """Скользящая статистика задержек ответов по моделям."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, latency: float) -> None:
+        """Добавить задержку успешного ответа модели."""
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(latency)
+
+    def percentile(self, model: str, q: float, min_samples: int = 20) -> Optional[float]:
+        """Получить перцентиль задержки или None, если наблюдений недостаточно."""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class ResiliencePolicy:
+    """Параметры сроков, повторов, дублирования и замены модели для запросов к моделям."""
+    max_attempts: int = 3
+    base_backoff: float = 0.5
+    max_backoff: float = 8.0
+    # Предельное время одного запроса и общий бюджет времени анализа поста, сек
+    request_timeout: float = 60.0
+    analysis_deadline: float = 150.0
+    # Доля бюджета анализа, отводимая этапу анализа тем; остаток - этапу резюме
+    analysis_phase_share: float = 0.7
+    hedge_enabled: bool = True
+    hedge_quantile: float = 0.9
+    hedge_min_delay: float = 1.0
+    fallback_enabled: bool = True
+    # Модели того же провайдера, на которые можно переключиться при сбоях основной модели
+    fallback_models: Dict[str, List[str]] = field(default_factory=dict)
+
+    def backoff(self, attempt: int) -> float:
+        """Получить паузу перед повтором с полным случайным разбросом."""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
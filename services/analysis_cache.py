@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from entities.analysis_data import AnalysisData
+from services.metrics import metrics
+from services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """Кэш результатов анализа с адресацией по содержимому поста, параметрам, модели и версии промптов."""
+
+    def __init__(self, max_size: int = 256, ttl: float = 86400.0, directory: Optional[str] = None):
+        """Инициализация кэша в памяти и необязательного дискового уровня в directory."""
+        self.ttl = ttl
+        self.directory = directory
+        self._memory: TTLCache[Dict[str, Any]] = TTLCache(max_size, ttl)
+        self.disk_hits = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(analysis_data: AnalysisData, model_name: str, **params: Any) -> str:
+        """Построить ключ кэша как хэш данных поста, модели и параметров генерации."""
+        payload = json.dumps(
+            {'analysis_data': analysis_data.to_dict(), 'model_name': model_name, 'params': params},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Получить результат из памяти или с диска."""
+        value = self._memory.get(key)
+        if value is not None or not self.directory:
+            metrics.inc('analysis_cache', result='hit' if value is not None else 'miss')
+            return value
+        value = await asyncio.to_thread(self._read_file, key)
+        if value is not None:
+            self.disk_hits += 1
+            self._memory.put(key, value)
+        metrics.inc('analysis_cache', result='disk_hit' if value is not None else 'miss')
+        return value
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Сохранить результат в память и на диск."""
+        self._memory.put(key, value)
+        if self.directory:
+            await asyncio.to_thread(self._write_file, key, value)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _read_file(self, key: str) -> Optional[Dict[str, Any]]:
+        """Прочитать запись с диска, если она есть и не устарела."""
+        try:
+            with open(self._path(key), encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires_at', 0) < time.time():
+            return None
+        return entry['value']
+
+    def _write_file(self, key: str, value: Dict[str, Any]) -> None:
+        """Атомарно записать запись на диск."""
+        path = self._path(key)
+        tmp_path = None
+        try:
+            # Уникальное имя временного файла: одну запись могут одновременно писать несколько анализов
+            with tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', dir=self.directory, prefix=f'{key}.', suffix='.tmp', delete=False
+            ) as file:
+                tmp_path = file.name
+                json.dump({'expires_at': time.time() + self.ttl, 'value': value}, file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning('Не удалось сохранить результат анализа на диск: %s', e)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить статистику попаданий в кэш."""
+        stats = self._memory.stats()
+        # Промах в памяти, найденный на диске, считается попаданием
+        hits = stats['hits'] + self.disk_hits
+        total = stats['hits'] + stats['misses']
+        stats.update(disk_hits=self.disk_hits, hit_ratio=hits / total if total else 0.0)
+        return stats
@@ -1,44 +1,254 @@
+import asyncio
+import logging
+
 from google.oauth2 import service_account
 from google.cloud.firestore_v1.async_client import AsyncClient
+from google.cloud.firestore_v1.async_collection import AsyncCollectionReference
+from google.cloud.firestore_v1.async_transaction import async_transactional
+
+from typing import Any, List, Optional, Tuple, TYPE_CHECKING
 
-from typing import TYPE_CHECKING
+from services.state_store import HistoryChange, StateStore
 
 if TYPE_CHECKING:
     from entities.user import User
 
+logger = logging.getLogger(__name__)
+
+
+class FirebaseService(StateStore):
+    """Хранилище пользователей в Firebase Firestore.
+
+    Документ users/{id} хранит только данные сессии, а история сообщений и комментариев
+    дописывается в подколлекции users/{id}/history/{поле}-{эпоха}/items.
+    """
 
-class FirebaseService:
-    """Сервис для взаимодействия с Firebase Firestore."""
+    # Ограничение Firestore на число операций в одной пакетной записи
+    MAX_BATCH_SIZE = 500
+    HISTORY_PAGE_SIZE = 200
+    # Число попыток записи пользователя при конфликтах версий за один сброс
+    CONFLICT_RETRIES = 3
 
-    def __init__(self, credentials_path: str):
-        """Инициализация сервиса Firebase Firestore."""
+    def __init__(self,
+                 credentials_path: str,
+                 flush_interval: float = 0.5,
+                 cache_size: int = 1024,
+                 cache_ttl: float = 600.0,
+                 optimistic_concurrency: bool = False):
+        """Инициализация сервиса Firebase Firestore.
+
+        При optimistic_concurrency документ сессии записывается в транзакции, только если его версия
+        не изменилась с момента чтения; иначе несохранённые изменения переносятся на перечитанные данные.
+        """
+        super().__init__(flush_interval, cache_size, cache_ttl)
         cred = service_account.Credentials.from_service_account_file(
             filename=credentials_path
         )
         self.db = AsyncClient(credentials=cred)
+        self.optimistic_concurrency = optimistic_concurrency
+        self.conflicts = 0
+        self._cleanup_tasks: set = set()
+
+    async def close(self) -> None:
+        """Записать все отложенные изменения перед завершением работы."""
+        await super().close()
+        if self._cleanup_tasks:
+            await asyncio.gather(*self._cleanup_tasks, return_exceptions=True)
 
-    async def save_user(self, user: 'User') -> None:
-        """Сохранить пользователя в Firestore."""
-        doc_ref = self.db.collection("users").document(
-            document_id=str(user.user_id)
+    def _user_ref(self, user_id: int):
+        return self.db.collection("users").document(
+            document_id=str(user_id)
             )
-        await doc_ref.set(user.to_dict())
 
-    async def get_user(self, user_id: int) -> 'User':
-        """Получить пользователя из Firestore или создать нового."""
-        from entities.user import User
+    def _history_ref(self, user_id: int, name: str, epoch: int) -> AsyncCollectionReference:
+        """Получить подколлекцию с записями истории поля name для эпохи epoch."""
+        return self._user_ref(user_id).collection("history").document(f'{name}-{epoch}').collection("items")
 
-        doc_ref = self.db.collection("users").document(
-            document_id=str(user_id)
+    @staticmethod
+    def _history_item(name: str, seq: int, item: Any) -> dict:
+        """Преобразовать запись истории в документ подколлекции."""
+        if name == 'messages':
+            return {'seq': seq, 'role': item['role'], 'content': item['content']}
+        return {'seq': seq, 'content': item}
+
+    @staticmethod
+    def _history_value(name: str, data: dict) -> Any:
+        """Преобразовать документ подколлекции обратно в запись истории."""
+        if name == 'messages':
+            return {'role': data['role'], 'content': data['content']}
+        return data['content']
+
+    async def _commit_users(self, users: List['User']) -> None:
+        """Записать документы сессий и новые записи истории пакетными операциями."""
+        operations: List[Tuple[Any, dict]] = []
+        saved: List[Tuple['User', List[HistoryChange]]] = []
+        for user in users:
+            if self.optimistic_concurrency:
+                await self._commit_versioned(user)
+                continue
+            changes = self._unsaved_history(user)
+            operations.extend(self._user_operations(user, changes))
+            saved.append((user, changes))
+
+        for i in range(0, len(operations), self.MAX_BATCH_SIZE):
+            batch = self.db.batch()
+            for doc_ref, data in operations[i:i + self.MAX_BATCH_SIZE]:
+                batch.set(doc_ref, data)
+            await batch.commit()
+        for user, changes in saved:
+            self._mark_saved(user, changes)
+
+    def _user_operations(self, user: 'User', changes: List[HistoryChange]) -> List[Tuple[Any, dict]]:
+        """Подготовить записи новой истории и документа сессии пользователя; документ сессии идёт последним."""
+        operations: List[Tuple[Any, dict]] = []
+        for name, epoch, start, items, _ in changes:
+            history_ref = self._history_ref(user.user_id, name, epoch)
+            for seq, item in enumerate(items, start=start):
+                operations.append((history_ref.document(f'{seq:08d}'), self._history_item(name, seq, item)))
+        operations.append((self._user_ref(user.user_id), user.to_session_dict()))
+        return operations
+
+    async def _commit_versioned(self, user: 'User') -> None:
+        """Записать изменения пользователя с проверкой версии документа.
+
+        При конфликте пользователь перечитывается, несохранённые изменения переносятся на записанные
+        другим процессом данные, и запись повторяется. Объект пользователя остаётся тем же,
+        поэтому обработчики и кэш продолжают работать с актуальными данными.
+        """
+        for _ in range(self.CONFLICT_RETRIES):
+            changes = self._unsaved_history(user)
+            if await self._write_versioned(user, self._user_operations(user, changes)):
+                self._mark_saved(user, changes)
+                return
+            self.conflicts += 1
+            logger.info('Конфликт версий пользователя %s: изменения переносятся на записанные данные', user.user_id)
+            user.rebase(await self._read_stored(user.user_id))
+        logger.warning(
+            'Не удалось записать пользователя %s за %s попыток, запись повторится при следующем сбросе',
+            user.user_id, self.CONFLICT_RETRIES
+        )
+        self.write_buffer.mark_dirty(user)
+
+    async def _write_versioned(self, user: 'User', operations: List[Tuple[Any, dict]]) -> bool:
+        """Записать операции пользователя в транзакции, если версия документа в Firestore не изменилась."""
+        user_ref = self._user_ref(user.user_id)
+        expected = user.version
+        *history, (_, session) = operations
+        # Записи истории сверх ограничения транзакции пишутся только после успешной проверки версии:
+        # другой процесс, дописывающий ту же эпоху, использует те же номера записей
+        history, overflow = history[:self.MAX_BATCH_SIZE - 1], history[self.MAX_BATCH_SIZE - 1:]
+
+        @async_transactional
+        async def write(transaction) -> bool:
+            snapshot = await user_ref.get(field_paths=['version'], transaction=transaction)
+            current = (snapshot.to_dict() or {}).get('version', 0) if snapshot.exists else 0
+            if current != expected:
+                return False
+            for doc_ref, data in history:
+                transaction.set(doc_ref, data)
+            transaction.set(user_ref, {**session, 'version': expected + 1})
+            return True
+
+        if not await write(self.db.transaction()):
+            return False
+        user.version = expected + 1
+        for i in range(0, len(overflow), self.MAX_BATCH_SIZE):
+            batch = self.db.batch()
+            for doc_ref, data in overflow[i:i + self.MAX_BATCH_SIZE]:
+                batch.set(doc_ref, data)
+            await batch.commit()
+        return True
+
+    def _on_epoch_closed(self, user_id: int, name: str, epoch: int) -> None:
+        """Удалить историю прошедшей эпохи в фоне."""
+        task = asyncio.create_task(self._delete_history(user_id, name, epoch))
+        self._cleanup_tasks.add(task)
+        task.add_done_callback(self._cleanup_tasks.discard)
+
+    async def _delete_history(self, user_id: int, name: str, epoch: int) -> None:
+        """Удалить все записи истории эпохи epoch пакетами."""
+        try:
+            history_ref = self._history_ref(user_id, name, epoch)
+            while True:
+                docs = [doc async for doc in history_ref.limit(self.MAX_BATCH_SIZE).stream()]
+                if not docs:
+                    return
+                batch = self.db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                await batch.commit()
+        except Exception:
+            logger.exception('Не удалось удалить историю %s-%s пользователя %s', name, epoch, user_id)
+
+    async def get_history(self,
+                          user_id: int,
+                          name: str,
+                          epoch: int,
+                          limit: int = None,
+                          start_after: int = None) -> list:
+        """Получить страницу истории, упорядоченную по порядковому номеру записи."""
+        query = self._history_ref(user_id, name, epoch).order_by('seq')
+        if start_after is not None:
+            query = query.start_after({'seq': start_after})
+        if limit is not None:
+            query = query.limit(limit)
+        return [self._history_value(name, doc.to_dict()) async for doc in query.stream()]
+
+    async def _read_history(self, user_id: int, name: str, epoch: int, start: int) -> list:
+        """Прочитать записи истории эпохи, начиная с записи номер start, постранично."""
+        items = []
+        while True:
+            page = await self.get_history(
+                user_id, name, epoch,
+                limit=self.HISTORY_PAGE_SIZE,
+                start_after=start + len(items) - 1 if start or items else None
             )
-        doc = await doc_ref.get()
+            items.extend(page)
+            if len(page) < self.HISTORY_PAGE_SIZE:
+                return items
+
+    async def _read_state(self, user_id: int) -> Optional[str]:
+        """Прочитать только поле state документа сессии."""
+        doc = await self._user_ref(user_id).get(field_paths=['state'])
+        return (doc.to_dict() or {}).get('state') if doc.exists else None
+
+    async def _read_user(self, user_id: int) -> Optional['User']:
+        """Прочитать документ сессии и историю текущих эпох."""
+        from entities.user import User
+
+        doc = await self._user_ref(user_id).get()
         user_data = doc.to_dict() if doc.exists else None
+        if not user_data:
+            return None
 
-        if user_data:
-            user = User.from_dict(user_data)
-        else:
-            user = User(user_id=user_id)
+        user = User.from_dict(user_data)
+        if any(name in user_data for name in User.HISTORY_FIELDS):
+            # Документ в старом формате: история переносится в подколлекции при ближайшей записи
             await self.save_user(user)
+        else:
+            await self._load_history(user, user_data.get('history_counts', {}))
+        return user
+
+    async def _read_stored(self, user_id: int) -> 'User':
+        """Прочитать записанные данные пользователя после конфликта версий, не затрагивая кэш."""
+        from entities.user import User
+
+        doc = await self._user_ref(user_id).get()
+        user_data = doc.to_dict() if doc.exists else None
+        user = User.from_dict(user_data) if user_data else User(user_id=user_id)
+        if user_data and not any(name in user_data for name in User.HISTORY_FIELDS):
+            await self._load_history(user, user_data.get('history_counts', {}))
+        return user
 
-        user.set_firebase_service(self)
-        return user
\ No newline at end of file
+    async def migrate_users(self) -> int:
+        """Перенести историю всех пользователей из документов сессий в подколлекции."""
+        migrated = 0
+        async for doc in self.db.collection("users").stream():
+            data = doc.to_dict() or {}
+            if 'messages' in data or 'comments' in data:
+                await self.get_user(int(doc.id))
+                migrated += 1
+                if len(self.write_buffer) >= self.MAX_BATCH_SIZE:
+                    await self.write_buffer.flush()
+        await self.write_buffer.flush()
+        return migrated
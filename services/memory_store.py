@@ -0,0 +1,59 @@
+import copy
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from services.state_store import StateStore
+
+if TYPE_CHECKING:
+    from entities.user import User
+
+
+class MemoryStateStore(StateStore):
+    """Хранилище пользователей в памяти процесса для тестов, бенчмарков и запуска без внешних служб.
+
+    Данные теряются при перезапуске.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, cache_size: int = 1024, cache_ttl: float = 600.0):
+        super().__init__(flush_interval, cache_size, cache_ttl)
+        self._sessions: Dict[int, dict] = {}
+        # (пользователь, поле, эпоха) -> записи истории
+        self._history: Dict[tuple, list] = {}
+
+    async def _commit_users(self, users: List['User']) -> None:
+        """Сохранить копии документов сессий и дописать новые записи истории."""
+        for user in users:
+            changes = self._unsaved_history(user)
+            for name, epoch, start, items, previous_epoch in changes:
+                history = self._history.setdefault((user.user_id, name, epoch), [])
+                del history[start:]
+                history.extend(copy.deepcopy(items))
+                if previous_epoch is not None:
+                    self._history.pop((user.user_id, name, previous_epoch), None)
+            self._sessions[user.user_id] = copy.deepcopy(user.to_session_dict())
+            self._mark_saved(user, changes)
+
+    async def _read_state(self, user_id: int) -> Optional[str]:
+        session = self._sessions.get(user_id)
+        return session['state'] if session else None
+
+    async def _read_user(self, user_id: int) -> Optional['User']:
+        from entities.user import User
+
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        user = User.from_dict(copy.deepcopy(session))
+        await self._load_history(user, session.get('history_counts', {}))
+        return user
+
+    async def get_history(self,
+                          user_id: int,
+                          name: str,
+                          epoch: int,
+                          limit: int = None,
+                          start_after: int = None) -> list:
+        """Получить страницу истории, упорядоченную по порядковому номеру записи."""
+        items = self._history.get((user_id, name, epoch), [])
+        start = start_after + 1 if start_after is not None else 0
+        end = start + limit if limit is not None else None
+        return copy.deepcopy(items[start:end])
@@ -0,0 +1,154 @@
+import bisect
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Границы корзин гистограмм длительности, сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class _NullSpan:
+    """Замер, который ничего не делает; используется при выключенных метриках."""
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Замер длительности участка кода с записью в гистограмму `<name>_seconds`."""
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> '_Span':
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        # Исход - 'ok' или имя исключения: таймауты, сбои и отменённые дублирующие запросы различимы
+        self.labels['outcome'] = 'ok' if exc_type is None else exc_type.__name__
+        self.metrics.observe(f'{self.name}_seconds', time.monotonic() - self.started, **self.labels)
+        return False
+
+
+class Metrics:
+    """Счётчики и гистограммы с метками в памяти процесса и их вывод в текстовом формате Prometheus.
+
+    Пока метрики выключены, span возвращает общий пустой замер, а inc и observe сразу завершаются.
+    """
+
+    def __init__(self, enabled: bool = False, namespace: str = 'bot', buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+
+    @staticmethod
+    def _key(labels: dict) -> Labels:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def span(self, name: str, **labels):
+        """Замерить длительность блока with; метка outcome добавляется автоматически."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Увеличить счётчик."""
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Добавить значение в гистограмму."""
+        if not self.enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        key = self._key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = _Histogram(len(self.buckets))
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            histogram.counts[index] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    def reset(self) -> None:
+        self._counters.clear()
+        self._histograms.clear()
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ''
+        escaped = (
+            '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in items
+        )
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self) -> str:
+        """Получить все метрики в текстовом формате Prometheus."""
+        lines: List[str] = []
+        for name, series in sorted(self._counters.items()):
+            full_name = f'{self.namespace}_{name}_total'
+            lines.append(f'# TYPE {full_name} counter')
+            for labels, value in series.items():
+                lines.append(f'{full_name}{self._format_labels(labels)} {value:g}')
+        for name, series in sorted(self._histograms.items()):
+            full_name = f'{self.namespace}_{name}'
+            lines.append(f'# TYPE {full_name} histogram')
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{self._format_labels(labels, ("le", f"{bound:g}"))} {cumulative}')
+                lines.append(f'{full_name}_bucket{self._format_labels(labels, ("le", "+Inf"))} {histogram.count}')
+                lines.append(f'{full_name}_sum{self._format_labels(labels)} {histogram.sum:.6f}')
+                lines.append(f'{full_name}_count{self._format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Обработчик HTTP запроса метрик."""
+        return web.Response(body=self.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start_server(self, host: str, port: int) -> web.AppRunner:
+        """Запустить отдельный HTTP сервер с метриками по пути /metrics."""
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+# Общий реестр процесса; включается контроллером по настройке METRICS_ENABLED
+metrics = Metrics()
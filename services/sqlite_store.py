@@ -0,0 +1,137 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, TypeVar, TYPE_CHECKING
+
+from services.state_store import StateStore
+
+if TYPE_CHECKING:
+    from entities.user import User
+
+T = TypeVar('T')
+
+
+class SQLiteStateStore(StateStore):
+    """Хранилище пользователей в локальной базе SQLite в режиме WAL.
+
+    Документ сессии хранится JSON столбцом таблицы users, история - построчно в таблице history.
+    Все обращения к базе выполняются одним потоком с одним соединением, поэтому запросы
+    не блокируют цикл событий, а подготовленные выражения переиспользуются из кэша соединения.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS users ('
+        ' user_id INTEGER PRIMARY KEY,'
+        ' state TEXT NOT NULL,'
+        ' session TEXT NOT NULL CHECK (json_valid(session)))',
+        'CREATE TABLE IF NOT EXISTS history ('
+        ' user_id INTEGER NOT NULL,'
+        ' name TEXT NOT NULL,'
+        ' epoch INTEGER NOT NULL,'
+        ' seq INTEGER NOT NULL,'
+        ' item TEXT NOT NULL CHECK (json_valid(item)),'
+        ' PRIMARY KEY (user_id, name, epoch, seq)) WITHOUT ROWID',
+    )
+    UPSERT_USER = (
+        'INSERT INTO users (user_id, state, session) VALUES (?, ?, ?) '
+        'ON CONFLICT (user_id) DO UPDATE SET state = excluded.state, session = excluded.session'
+    )
+    INSERT_HISTORY = 'INSERT OR REPLACE INTO history (user_id, name, epoch, seq, item) VALUES (?, ?, ?, ?, ?)'
+    DELETE_EPOCH = 'DELETE FROM history WHERE user_id = ? AND name = ? AND epoch = ?'
+    SELECT_SESSION = 'SELECT session FROM users WHERE user_id = ?'
+    SELECT_STATE = 'SELECT state FROM users WHERE user_id = ?'
+    SELECT_HISTORY = (
+        'SELECT item FROM history WHERE user_id = ? AND name = ? AND epoch = ? AND seq > ? '
+        'ORDER BY seq LIMIT ?'
+    )
+
+    def __init__(self,
+                 path: str,
+                 flush_interval: float = 0.5,
+                 cache_size: int = 1024,
+                 cache_ttl: float = 600.0):
+        """Инициализация хранилища с файлом базы path."""
+        super().__init__(flush_interval, cache_size, cache_ttl)
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-store')
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть соединение в потоке хранилища и создать схему."""
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        """Выполнить функцию с соединением в потоке хранилища."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: func(self._connect()))
+
+    async def close(self) -> None:
+        """Записать отложенные изменения и закрыть соединение."""
+        await super().close()
+        if self._connection is not None:
+            await self._run(lambda connection: connection.close())
+            self._connection = None
+        self._executor.shutdown(wait=True)
+
+    async def _commit_users(self, users: List['User']) -> None:
+        """Записать документы сессий и новые записи истории одной транзакцией."""
+        changes = [(user, self._unsaved_history(user)) for user in users]
+        # Данные сериализуются в цикле событий, чтобы поток базы не читал изменяемые объекты
+        sessions = [
+            (user.user_id, user.state, json.dumps(user.to_session_dict(), ensure_ascii=False))
+            for user, _ in changes
+        ]
+        history = []
+        closed_epochs = []
+        for user, user_changes in changes:
+            for name, epoch, start, items, previous_epoch in user_changes:
+                history.extend(
+                    (user.user_id, name, epoch, seq, json.dumps(item, ensure_ascii=False))
+                    for seq, item in enumerate(items, start=start)
+                )
+                if previous_epoch is not None:
+                    closed_epochs.append((user.user_id, name, previous_epoch))
+
+        def write(connection: sqlite3.Connection) -> None:
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(self.INSERT_HISTORY, history)
+                connection.executemany(self.UPSERT_USER, sessions)
+                connection.executemany(self.DELETE_EPOCH, closed_epochs)
+
+        await self._run(write)
+        for user, user_changes in changes:
+            self._mark_saved(user, user_changes)
+
+    async def _read_state(self, user_id: int) -> Optional[str]:
+        row = await self._run(lambda connection: connection.execute(self.SELECT_STATE, (user_id,)).fetchone())
+        return row[0] if row else None
+
+    async def _read_user(self, user_id: int) -> Optional['User']:
+        from entities.user import User
+
+        row = await self._run(lambda connection: connection.execute(self.SELECT_SESSION, (user_id,)).fetchone())
+        if row is None:
+            return None
+        session = json.loads(row[0])
+        user = User.from_dict(session)
+        await self._load_history(user, session.get('history_counts', {}))
+        return user
+
+    async def get_history(self,
+                          user_id: int,
+                          name: str,
+                          epoch: int,
+                          limit: int = None,
+                          start_after: int = None) -> list:
+        """Получить страницу истории, упорядоченную по порядковому номеру записи."""
+        params = (user_id, name, epoch, start_after if start_after is not None else -1, limit if limit is not None else -1)
+        rows = await self._run(lambda connection: connection.execute(self.SELECT_HISTORY, params).fetchall())
+        return [json.loads(item) for item, in rows]
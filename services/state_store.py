@@ -0,0 +1,206 @@
+import asyncio
+import weakref
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from entities.states import RuntimeStates
+from services.metrics import metrics
+from services.ttl_cache import TTLCache
+from services.write_behind import WriteBehindBuffer
+
+if TYPE_CHECKING:
+    from entities.user import User
+
+# Несохранённая часть истории: поле, эпоха, номер первой записи, записи, прошедшая эпоха или None
+HistoryChange = Tuple[str, int, int, list, Optional[int]]
+
+
+class StateStore(ABC):
+    """Хранилище пользователей с кэшем, отложенной групповой записью и раздельным хранением истории.
+
+    Наследники реализуют чтение пользователя и состояния, групповую запись и чтение истории.
+    Вместе с пользователем загружаются только последние записи истории; более ранние
+    читаются по запросу через get_earlier_history.
+    """
+
+    # Сколько последних записей каждого поля истории загружается вместе с пользователем;
+    # сообщения, ещё не вошедшие в резюме диалога, загружаются все
+    HISTORY_TAIL = 50
+
+    def __init__(self, flush_interval: float = 0.5, cache_size: int = 1024, cache_ttl: float = 600.0):
+        """Инициализация кэша пользователей и буфера отложенной записи."""
+        self.write_buffer = WriteBehindBuffer(self._commit, flush_interval)
+        # Кэш авторитетен только при единственном процессе, пишущем данные пользователя
+        self.user_cache: TTLCache['User'] = TTLCache(cache_size, cache_ttl)
+        # Пользователи, с которыми ещё работают обработчики: после вытеснения из кэша
+        # повторное чтение возвращает тот же объект, а не его вторую копию
+        self._live_users: 'weakref.WeakValueDictionary[int, User]' = weakref.WeakValueDictionary()
+        self._loading: Dict[int, asyncio.Task] = {}
+        self.user_reads = 0
+        self.state_reads = 0
+        self.commits = 0
+        self.users_written = 0
+
+    def start(self) -> None:
+        """Запустить фоновую запись изменённых пользователей."""
+        self.write_buffer.start()
+
+    async def close(self) -> None:
+        """Записать все отложенные изменения перед завершением работы."""
+        await self.write_buffer.close()
+
+    async def save_user(self, user: 'User') -> None:
+        """Пометить пользователя для сохранения при ближайшем сбросе."""
+        self.user_cache.put(user.user_id, user)
+        self.write_buffer.mark_dirty(user)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Удалить пользователя из кэша, чтобы следующее чтение обратилось к хранилищу."""
+        self.user_cache.invalidate(user_id)
+        self._live_users.pop(user_id, None)
+
+    def _find_loaded(self, user_id: int) -> Optional['User']:
+        """Найти уже загруженного пользователя в кэше, среди используемых или ожидающих записи."""
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            return user
+        # Пользователь с незаписанными изменениями актуальнее сохранённых данных
+        user = self._live_users.get(user_id) or self.write_buffer.get(user_id)
+        if user is not None:
+            self.user_cache.put(user_id, user)
+        return user
+
+    async def get_state(self, user_id: int) -> RuntimeStates:
+        """Получить состояние пользователя, не загружая его целиком."""
+        from entities.user import User
+
+        user = self._find_loaded(user_id)
+        if user is not None:
+            return user.get_state()
+        self.state_reads += 1
+        with metrics.span('store', operation='read_state'):
+            state = await self._read_state(user_id)
+        return User(user_id=user_id, state=state or RuntimeStates.state_none.name).get_state()
+
+    async def get_user(self, user_id: int) -> 'User':
+        """Получить пользователя из кэша, хранилища или создать нового."""
+        user = self._find_loaded(user_id)
+        if user is not None:
+            metrics.inc('store_user_lookups', result='cached')
+            return user
+        metrics.inc('store_user_lookups', result='miss')
+
+        # Одновременные промахи по одному пользователю разделяют одно чтение и один объект
+        task = self._loading.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._load_user(user_id))
+            self._loading[user_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _load_user(self, user_id: int) -> 'User':
+        """Загрузить пользователя из хранилища или создать нового."""
+        from entities.user import User
+
+        self.user_reads += 1
+        with metrics.span('store', operation='read_user'):
+            user = await self._read_user(user_id)
+        if user is None:
+            user = User(user_id=user_id)
+            await self.save_user(user)
+        user.set_store(self)
+        self.user_cache.put(user_id, user)
+        self._live_users[user_id] = user
+        return user
+
+    async def _commit(self, users: List['User']) -> None:
+        """Записать пользователей из буфера, учитывая число операций записи."""
+        with metrics.span('store', operation='commit'):
+            await self._commit_users(users)
+        metrics.inc('store_users_written', len(users))
+        self.commits += 1
+        self.users_written += len(users)
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить число обращений к хранилищу и статистику кэша пользователей."""
+        return {
+            'user_reads': self.user_reads,
+            'state_reads': self.state_reads,
+            'commits': self.commits,
+            'users_written': self.users_written,
+            'pending_writes': len(self.write_buffer),
+            'cache': self.user_cache.stats(),
+        }
+
+    async def _load_history(self, user: 'User', counts: Dict[str, int]) -> None:
+        """Загрузить нужную для работы часть истории текущих эпох по числу записей из документа сессии."""
+        for name in user.HISTORY_FIELDS:
+            epoch = user.history_epochs[name]
+            count = counts.get(name)
+            # Документ без числа записей записан до появления частичной загрузки: история читается целиком
+            start = max(count - self.HISTORY_TAIL, 0) if count is not None else 0
+            if name == 'messages':
+                start = min(start, user.context_summary_upto)
+            items = await self._read_history(user.user_id, name, epoch, start)
+            user.set_loaded_history(name, epoch, start, items)
+
+    async def _read_history(self, user_id: int, name: str, epoch: int, start: int) -> list:
+        """Прочитать все записи истории эпохи, начиная с записи номер start."""
+        return await self.get_history(user_id, name, epoch, start_after=start - 1 if start else None)
+
+    async def get_earlier_history(self, user: 'User', name: str, limit: int = None) -> list:
+        """Получить не больше limit записей истории текущей эпохи, предшествующих загруженным."""
+        offset = user.history_offset(name)
+        start = max(offset - limit, 0) if limit is not None else 0
+        if start >= offset:
+            return []
+        return await self.get_history(
+            user.user_id, name, user.history_epochs[name], limit=offset - start, start_after=start - 1 if start else None
+        )
+
+    @staticmethod
+    def _unsaved_history(user: 'User') -> List[HistoryChange]:
+        """Получить несохранённые записи истории по каждому полю."""
+        from entities.user import User
+
+        changes = []
+        for name in User.HISTORY_FIELDS:
+            epoch, start, items = user.get_unsaved_history(name)
+            previous_epoch = user._saved_history.get(name, (epoch, 0))[0]
+            changes.append((name, epoch, start, items, previous_epoch if previous_epoch != epoch else None))
+        return changes
+
+    def _mark_saved(self, user: 'User', changes: List[HistoryChange]) -> None:
+        """Отметить записанную историю пользователя."""
+        for name, epoch, start, items, previous_epoch in changes:
+            user.mark_history_saved(name, epoch, start + len(items))
+            if previous_epoch is not None:
+                self._on_epoch_closed(user.user_id, name, previous_epoch)
+
+    def _on_epoch_closed(self, user_id: int, name: str, epoch: int) -> None:
+        """Обработать завершение эпохи истории, например удалить её записи в фоне."""
+
+    async def migrate_users(self) -> int:
+        """Перенести данные пользователей из устаревшего формата; по умолчанию переносить нечего."""
+        return 0
+
+    @abstractmethod
+    async def _read_user(self, user_id: int) -> Optional['User']:
+        """Прочитать пользователя вместе с последними записями истории текущих эпох или вернуть None."""
+
+    @abstractmethod
+    async def _read_state(self, user_id: int) -> Optional[str]:
+        """Прочитать только имя состояния пользователя."""
+
+    @abstractmethod
+    async def _commit_users(self, users: List['User']) -> None:
+        """Записать изменённых пользователей одной групповой операцией."""
+
+    @abstractmethod
+    async def get_history(self,
+                          user_id: int,
+                          name: str,
+                          epoch: int,
+                          limit: int = None,
+                          start_after: int = None) -> list:
+        """Получить страницу истории, упорядоченную по порядковому номеру записи."""
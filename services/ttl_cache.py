@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar('V')
+
+
+class TTLCache(Generic[V]):
+    """Ограниченный по размеру LRU-кэш с истечением записей по времени.
+
+    Если задан sizeof, кэш дополнительно ограничен суммарным размером записей max_bytes.
+    """
+
+    def __init__(self,
+                 max_size: int = 1024,
+                 ttl: float = 600.0,
+                 max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[V], int]] = None):
+        """Инициализация кэша с максимальным размером, временем жизни записей в секундах и объёмом в байтах."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data: 'OrderedDict[Hashable, tuple[float, V]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Получить значение по ключу или None, если его нет или оно устарело."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _weight(self, value: V) -> int:
+        return self.sizeof(value) if self.sizeof is not None else 0
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= self._weight(entry[1])
+
+    def _overflow(self) -> bool:
+        if len(self._data) > self.max_size:
+            return True
+        # Последняя запись остаётся, даже если одна превышает max_bytes
+        return self.max_bytes is not None and self.bytes > self.max_bytes and len(self._data) > 1
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Сохранить значение, вытеснив самые старые записи при переполнении."""
+        self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self.bytes += self._weight(value)
+        while self._overflow():
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удалить запись из кэша."""
+        self._remove(key)
+
+    def clear(self) -> None:
+        """Очистить кэш."""
+        self._data.clear()
+        self.bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Получить статистику попаданий и промахов кэша."""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class UserMailboxes:
+    """Почтовые ящики пользователей: задачи одного пользователя выполняются по очереди,
+    задачи разных пользователей - параллельно.
+
+    Ящик и его обработчик существуют, только пока в ящике есть задачи.
+    """
+
+    def __init__(self):
+        self._mailboxes: Dict[Hashable, Deque[Tuple[Job, asyncio.Future]]] = {}
+        self._runners: set = set()
+        self.processed = 0
+        self.max_depth = 0
+
+    def submit(self, key: Hashable, job: Job) -> asyncio.Future:
+        """Поставить задачу в ящик пользователя и получить future с её результатом.
+
+        Постановка в очередь синхронна, поэтому порядок вызовов submit сохраняется.
+        """
+        future = asyncio.get_running_loop().create_future()
+        mailbox = self._mailboxes.get(key)
+        if mailbox is None:
+            mailbox = deque()
+            self._mailboxes[key] = mailbox
+            runner = asyncio.create_task(self._run(key, mailbox))
+            self._runners.add(runner)
+            runner.add_done_callback(self._runners.discard)
+        mailbox.append((job, future))
+        self.max_depth = max(self.max_depth, len(mailbox))
+        return future
+
+    async def _run(self, key: Hashable, mailbox: Deque[Tuple[Job, asyncio.Future]]) -> None:
+        """Выполнять задачи ящика по порядку и удалить ящик, когда он опустеет."""
+        try:
+            while mailbox:
+                job, future = mailbox.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    result = await job()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+                self.processed += 1
+        finally:
+            # Между проверкой пустого ящика и удалением нет точек переключения
+            del self._mailboxes[key]
+            for _, future in mailbox:
+                future.cancel()
+
+    async def close(self) -> None:
+        """Дождаться выполнения всех поставленных задач."""
+        if self._runners:
+            await asyncio.gather(*self._runners, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Получить число активных ящиков, ожидающих задач и выполненных задач."""
+        return {
+            'active': len(self._mailboxes),
+            'pending': sum(len(mailbox) for mailbox in self._mailboxes.values()),
+            'processed': self.processed,
+            'max_depth': self.max_depth,
+        }
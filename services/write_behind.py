@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from entities.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Буфер отложенной записи пользователей с объединением изменений."""
+
+    def __init__(self,
+                 commit: Callable[[List['User']], Awaitable[None]],
+                 flush_interval: float = 0.5):
+        """Инициализация буфера с функцией групповой записи и интервалом сброса."""
+        self._commit = commit
+        self.flush_interval = flush_interval
+        self._dirty: Dict[int, 'User'] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+
+    def mark_dirty(self, user: 'User') -> None:
+        """Пометить пользователя как изменённого; повторные изменения объединяются в одну запись."""
+        self._dirty[user.user_id] = user
+
+    def get(self, user_id: int) -> Optional['User']:
+        """Получить пользователя, ожидающего записи, если он есть в буфере."""
+        return self._dirty.get(user_id)
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def start(self) -> None:
+        """Запустить фоновый цикл периодического сброса."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def flush(self) -> None:
+        """Записать всех изменённых пользователей одной групповой операцией."""
+        async with self._lock:
+            if not self._dirty:
+                return
+            users = list(self._dirty.values())
+            self._dirty = {}
+            try:
+                await self._commit(users)
+            except BaseException:
+                # Возвращаем пользователей в буфер, если их не перезаписали новые изменения;
+                # при отмене записи тоже, чтобы их сохранил следующий сброс
+                for user in users:
+                    self._dirty.setdefault(user.user_id, user)
+                raise
+
+    async def close(self) -> None:
+        """Остановить фоновый цикл, дождавшись текущего сброса, и записать оставшиеся изменения."""
+        self._closed.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        """Периодически сбрасывать буфер, пока он не закрыт."""
+        while not self._closed.is_set():
+            try:
+                await asyncio.wait_for(self._closed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Ошибка сохранения пользователей')
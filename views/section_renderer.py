@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, TYPE_CHECKING
+
+from telebot.asyncio_helper import ApiTelegramException
+
+if TYPE_CHECKING:
+    from views.telegram_view import TelegramView
+
+logger = logging.getLogger(__name__)
+
+
+class SectionRenderer:
+    """Отображение результатов анализа в одном сообщении по мере готовности разделов.
+
+    Ошибки Telegram при правке сообщения записываются в лог и не прерывают анализ.
+    """
+
+    MAX_MESSAGE_LENGTH = 4096
+
+    def __init__(self,
+                 view: 'TelegramView',
+                 chat_id: int,
+                 header: str,
+                 placeholders: List[str],
+                 edit_interval: float = 1.0):
+        """Инициализация отображения с заголовком и заглушками для ещё не готовых разделов."""
+        self.view = view
+        self.chat_id = chat_id
+        self.header = header
+        self.placeholders = placeholders
+        self.edit_interval = edit_interval
+        self._sections: List[Optional[str]] = [None] * len(placeholders)
+        self._message_id: int = None
+        self._shown_text = ''
+        self._last_edit = 0.0
+        self._lock = asyncio.Lock()
+        self._pending: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Сразу отправить заголовок с заглушками разделов."""
+        text = self._render()
+        sent = await self.view.send_message(self.chat_id, text)
+        self._message_id = sent.message_id
+        self._shown_text = text
+        self._last_edit = time.monotonic()
+
+    async def update(self, index: int, text: str) -> None:
+        """Подставить готовый раздел, группируя частые правки сообщения."""
+        self._sections[index] = text
+        delay = self.edit_interval - (time.monotonic() - self._last_edit)
+        if delay <= 0:
+            await self._edit()
+        elif self._pending is None:
+            self._pending = asyncio.create_task(self._edit_later(delay))
+
+    async def close(self) -> None:
+        """Отменить отложенную правку сообщения и дождаться её завершения."""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+
+    async def finish(self) -> None:
+        """Показать итоговый текст; разделы, не поместившиеся в сообщение, отправить отдельно."""
+        await self.close()
+        text = self._render()
+        if len(text) <= self.MAX_MESSAGE_LENGTH:
+            await self._edit()
+            return
+        chunks = [self.header]
+        for section in self._render_sections():
+            if len(chunks[-1]) + len(section) + 2 > self.MAX_MESSAGE_LENGTH:
+                chunks.append(section)
+            else:
+                chunks[-1] += f'\n\n{section}'
+        async with self._lock:
+            await self._edit_message(chunks[0])
+        for chunk in chunks[1:]:
+            await self.view.send_message(self.chat_id, chunk)
+
+    def _render_sections(self) -> List[str]:
+        """Получить разделы в стабильном порядке, подставив заглушки вместо неготовых."""
+        return [
+            section if section is not None else f'{placeholder} …'
+            for section, placeholder in zip(self._sections, self.placeholders)
+        ]
+
+    def _render(self) -> str:
+        """Собрать текст сообщения из заголовка и разделов."""
+        return '\n\n'.join([self.header, *self._render_sections()])
+
+    async def _edit_later(self, delay: float) -> None:
+        """Отложенно обновить сообщение, чтобы не превышать ограничение частоты правок."""
+        await asyncio.sleep(delay)
+        self._pending = None
+        await self._edit()
+
+    async def _edit(self) -> None:
+        """Обновить сообщение, если его текст изменился."""
+        async with self._lock:
+            text = self._render()[:self.MAX_MESSAGE_LENGTH]
+            if text == self._shown_text:
+                return
+            if await self._edit_message(text):
+                self._shown_text = text
+            self._last_edit = time.monotonic()
+
+    async def _edit_message(self, text: str) -> bool:
+        """Изменить текст сообщения; вернуть False, если Telegram отклонил правку."""
+        try:
+            await self.view.edit_message_text(chat_id=self.chat_id, message_id=self._message_id, text=text)
+        except ApiTelegramException as e:
+            if 'message is not modified' in e.description:
+                return True
+            # Неудачную правку повторит следующий раздел или finish
+            logger.warning('Не удалось обновить результаты анализа в чате %s: %s', self.chat_id, e)
+            return False
+        return True
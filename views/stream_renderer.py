@@ -0,0 +1,94 @@
+import logging
+import time
+from typing import AsyncIterator, TYPE_CHECKING
+
+from telebot.asyncio_helper import ApiTelegramException
+
+if TYPE_CHECKING:
+    from views.telegram_view import TelegramView
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRenderer:
+    """Отображение потокового ответа модели в Telegram через редактирование одного сообщения.
+
+    Ошибки Telegram при отправке и правке записываются в лог и не прерывают чтение ответа,
+    чтобы генератор дошёл до конца и сохранил ответ в истории пользователя.
+    """
+
+    # Ограничение Telegram на длину текста одного сообщения
+    MAX_MESSAGE_LENGTH = 4096
+    PLACEHOLDER = '…'
+
+    def __init__(self, view: 'TelegramView', chat_id: int, edit_interval: float = 1.0):
+        """Инициализация отображения для чата с минимальным интервалом между правками."""
+        self.view = view
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self._message_id: int = None
+        self._text = ''
+        self._shown_text = ''
+        self._last_edit = 0.0
+
+    async def render(self, chunks: AsyncIterator[str]) -> str:
+        """Отправить заглушку и дополнять её частями ответа, группируя правки по времени."""
+        full_text = ''
+        try:
+            await self._send(self.PLACEHOLDER)
+            self._last_edit = time.monotonic()
+            async for chunk in chunks:
+                full_text += chunk
+                self._text += chunk
+                while len(self._text) > self.MAX_MESSAGE_LENGTH:
+                    overflow = self._text[self.MAX_MESSAGE_LENGTH:]
+                    self._text = self._text[:self.MAX_MESSAGE_LENGTH]
+                    await self._edit()
+                    # Продолжение отправляется новым сообщением при следующей правке
+                    self._message_id = None
+                    self._text = overflow
+                    self._shown_text = ''
+                if time.monotonic() - self._last_edit >= self.edit_interval:
+                    await self._edit()
+            if not full_text.strip():
+                self._text = 'Пустой ответ.'
+            await self._edit()
+        finally:
+            # Если отображение прервано, генератор закрывается сразу, а не при сборке мусора
+            aclose = getattr(chunks, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        return full_text
+
+    async def _send(self, text: str) -> bool:
+        """Отправить новое сообщение, которое будет дополняться; вернуть False, если Telegram его отклонил."""
+        try:
+            sent = await self.view.send_message(self.chat_id, text)
+        except ApiTelegramException as e:
+            logger.warning('Не удалось отправить ответ в чат %s: %s', self.chat_id, e)
+            return False
+        self._message_id = sent.message_id
+        return True
+
+    async def _edit_message(self, text: str) -> bool:
+        """Изменить текст сообщения; вернуть False, если Telegram отклонил правку."""
+        try:
+            await self.view.edit_message_text(chat_id=self.chat_id, message_id=self._message_id, text=text)
+        except ApiTelegramException as e:
+            if 'message is not modified' in e.description:
+                return True
+            logger.warning('Не удалось обновить ответ в чате %s: %s', self.chat_id, e)
+            return False
+        return True
+
+    async def _edit(self) -> None:
+        """Обновить текст сообщения, если он изменился с прошлой правки; неудачная правка повторяется позже."""
+        if not self._text.strip() or self._text == self._shown_text:
+            return
+        if self._message_id is None:
+            shown = await self._send(self._text)
+        else:
+            shown = await self._edit_message(self._text)
+        if shown:
+            self._shown_text = self._text
+        self._last_edit = time.monotonic()
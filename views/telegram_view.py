@@ -1,32 +1,103 @@
+import asyncio
+import functools
+import logging
+from typing import AsyncIterator, List, Optional
+
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
 from entities.states import RuntimeStates
+from services.metrics import metrics
+from services.user_mailbox import UserMailboxes
+from views.section_renderer import SectionRenderer
+from views.stream_renderer import StreamRenderer
+from views.webhook_server import WebhookServer
 
+logger = logging.getLogger(__name__)
 
 class TelegramView:
     """Представление для взаимодействия с Telegram API."""
 
-    def __init__(self, bot_token: str):
+    def __init__(self, bot_token: str, stream_edit_interval: float = 1.0):
         """Инициализация представления с токеном бота."""
         self.bot = AsyncTeleBot(bot_token)
+        self.stream_edit_interval = stream_edit_interval
         self.controller = None
         self.keyboard_message_id = None
+        # Обновления одного пользователя, включая фильтры по состоянию, обрабатываются по порядку
+        self.mailboxes = UserMailboxes()
+        self._process_new_updates = self.bot.process_new_updates
+        self.bot.process_new_updates = self._process_updates_in_order
         self._setup_handlers()
 
+    @staticmethod
+    def _get_update_user_id(update: types.Update) -> Optional[int]:
+        """Получить идентификатор пользователя, от которого пришло обновление."""
+        for event in (update.message, update.edited_message, update.callback_query):
+            if event is not None and event.from_user is not None:
+                return event.from_user.id
+        return None
+
+    def _submit_updates(self, updates: List[types.Update]) -> List[asyncio.Future]:
+        """Поставить обновления в почтовые ящики пользователей; разные пользователи обрабатываются параллельно."""
+        futures = []
+        for update in updates:
+            user_id = self._get_update_user_id(update)
+            # Обновление без пользователя получает отдельный ящик, чтобы close дождался и его
+            key = user_id if user_id is not None else ('update', update.update_id)
+            futures.append(self.mailboxes.submit(key, lambda update=update: self._process_new_updates([update])))
+        return futures
+
+    @staticmethod
+    def _log_update_error(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Ошибка обработки обновления: %s', future.exception(), exc_info=future.exception())
+
+    async def _process_updates_in_order(self, updates: List[types.Update]) -> None:
+        """Обработать обновления по порядку для каждого пользователя и дождаться завершения."""
+        futures = self._submit_updates(updates)
+        await asyncio.gather(*futures, return_exceptions=True)
+        for future in futures:
+            self._log_update_error(future)
+
+    def dispatch_updates(self, updates: List[types.Update]) -> List[asyncio.Future]:
+        """Поставить обновления в почтовые ящики, не дожидаясь обработки, и вернуть future каждого обновления.
+
+        Ошибки обработки только записываются в лог.
+        """
+        futures = self._submit_updates(updates)
+        for future in futures:
+            future.add_done_callback(self._log_update_error)
+        return futures
+
     def set_controller(self, controller) -> None:
         """Установить контроллер для этого представления."""
         self.controller = controller
 
+    @staticmethod
+    def _timed(handler):
+        """Обернуть обработчик замером длительности с именем обработчика в метке."""
+        name = handler.__name__.removeprefix('_handle_')
+
+        @functools.wraps(handler)
+        async def wrapper(event) -> None:
+            with metrics.span('handler', handler=name):
+                await handler(event)
+        return wrapper
+
     def _setup_handlers(self) -> None:
         """Настроить все обработчики сообщений."""
-        self.bot.message_handler(commands=['start'])(self._handle_start)
-        self.bot.message_handler(commands=['clear'])(self._handle_clear)
-        self.bot.message_handler(commands=['balance'])(self._handle_balance)
-        self.bot.message_handler(commands=['changemodel'])(self._handle_change_model)
-        self.bot.message_handler(commands=['currentmodel'])(self._handle_current_model)
-        self.bot.message_handler(commands=['comment'])(self._handle_comment)
-        self.bot.message_handler(commands=['analyze'])(self._handle_analyze)
-        self.bot.message_handler(commands=['reanalyze'])(self._handle_reanalyze)
+        self.bot.message_handler(commands=['start'])(self._timed(self._handle_start))
+        self.bot.message_handler(commands=['clear'])(self._timed(self._handle_clear))
+        self.bot.message_handler(commands=['balance'])(self._timed(self._handle_balance))
+        self.bot.message_handler(commands=['changemodel'])(self._timed(self._handle_change_model))
+        self.bot.message_handler(commands=['currentmodel'])(self._timed(self._handle_current_model))
+        self.bot.message_handler(commands=['comment'])(self._timed(self._handle_comment))
+        self.bot.message_handler(commands=['analyze'])(self._timed(self._handle_analyze))
+        self.bot.message_handler(commands=['reanalyze'])(self._timed(self._handle_reanalyze))
+        self.bot.message_handler(commands=['switch'])(self._timed(self._handle_switch))
+        self.bot.message_handler(commands=['routing'])(self._timed(self._handle_routing))
+        self.bot.message_handler(commands=['compare'])(self._timed(self._handle_compare))
+        self.bot.message_handler(commands=['panel'])(self._timed(self._handle_panel))
 
         async def param_state_filter(message) -> bool:    
             return await self._is_valid_param_state(message.from_user.id)
@@ -35,8 +106,8 @@ class TelegramView:
             state = await self._get_state(message.from_user.id)
             return state == RuntimeStates.state_dialog
 
-        self.bot.message_handler(func=param_state_filter)(self._handle_params_messages)
-        self.bot.message_handler(func=discusse_state_filter)(self._handle_dialog_message)
+        self.bot.message_handler(func=param_state_filter)(self._timed(self._handle_params_messages))
+        self.bot.message_handler(func=discusse_state_filter)(self._timed(self._handle_dialog_message))
 
         def model_callback_filter(call: types.CallbackQuery) -> bool:
             return (
@@ -46,9 +117,9 @@ class TelegramView:
                 call.data.startswith('back_to_model_name_')
             )
 
-        self.bot.callback_query_handler(func=model_callback_filter)(self._handle_model_callback)
-        self.bot.callback_query_handler(func=lambda call: call.data == 'analyze')(self._handle_analyze_callback)
-        self.bot.callback_query_handler(func=lambda call: True)(self._handle_general_callback)
+        self.bot.callback_query_handler(func=model_callback_filter)(self._timed(self._handle_model_callback))
+        self.bot.callback_query_handler(func=lambda call: call.data == 'analyze')(self._timed(self._handle_analyze_callback))
+        self.bot.callback_query_handler(func=lambda call: True)(self._timed(self._handle_general_callback))
 
     async def _get_state(self, user_id: int) -> RuntimeStates:
         """Получить текущее состояние пользователя."""
@@ -69,17 +140,58 @@ class TelegramView:
         """Запустить бота."""
         await self.bot.polling(none_stop=True)
 
+    async def start_webhook(self, webhook_url: str, secret_token: str, **server_options) -> None:
+        """Запустить бота в режиме webhook со встроенным HTTP сервером."""
+        # Воркеры сервера только раскладывают обновления по ящикам пользователей: долгая обработка
+        # обновлений одного пользователя не занимает воркеры, нужные остальным
+        server = WebhookServer(self.bot, secret_token, dispatch=self.dispatch_updates, **server_options)
+        try:
+            await server.serve_forever(webhook_url)
+        finally:
+            await self.mailboxes.close()
+
+    async def process_update(self, raw_update: dict) -> None:
+        """Обработать обновление, полученное в исходном виде от другого процесса."""
+        await self.bot.process_new_updates([types.Update.de_json(raw_update)])
+
     async def send_message(self, chat_id: int, text: str, reply_markup: types.InlineKeyboardMarkup = None) -> types.Message:
         """Отправить сообщение пользователю."""
-        return await self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+        with metrics.span('telegram_api', method='send_message'):
+            return await self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+
+    async def send_blocks(self, chat_id: int, blocks: List[str]) -> None:
+        """Отправить блоки текста, объединяя их в сообщения не длиннее ограничения Telegram."""
+        limit = SectionRenderer.MAX_MESSAGE_LENGTH
+        chunks = ['']
+        for block in blocks:
+            block = block[:limit]
+            if chunks[-1] and len(chunks[-1]) + len(block) + 2 > limit:
+                chunks.append(block)
+            else:
+                chunks[-1] = f'{chunks[-1]}\n\n{block}' if chunks[-1] else block
+        for chunk in chunks:
+            await self.send_message(chat_id, chunk)
+
+    async def send_stream(self, chat_id: int, chunks: AsyncIterator[str]) -> str:
+        """Отправить ответ, появляющийся по мере генерации, и вернуть его полный текст."""
+        renderer = StreamRenderer(self, chat_id, self.stream_edit_interval)
+        return await renderer.render(chunks)
+
+    async def start_sections(self, chat_id: int, header: str, placeholders: List[str]) -> SectionRenderer:
+        """Отправить заголовок результатов и вернуть объект для дополнения их разделами."""
+        renderer = SectionRenderer(self, chat_id, header, placeholders, self.stream_edit_interval)
+        await renderer.start()
+        return renderer
 
     async def edit_message_reply_markup(self, chat_id: int, message_id: int, reply_markup: types.InlineKeyboardMarkup = None) -> None:
         """Изменить разметку ответа сообщения."""
-        await self.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+        with metrics.span('telegram_api', method='edit_message_reply_markup'):
+            await self.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
 
     async def edit_message_text(self, chat_id: int, message_id: int, text: str, reply_markup: types.InlineKeyboardMarkup = None) -> None:
         """Изменить текст сообщения."""
-        await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=reply_markup)
+        with metrics.span('telegram_api', method='edit_message_text'):
+            await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=reply_markup)
 
     async def send_state_keyboard(self, chat_id: int, user_id: int, state: str) -> None:
         """Отправить клавиатуру для текущего шага."""
@@ -131,6 +243,22 @@ class TelegramView:
         """Обработать команду /reanalyze."""
         await self.controller.handle_reanalyze(message)
 
+    async def _handle_switch(self, message: types.Message) -> None:
+        """Обработать команду /switch."""
+        await self.controller.handle_switch(message)
+
+    async def _handle_routing(self, message: types.Message) -> None:
+        """Обработать команду /routing."""
+        await self.controller.handle_routing(message)
+
+    async def _handle_compare(self, message: types.Message) -> None:
+        """Обработать команду /compare."""
+        await self.controller.handle_compare(message)
+
+    async def _handle_panel(self, message: types.Message) -> None:
+        """Обработать команду /panel."""
+        await self.controller.handle_panel(message)
+
     async def _handle_params_messages(self, message: types.Message) -> None:
         """Обработать сообщения с параметрами."""
         user_id = message.from_user.id
@@ -0,0 +1,158 @@
+import asyncio
+import hmac
+import logging
+from typing import Callable, List, Optional
+
+from aiohttp import web
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """Приём обновлений Telegram через webhook с ограниченной очередью обработки.
+
+    Обновление подтверждается сразу после постановки в очередь, а обработчики бота
+    вызываются фиксированным числом воркеров. При переполнении очереди сервер отвечает 503,
+    и Telegram повторяет доставку позже. Если задан dispatch, воркеры передают ему обновления
+    и не ждут их обработки, но переданных и ещё не обработанных обновлений не больше queue_size:
+    при этом ограничении воркеры ждут, очередь заполняется, и сервер снова отвечает 503.
+    """
+
+    SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+    def __init__(self,
+                 bot: AsyncTeleBot,
+                 secret_token: str,
+                 path: str = '/telegram/webhook',
+                 host: str = '0.0.0.0',
+                 port: int = 8080,
+                 queue_size: int = 1000,
+                 workers: int = 16,
+                 dispatch: Optional[Callable[[List[types.Update]], List[asyncio.Future]]] = None):
+        """Инициализация сервера; секретный токен обязателен."""
+        if not secret_token:
+            raise ValueError('Для приёма обновлений через webhook нужен секретный токен WEBHOOK_SECRET')
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.dispatch = dispatch
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._dispatch_slots = asyncio.Semaphore(queue_size)
+        self.in_flight = 0
+        self.received = 0
+        self.rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def create_app(self) -> web.Application:
+        """Создать приложение aiohttp с маршрутами webhook, проверки состояния и, если включены, метрик."""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get('/healthz', self._handle_health)
+        if metrics.enabled:
+            app.router.add_get('/metrics', metrics.handle)
+        return app
+
+    async def start(self, webhook_url: str = None) -> None:
+        """Запустить воркеры и HTTP сервер; если задан webhook_url, зарегистрировать его в Telegram."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info('Webhook сервер слушает %s:%s%s', self.host, self.port, self.path)
+        if webhook_url:
+            await self.bot.set_webhook(url=webhook_url.rstrip('/') + self.path, secret_token=self.secret_token)
+            logger.info('Webhook зарегистрирован: %s', webhook_url)
+
+    async def serve_forever(self, webhook_url: str = None) -> None:
+        """Запустить сервер и работать до отмены задачи."""
+        await self.start(webhook_url)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Перестать принимать обновления, дообработать очередь и остановить воркеры."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tasks:
+            await self.queue.join()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        """Проверить секретный токен и поставить обновление в очередь, не дожидаясь обработки."""
+        if not hmac.compare_digest(request.headers.get(self.SECRET_HEADER, ''), self.secret_token):
+            logger.warning('Отклонён запрос webhook с неверным секретным токеном от %s', request.remote)
+            return web.Response(status=403)
+        try:
+            accepted = self.enqueue(await request.text())
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning('Некорректное обновление webhook: %s', e)
+            return web.Response(status=400)
+        if not accepted:
+            self.rejected += 1
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        self.received += 1
+        return web.Response()
+
+    def enqueue(self, payload: str) -> bool:
+        """Поставить обновление в очередь обработки; вернуть False, если очередь заполнена."""
+        try:
+            self.queue.put_nowait(types.Update.de_json(payload))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> dict:
+        """Получить глубину очереди и счётчики принятых и отклонённых обновлений."""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'in_flight': self.in_flight,
+            'received': self.received,
+            'rejected': self.rejected,
+        }
+
+    async def _worker(self) -> None:
+        """Передавать обновления из очереди в обработчики бота."""
+        while True:
+            update = await self.queue.get()
+            try:
+                if self.dispatch is not None:
+                    await self._dispatch(update)
+                else:
+                    await self.bot.process_new_updates([update])
+            except Exception:
+                logger.exception('Ошибка обработки обновления %s', update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def _dispatch(self, update: types.Update) -> None:
+        """Передать обновление в dispatch, дождавшись места среди необработанных переданных обновлений."""
+        await self._dispatch_slots.acquire()
+        try:
+            futures = self.dispatch([update])
+        except BaseException:
+            self._dispatch_slots.release()
+            raise
+        self.in_flight += 1
+        asyncio.gather(*futures, return_exceptions=True).add_done_callback(self._release_slot)
+
+    def _release_slot(self, _: asyncio.Future) -> None:
+        self.in_flight -= 1
+        self._dispatch_slots.release()